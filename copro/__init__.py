@@ -2,13 +2,17 @@
 
 from . import selection
 from . import utils
+from . import compute
+from . import forest
 from . import conflict
 from . import variables
 from . import machine_learning
 from . import data
+from . import grid
 from . import pipeline
 from . import evaluation
 from . import models
+from . import sensitivity
 from . import plots
 
 __author__ = """Jannis M. Hoch, Sophie de Bruin, Niko Wanders"""
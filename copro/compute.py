@@ -0,0 +1,141 @@
+import os, sys
+import shutil
+import tempfile
+import numpy as np
+from contextlib import contextmanager
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+def get_core_budget(config):
+    """Determines the total number of cores the model may use, as specified in the [compute] section of the cfg-file.
+    A value of 0 or lower means that all available cores are used. If nothing is specified, only one core is used.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+
+    Returns:
+        int: total number of cores available to the model.
+    """
+
+    n_cores = config.getint('compute', 'n_cores', fallback=1)
+
+    if n_cores <= 0:
+        n_cores = os.cpu_count()
+
+    return n_cores
+
+def get_dtype(config):
+    """Determines the floating point precision of the variable values used for scaling, training, and predicting, as specified in the [compute] section of the cfg-file.
+    Single precision (float32) halves the memory of the feature arrays. Tree-based classifiers use float32 internally anyway, avoiding an extra copy. 
+    If nothing is specified, double precision (float64) is used.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+
+    Raises:
+        ValueError: raised if another precision than float32 or float64 is specified.
+
+    Returns:
+        dtype: numpy dtype of the variable values.
+    """
+
+    dtype = config.get('compute', 'dtype', fallback='float64')
+
+    if dtype not in ['float32', 'float64']:
+        raise ValueError('no supported dtype selected - choose between float32 and float64')
+
+    return np.dtype(dtype)
+
+def schedule(config, n_tasks):
+    """Splits the core budget between concurrently executed tasks (e.g. model repetitions) and threads per task.
+    Concurrent tasks are favoured over threads as they scale better, remaining cores are handed out as threads to each task.
+    Thereby, the product of workers and threads never exceeds the core budget.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        n_tasks (int): number of independent tasks to be executed.
+
+    Returns:
+        int: number of worker processes.
+        int: number of threads per worker.
+    """
+
+    n_cores = get_core_budget(config)
+
+    n_workers = max(1, min(n_tasks, n_cores))
+    n_threads = max(1, n_cores // n_workers)
+
+    if config.getboolean('general', 'verbose'): print('DEBUG: scheduling {} task(s) on {} worker(s) with {} thread(s) each'.format(n_tasks, n_workers, n_threads))
+
+    return n_workers, n_threads
+
+def set_n_jobs(clf, n_threads):
+    """Sets the number of threads of a classifier, if the classifier supports it.
+
+    Args:
+        clf (classifier): the specified model instance.
+        n_threads (int): number of threads to be used by the classifier.
+
+    Returns:
+        classifier: the specified model instance.
+    """
+
+    if 'n_jobs' in clf.get_params():
+        clf.set_params(n_jobs=n_threads)
+
+    return clf
+
+@contextmanager
+def limit_threads(n_threads):
+    """Context manager limiting the number of threads of BLAS and OpenMP libraries used by numpy and scikit-learn.
+    This prevents oversubscription when multiple workers run concurrently.
+    If threadpoolctl is not installed, no limits are applied.
+
+    Args:
+        n_threads (int): maximum number of threads.
+    """
+
+    if threadpool_limits is None:
+        yield
+    else:
+        with threadpool_limits(limits=n_threads):
+            yield
+
+@contextmanager
+def shared_arrays(config, arrays, n_workers):
+    """Context manager placing numeric arrays once in memory-mapped files, such that worker processes attach zero-copy views instead of each receiving a pickled copy.
+    The files are written to a temporary folder, by default in the temporary directory of the system or in the folder specified as temp_dir in the [compute] section of the cfg-file.
+    The folder is removed when leaving the context, also if an error occurred. 
+    Arrays which are not numeric (e.g. containing geometries) or None are returned unchanged, and nothing is shared if only one worker is used.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        arrays (list): arrays to be shared.
+        n_workers (int): number of worker processes.
+
+    Yields:
+        list: read-only memory-mapped views of the numeric arrays, and the other arrays unchanged.
+    """
+
+    if n_workers <= 1:
+        yield list(arrays)
+        return
+
+    temp_dir = tempfile.mkdtemp(prefix='copro_', dir=config.get('compute', 'temp_dir', fallback='') or None)
+    if config.getboolean('general', 'verbose'): print('DEBUG: sharing arrays with workers via folder {}'.format(temp_dir))
+
+    try:
+        views = []
+        for n, arr in enumerate(arrays):
+            if (arr is None) or (np.asarray(arr).dtype == object):
+                views.append(arr)
+            else:
+                fo = os.path.join(temp_dir, 'array_{}.npy'.format(n))
+                np.save(fo, np.asarray(arr))
+                views.append(np.load(fo, mmap_mode='r'))
+        yield views
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -125,16 +125,18 @@ def split_conflict_geom_data(X):
 
     return X_ID, X_geom, X_data
 
-def get_pred_conflict_geometry(X_test_ID, X_test_geom, y_test, y_pred):
+def get_pred_conflict_geometry(X_test_ID, X_test_geom, y_test, y_pred, y_prob=None):
     """Stacks together the arrays with unique identifier, geometry, test data, and predicted data into a dataframe. 
     Contains therefore only the data points used in the test-sample, not in the training-sample. 
     Additionally computes whether a correct prediction was made in column 'correct_pred'.
+    If provided, the probability of conflict is stored in column 'y_prob'.
 
     Args:
         X_test_ID (list): list containing the unique identifier per data point.
         X_test_geom (list): list containing the geometry per data point.
         y_test (list): list containing test-data.
         y_pred (list): list containing predictions.
+        y_prob (list, optional): list containing the predicted probability of conflict. Defaults to None.
 
     Returns:
         dataframe: dataframe with each input list as column plus computed 'correct_pred'.
@@ -146,4 +148,7 @@ def get_pred_conflict_geometry(X_test_ID, X_test_geom, y_test, y_pred):
 
     df['correct_pred'] = np.where(df['y_test'] == df['y_pred'], 1, 0)
 
+    if y_prob is not None:
+        df['y_prob'] = np.asarray(y_prob, dtype=float)
+
     return df
\ No newline at end of file
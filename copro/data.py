@@ -1,8 +1,9 @@
-from copro import conflict, variables
+from copro import conflict, variables, machine_learning, compute
 import numpy as np
 import xarray as xr
 import pandas as pd
 import os, sys
+import zipfile
 
 
 def initiate_XY_data(config):
@@ -50,7 +51,7 @@ def initiate_X_data(config):
 
     return X
 
-def fill_XY(XY, config, root_dir, conflict_gdf, polygon_gdf):
+def fill_XY(XY, config, root_dir, conflict_gdf, polygon_gdf, sim_years=None, polygon_cells=None):
     """Fills the XY-dictionary with data for each variable and conflict for each polygon for each simulation year. 
     The number of rows should therefore equal to number simulation years times number of polygons.
     At end of last simulation year, the dictionary is converted to a numpy-array.
@@ -61,6 +62,8 @@ def fill_XY(XY, config, root_dir, conflict_gdf, polygon_gdf):
         root_dir (str): path to location of cfg-file.
         conflict_gdf (geo-dataframe): geo-dataframe containing the selected conflicts.
         polygon_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
+        sim_years (list, optional): simulation years to be read. If None, all years of the period specified in the cfg-file are read. Defaults to None.
+        polygon_cells (dict, optional): cache with the cells per set of polygons and raster grid, see 'variables.get_polygon_cells()'. If None, a cache is used for this call only. Defaults to None.
 
     Raises:
         Warning: a warning is raised if the datetime-format of the netCDF-file does not match conventions and/or supported formats.
@@ -69,10 +72,18 @@ def fill_XY(XY, config, root_dir, conflict_gdf, polygon_gdf):
         array: filled array containing the variable values (X) and binary conflict data (Y) plus meta-data.
     """    
 
-    print('INFO: reading data for period from', str(config.getint('settings', 'y_start')), 'to', str(config.getint('settings', 'y_end')))
+    # go through all simulation years as specified in config-file, unless specified otherwise
+    if sim_years is None:
+        model_period = np.arange(config.getint('settings', 'y_start'), config.getint('settings', 'y_end') + 1, 1)
+    else:
+        model_period = np.asarray(sim_years)
+
+    #- the raster cells per polygon are computed only once for all variables and years with the same grid
+    if polygon_cells is None:
+        polygon_cells = {}
+
+    print('INFO: reading data for period from', str(model_period[0]), 'to', str(model_period[-1]))
 
-    # go through all simulation years as specified in config-file
-    model_period = np.arange(config.getint('settings', 'y_start'), config.getint('settings', 'y_end') + 1, 1)
     for sim_year in model_period:
 
         print('INFO: entering year {}'.format(sim_year))
@@ -107,13 +118,13 @@ def fill_XY(XY, config, root_dir, conflict_gdf, polygon_gdf):
                 
                 if (np.dtype(nc_ds.time) == np.float32) or (np.dtype(nc_ds.time) == np.float64):
                     data_series = value
-                    data_list = variables.nc_with_float_timestamp(polygon_gdf, config, root_dir, key, sim_year)
+                    data_list = variables.nc_with_float_timestamp(polygon_gdf, config, root_dir, key, sim_year, polygon_cells=polygon_cells)
                     data_series = data_series.append(pd.Series(data_list), ignore_index=True)
                     XY[key] = data_series
                     
                 elif np.dtype(nc_ds.time) == 'datetime64[ns]':
                     data_series = value
-                    data_list = variables.nc_with_continous_datetime_timestamp(polygon_gdf, config, root_dir, key, sim_year)
+                    data_list = variables.nc_with_continous_datetime_timestamp(polygon_gdf, config, root_dir, key, sim_year, polygon_cells=polygon_cells)
                     data_series = data_series.append(pd.Series(data_list), ignore_index=True)
                     XY[key] = data_series
                     
@@ -124,23 +135,43 @@ def fill_XY(XY, config, root_dir, conflict_gdf, polygon_gdf):
     
     return pd.DataFrame.from_dict(XY).to_numpy()
 
-def split_XY_data(XY, config):
+def split_XY_data(XY, config, return_years=False):
     """Separates the XY-array into array containing information about variable values (X-array) and conflict data (Y-array).
     Thereby, the X-array also contains the information about unique identifier and polygon geometry.
+    Data points with missing values are dropped, unless the specified model handles missing values natively.
+    Optionally, the simulation year of each data point is returned too. 
+    This relies on the XY-array containing the same number of polygons for each simulation year, as created by 'data.fill_XY()'.
 
     Args:
         XY (array): array containing variable values and conflict data.
         config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        return_years (bool, optional): whether or not to return the simulation year of each data point. Defaults to False.
+
+    Raises:
+        ValueError: raised if the number of data points is not a multiple of the number of simulation years.
 
     Returns:
-        arrays: two separate arrays, the X-array and Y-array
+        arrays: two separate arrays, the X-array and Y-array, plus the array with simulation years if specified.
     """    
 
     XY = pd.DataFrame(XY)
     if config.getboolean('general', 'verbose'): print('DEBUG: number of data points including missing values:', len(XY))
 
-    XY = XY.dropna()
-    if config.getboolean('general', 'verbose'): print('DEBUG: number of data points excluding missing values:', len(XY))
+    n_rows = len(XY)
+
+    if machine_learning.supports_missing_values(config):
+        if config.getboolean('general', 'verbose'): print('DEBUG: keeping data points with missing values as model handles them natively')
+        XY = XY.dropna(subset=[XY.columns[-1]])
+    else:
+        XY = XY.dropna()
+        if config.getboolean('general', 'verbose'): print('DEBUG: number of data points excluding missing values:', len(XY))
+
+    ##- the rows of each simulation year are stacked, hence the year can be derived from the original row index
+    if return_years:
+        n_years = config.getint('settings', 'y_end') - config.getint('settings', 'y_start') + 1
+        if n_rows % n_years != 0:
+            raise ValueError('the number of data points {} is not a multiple of the number of simulation years {}'.format(n_rows, n_years))
+        years = config.getint('settings', 'y_start') + XY.index.to_numpy() // (n_rows // n_years)
 
     XY = XY.to_numpy()
     X = XY[:, :-1] # since conflict is the last column, we know that all previous columns must be variable values
@@ -151,4 +182,93 @@ def split_XY_data(XY, config):
         fraction_Y_1 = 100*len(np.where(Y != 0)[0])/len(Y)
         print('DEBUG: a fraction of {} percent in the data corresponds to conflicts.'.format(round(fraction_Y_1, 2)))
 
-    return X, Y
\ No newline at end of file
+    if return_years:
+        return X, Y, years
+
+    return X, Y
+
+def fill_XY_memmap(config, root_dir, conflict_gdf, polygon_gdf, fo):
+    """Fills an on-disk array with the variable values (X) and binary conflict data (Y) for each polygon for each simulation year, reading one simulation year at a time.
+    In contrast to 'data.fill_XY()', only the numeric values are stored and no meta-data, such that the array can be memory-mapped. 
+    Thereby, the XY-data never needs to fit in memory at once. As in the XY-array, conflict data is stored in the last column.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        root_dir (str): path to location of cfg-file.
+        conflict_gdf (geo-dataframe): geo-dataframe containing the selected conflicts.
+        polygon_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
+        fo (str): path to the npy-file to be written.
+
+    Returns:
+        memmap: memory-mapped array containing the variable values and binary conflict data.
+    """    
+
+    model_period = np.arange(config.getint('settings', 'y_start'), config.getint('settings', 'y_end') + 1, 1)
+    n_polys = len(polygon_gdf)
+
+    XY = np.lib.format.open_memmap(fo, mode='w+', dtype=compute.get_dtype(config), shape=(n_polys * len(model_period), len(config.items('data')) + 1))
+
+    polygon_cells = {}
+    for n, sim_year in enumerate(model_period):
+
+        XY_year = fill_XY(initiate_XY_data(config), config, root_dir, conflict_gdf, polygon_gdf, sim_years=[sim_year], polygon_cells=polygon_cells)
+        #- the first two columns contain the meta-data
+        XY[n * n_polys:(n + 1) * n_polys] = XY_year[:, 2:].astype(XY.dtype)
+        XY.flush()
+
+    return XY
+
+def iter_XY_batches(XY, batch_size, random_state=None):
+    """Iterates over an (on-disk) XY-array in batches of consecutive data points, such that only one batch is held in memory at a time.
+    If a random state is provided, the order of the batches is shuffled.
+
+    Args:
+        XY (array): array containing variable values and conflict data, e.g. as memory-mapped by 'data.fill_XY_memmap()'.
+        batch_size (int): number of data points per batch.
+        random_state (int or Generator, optional): seed or random generator used to shuffle the order of batches. Defaults to None.
+
+    Yields:
+        int: index of the first data point of the batch.
+        array: variable values and conflict data of the batch.
+    """    
+
+    starts = np.arange(0, len(XY), batch_size)
+
+    if random_state is not None:
+        starts = np.random.default_rng(random_state).permutation(starts)
+
+    for start in starts:
+        yield start, np.asarray(XY[start:start + batch_size])
+
+def save_X_year(X, fo, sim_year):
+    """Appends the X-array of one simulation year to a npz-file, in which each simulation year is stored as separate member.
+    As the members can be read independently, the X-data of one year can be loaded without loading the entire file, see 'data.load_X_year()'.
+
+    Args:
+        X (array): X-array of one simulation year, containing unique identifier, geometry, and variable values.
+        fo (str): path to npz-file.
+        sim_year (int): simulation year.
+    """    
+
+    with zipfile.ZipFile(fo, mode='a') as zf:
+        with zf.open('{}.npy'.format(sim_year), 'w') as f:
+            np.lib.format.write_array(f, np.asarray(X), allow_pickle=True)
+
+def load_X_year(fo, sim_year):
+    """Loads the X-array of one simulation year from a npz-file written with 'data.save_X_year()'.
+
+    Args:
+        fo (str): path to npz-file.
+        sim_year (int): simulation year.
+
+    Raises:
+        ValueError: raised if the simulation year is not contained in the file.
+
+    Returns:
+        array: X-array of this simulation year.
+    """    
+
+    with np.load(fo, allow_pickle=True) as npz:
+        if str(sim_year) not in npz.files:
+            raise ValueError('ERROR: simulation year {} is not contained in X-file {}'.format(sim_year, fo))
+        return npz[str(sim_year)]
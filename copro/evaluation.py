@@ -1,6 +1,7 @@
 import os, sys
 import click
 from sklearn import metrics
+from scipy import stats
 import pandas as pd
 import geopandas as gpd
 import numpy as np
@@ -77,6 +78,115 @@ def fill_out_dict(out_dict, eval_dict):
 
     return out_dict
 
+def init_streaming_metrics(n_bins=1000):
+    """Initiates the counts needed to compute the evaluation metrics of 'evaluation.evaluate_prediction()' batch by batch, 
+    without keeping the test-data of all batches in memory.
+    Besides the confusion matrix and the summed Brier loss, histograms of the predicted probabilities of conflict and non-conflict data points are kept.
+
+    Args:
+        n_bins (int, optional): number of probability bins of the histograms. Defaults to 1000.
+
+    Returns:
+        dict: dictionary with zero counts.
+    """    
+
+    return {'TP': 0, 'FP': 0, 'TN': 0, 'FN': 0, 'brier': 0., 
+            'hist_1': np.zeros(n_bins, dtype=np.int64), 'hist_0': np.zeros(n_bins, dtype=np.int64)}
+
+def update_streaming_metrics(counts, y_test, y_pred, y_prob):
+    """Adds the test-data and predictions of one batch to the counts, see 'evaluation.init_streaming_metrics()'.
+
+    Args:
+        counts (dict): counts of all previous batches.
+        y_test (array): conflict data of the test-data of this batch.
+        y_pred (array): predictions of this batch.
+        y_prob (array): probabilities of predictions of this batch.
+
+    Returns:
+        dict: updated counts.
+    """    
+
+    y_test, y_pred = np.asarray(y_test).astype(bool), np.asarray(y_pred).astype(bool)
+
+    counts['TP'] += int(np.sum(y_test & y_pred))
+    counts['FP'] += int(np.sum(~y_test & y_pred))
+    counts['TN'] += int(np.sum(~y_test & ~y_pred))
+    counts['FN'] += int(np.sum(y_test & ~y_pred))
+    counts['brier'] += float(np.sum((y_prob[:, 1] - y_test) ** 2))
+
+    n_bins = len(counts['hist_1'])
+    bins = np.minimum((y_prob[:, 1] * n_bins).astype(int), n_bins - 1)
+    counts['hist_1'] += np.bincount(bins[y_test], minlength=n_bins)
+    counts['hist_0'] += np.bincount(bins[~y_test], minlength=n_bins)
+
+    return counts
+
+def evaluate_streaming_metrics(counts):
+    """Computes the evaluation metrics of 'evaluation.evaluate_prediction()' from the counts of all batches.
+    The ROC AUC score is computed from the histograms of the predicted probabilities and hence only exact up to the width of the probability bins.
+
+    Args:
+        counts (dict): counts of all batches, see 'evaluation.update_streaming_metrics()'.
+
+    Returns:
+        dict: dictionary with scores for this simulation.
+    """    
+
+    TP, FP, TN, FN = counts['TP'], counts['FP'], counts['TN'], counts['FN']
+    n = TP + FP + TN + FN
+
+    precision = TP / (TP + FP) if (TP + FP) > 0 else 0.
+    recall = TP / (TP + FN) if (TP + FN) > 0 else 0.
+    p_o = (TP + TN) / n
+    p_e = ((TP + FP) * (TP + FN) + (TN + FN) * (TN + FP)) / n ** 2
+
+    ##- true and false positive rates for thresholds from the highest to the lowest probability bin
+    tpr = np.append(0, np.cumsum(counts['hist_1'][::-1]) / max(TP + FN, 1))
+    fpr = np.append(0, np.cumsum(counts['hist_0'][::-1]) / max(TN + FP, 1))
+
+    eval_dict = {'Accuracy': p_o,
+                 'Precision': precision,
+                 'Recall': recall,
+                 'F1 score': 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0.,
+                 'Cohen-Kappa score': (p_o - p_e) / (1 - p_e) if p_e < 1 else 0.,
+                 'Brier loss score': counts['brier'] / n,
+                 'ROC AUC score': float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)),
+                }
+
+    return eval_dict
+
+def get_confidence_intervals(results, z=1.96):
+    """Determines the half-width of the confidence interval of the mean of each evaluation metric, and of the chance of conflict per polygon, given the repetitions made so far.
+    For the metrics, the interval is based on their standard error across repetitions. 
+    For the chance of conflict, the interval is based on the binomial standard error per polygon given its number of predictions, 
+    and the 95th percentile over all polygons with at least two predictions is used, such that a few rarely sampled polygons do not dominate.
+
+    Args:
+        results (list): list with a tuple of test-data X-array values, model output on polygon-basis, and evaluation metrics per repetition.
+        z (float, optional): quantile of the standard normal distribution corresponding to the confidence level. Defaults to 1.96, i.e. 95 percent.
+
+    Returns:
+        dict: half-width of the confidence interval per evaluation metric and for the chance of conflict.
+    """    
+
+    ci_dict = {}
+
+    for metric in init_out_dict().keys():
+        values = np.array([eval_dict[metric] for X_df, y_df, eval_dict in results], dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) < 2:
+            ci_dict[metric] = np.inf
+        else:
+            ci_dict[metric] = z * np.std(values, ddof=1) / np.sqrt(len(values))
+
+    y_df = pd.concat([y_df[['ID', 'y_pred']] for X_df, y_df, eval_dict in results], ignore_index=True)
+    n = y_df.ID.groupby(y_df.ID).size()
+    p = y_df.y_pred.astype(int).groupby(y_df.ID).sum() / n
+    half_width = z * np.sqrt(p * (1 - p) / n[n > 1])
+    ci_dict['chance_of_conflict'] = np.percentile(half_width.dropna(), 95) if half_width.notna().any() else np.inf
+
+    return ci_dict
+
 def init_out_df():
     """Initiates and empty main output dataframe.
 
@@ -101,6 +211,77 @@ def fill_out_df(out_df, y_df):
 
     return out_df
 
+def init_proj_count():
+    """Initiates an empty dataframe to count the projections made per polygon.
+
+    Returns:
+        dataframe: empty dataframe with number of predictions, predicted conflicts, and sum of conflict probabilities and their spread as columns.
+    """    
+
+    return pd.DataFrame(columns=['nr_predictions', 'nr_predicted_conflicts', 'sum_y_prob', 'sum_y_prob_std'], dtype=float)
+
+def fill_proj_count(count_df, y_df):
+    """Adds the projections of one chunk, e.g. one year, to the counts per polygon. 
+    Contrary to 'evaluation.fill_out_df()', the size of the resulting dataframe does not grow with the number of chunks.
+
+    Args:
+        count_df (dataframe): counts per polygon of all previous chunks.
+        y_df (dataframe): output dataframe of one chunk.
+
+    Returns:
+        dataframe: counts per polygon including the chunk.
+    """    
+
+    chunk_count = pd.DataFrame({'nr_predictions': y_df.ID.groupby(y_df.ID).size(),
+                                'nr_predicted_conflicts': y_df.y_pred.astype(int).groupby(y_df.ID).sum(),
+                                'sum_y_prob': y_df.y_prob.groupby(y_df.ID).sum()})
+
+    #- spread of the conflict probability is only available for ensemble projections
+    if 'y_prob_std' in y_df.columns:
+        chunk_count['sum_y_prob_std'] = y_df.y_prob_std.groupby(y_df.ID).sum()
+
+    count_df = count_df.add(chunk_count, fill_value=0)
+
+    return count_df
+
+def polygon_projection(count_df, global_df, out_dir):
+    """Determines the chance of conflict and mean probability of conflict for each polygon from the counts of a (streamed) projection.
+    The output per polygon corresponds to the output of 'evaluation.polygon_model_accuracy()' in case of a projection, plus the mean probability of conflict and, for ensemble projections, its mean spread.
+
+    Args:
+        count_df (dataframe): counts per polygon, see 'evaluation.fill_proj_count()'.
+        global_df (dataframe): global look-up dataframe to associate unique identifier with geometry.
+        out_dir (str): path to output folder. If 'None', no output is stored.
+
+    Returns:
+        (geo-)dataframe: dataframe and geo-dataframe with data per polygon.
+    """    
+
+    df_temp = count_df.astype({'nr_predictions': int, 'nr_predicted_conflicts': int})
+    df_temp.index.name = 'ID'
+
+    #- compute chance of conflict by dividing number of predicted conflicts with number of all predictions
+    df_temp['chance_of_conflict'] = df_temp.nr_predicted_conflicts / df_temp.nr_predictions
+    
+    #- compute mean probability of conflict over all predictions
+    df_temp['mean_prob'] = df_temp.sum_y_prob / df_temp.nr_predictions
+
+    #- compute mean spread of probability of conflict over all predictions, only for ensemble projections
+    if df_temp.sum_y_prob_std.notna().any():
+        df_temp['std_prob'] = df_temp.sum_y_prob_std / df_temp.nr_predictions
+    df_temp = df_temp.drop(['sum_y_prob', 'sum_y_prob_std'], axis=1).reset_index()
+
+    #- merge with global dataframe containing IDs and geometry
+    df_hit = pd.merge(df_temp, global_df, on='ID', how='left')
+
+    #- convert to geodataframe
+    gdf_hit = gpd.GeoDataFrame(df_hit, geometry=df_hit.geometry)
+
+    if (out_dir != None) and isinstance(out_dir, str):
+        gdf_hit.to_file(os.path.join(out_dir, 'output_per_polygon.shp'), crs='EPSG:4326')
+
+    return df_hit, gdf_hit
+
 def polygon_model_accuracy(df, global_df, out_dir, make_proj=False):
     """Determines a range of model accuracy values for each polygon.
     Reduces dataframe with results from each simulation to values per unique polygon identifier.
@@ -136,6 +317,10 @@ def polygon_model_accuracy(df, global_df, out_dir, make_proj=False):
     #- per polygon ID, compute sum of all conflict data points and add to dataframe
     df_count['nr_predicted_conflicts'] = df.y_pred.groupby(df.ID).sum()
 
+    #- per polygon ID, compute mean probability of conflict and, for ensemble projections, its mean spread
+    if make_proj and ('y_prob' in df.columns): df_count['mean_prob'] = df.y_prob.groupby(df.ID).mean()
+    if make_proj and ('y_prob_std' in df.columns): df_count['std_prob'] = df.y_prob_std.groupby(df.ID).mean()
+
     #- merge the two dataframes with ID as key
     df_temp = pd.merge(ID_count, df_count, on='ID')
 
@@ -301,32 +486,163 @@ def calc_kFold_polygon_analysis(y_df, global_df, out_dir, k=10):
 
     return gdf
 
-def get_feature_importance(clf, config, out_dir):
-    """Determines relative importance of each feature (i.e. variable) used. Must be used after model/classifier is fit.
+def permutation_importance(clf, X_test, y_test, n_repeats=5, random_state=None):
+    """Determines the permutation importance of each feature (i.e. variable) of a fitted classifier with its test-data, as the decrease of the ROC AUC score if the values of this feature are randomly permuted.
+    Thereby, the classifier does not need to be fitted again, and any classifier predicting probabilities is supported.
+    Per feature, all repeats are stacked into one array and predicted at once.
+
+    Args:
+        clf (classifier): fitted sklearn-classifier.
+        X_test (array): scaled variable values of the test-data.
+        y_test (array): conflict data of the test-data.
+        n_repeats (int, optional): number of random permutations per feature. Defaults to 5.
+        random_state (int, optional): seed used to permute the variable values. Defaults to None.
+
+    Returns:
+        array: decrease of the ROC AUC score per feature (rows) and repeat (columns).
+    """ 
+
+    X_test, y_test = np.asarray(X_test, dtype=float), np.asarray(y_test).astype(int)
+    n_test, n_features = X_test.shape
+    rng = np.random.default_rng(random_state)
+
+    score = metrics.roc_auc_score(y_test, clf.predict_proba(X_test)[:, 1])
+
+    arr = np.zeros((n_features, n_repeats))
+    for j in range(n_features):
+        X_perm = np.tile(X_test, (n_repeats, 1))
+        X_perm[:, j] = np.concatenate([X_test[rng.permutation(n_test), j] for n in range(n_repeats)])
+        y_prob = clf.predict_proba(X_perm)[:, 1].reshape(n_repeats, n_test)
+        arr[j] = [score - metrics.roc_auc_score(y_test, y_prob[n]) for n in range(n_repeats)]
+
+    return arr
+
+def get_feature_importance(importances, config, out_dir):
+    """Aggregates the relative importance of each feature (i.e. variable) across all repetitions and permutations.
+    The importances are determined per repetition (or fold) with its classifier and test-data, see 'evaluation.permutation_importance()' and 'pipeline.run_reference_n_times()'.
     Returns dataframe and saves it to csv too.
 
     Args:
-        clf (classifier): sklearn-classifier used in the simulation.
+        importances (array): feature importance per repetition, feature, and permutation.
         config (ConfigParser-object): object containing the parsed configuration-settings of the model.
         out_dir (str): path to output folder. If 'None', no output is stored.
 
+    Raises:
+        ValueError: raised if the number of features does not match the number of variables in the cfg-file.
+
     Returns:
-        dataframe: dataframe containing feature importance.
+        dataframe: dataframe containing mean and standard deviation of the feature importance per variable.
     """ 
 
-    if config.get('machine_learning', 'model') == 'RFClassifier':
-        arr = clf.feature_importances_
-    else:
-        arr = np.zeros(len(config.items('data')))
-        raise Warning('WARNING: feature importance not supported for this kind of ML model')
+    features = [key for key, value in config.items('data')]
 
-    dict_out = dict()
-    for key, x in zip(config.items('data'), range(len(arr))):
-        dict_out[key[0]] = arr[x]
+    importances = np.asarray(importances)
+    if importances.shape[1] != len(features):
+        raise ValueError('ERROR: the feature importances contain {} variables, but {} variables are specified in the cfg-file'.format(importances.shape[1], len(features)))
 
-    df = pd.DataFrame.from_dict(dict_out, orient='index', columns=['feature_importance'])
+    df = pd.DataFrame({'feature_importance': importances.mean(axis=(0, 2)), 'std': importances.std(axis=(0, 2))}, index=features)
 
     if (out_dir != None) and isinstance(out_dir, str):
         df.to_csv(os.path.join(out_dir, 'feature_importances.csv'))
 
-    return df
\ No newline at end of file
+    return df
+
+def expected_random_metrics(y_test, y_pred, y_prob):
+    """Computes the expected evaluation metrics if the test-data was randomly reshuffled, i.e. if there was no relation between predictions and conflict.
+    As reshuffling keeps the number of conflicts and predicted conflicts fixed, the expected values follow in closed form and no model needs to be fitted.
+    The scores match the scores of 'evaluation.evaluate_prediction()'.
+
+    Args:
+        y_test (list): list containing test-sample conflict data.
+        y_pred (list): list containing predictions.
+        y_prob (array): array containing the predicted probability of conflict.
+
+    Returns:
+        dict: dictionary with expected scores.
+    """    
+
+    y_test, y_pred = np.asarray(y_test).astype(int), np.asarray(y_pred).astype(int)
+    y_prob = np.asarray(y_prob, dtype=float)
+    if y_prob.ndim == 2:
+        y_prob = y_prob[:, 1]
+
+    #- fraction of conflicts (p) and predicted conflicts (q)
+    p, q = y_test.mean(), y_pred.mean()
+
+    eval_dict = {'Accuracy': p * q + (1 - p) * (1 - q),
+                 'Precision': p if q > 0 else 0.,
+                 'Recall': q if p > 0 else 0.,
+                 'F1 score': 2 * p * q / (p + q) if (p + q) > 0 else 0.,
+                 'Cohen-Kappa score': 0.,
+                 'Brier loss score': np.mean(y_prob ** 2) - 2 * p * np.mean(y_prob) + p,
+                 'ROC AUC score': 0.5,
+                }
+
+    return eval_dict
+
+def significance_test(y_test, y_pred, y_prob):
+    """Tests whether the predictions are significantly better than predictions without any relation to conflict, i.e. than with randomly reshuffled test-data.
+    With the number of conflicts and predicted conflicts being fixed, all metrics based on the predictions increase with the number of true positives, which follows a hypergeometric distribution.
+    The ROC AUC score is tested with the normal approximation of the Mann-Whitney U statistic, corrected for ties.
+    Both are one-sided tests and do not require any model to be fitted.
+
+    Args:
+        y_test (list): list containing test-sample conflict data.
+        y_pred (list): list containing predictions.
+        y_prob (array): array containing the predicted probability of conflict.
+
+    Returns:
+        dict: dictionary with the p-value of the predictions and of the ROC AUC score.
+    """    
+
+    y_test, y_pred = np.asarray(y_test).astype(int), np.asarray(y_pred).astype(int)
+    y_prob = np.asarray(y_prob, dtype=float)
+    if y_prob.ndim == 2:
+        y_prob = y_prob[:, 1]
+
+    n, n_1 = len(y_test), y_test.sum()
+    n_0 = n - n_1
+
+    #- probability of at least as many true positives by chance
+    tp = np.sum((y_test == 1) & (y_pred == 1))
+    p_pred = stats.hypergeom.sf(tp - 1, n, n_1, y_pred.sum())
+
+    #- variance of the ROC AUC score under the null hypothesis, with correction for tied probabilities
+    if (n_1 > 0) and (n_0 > 0):
+        ties = np.unique(y_prob, return_counts=True)[1].astype(float)
+        var = ((n + 1) - np.sum(ties ** 3 - ties) / (n * (n - 1))) / (12 * n_1 * n_0)
+        auc = metrics.roc_auc_score(y_test, y_prob)
+        p_auc = stats.norm.sf((auc - 0.5) / np.sqrt(var)) if var > 0 else 1.
+    else:
+        p_auc = np.nan
+
+    return {'p-value predictions': float(p_pred), 'p-value ROC AUC': float(p_auc)}
+
+def evaluate_significance(results, out_dir):
+    """Determines per repetition the expected evaluation metrics of a random baseline and whether the model is significantly better than this baseline.
+    See 'evaluation.expected_random_metrics()' and 'evaluation.significance_test()'.
+    Returns dataframe and saves it to csv too.
+
+    Args:
+        results (list): list with a tuple of test-data X-array values, model output on polygon-basis, and evaluation metrics per repetition.
+        out_dir (str): path to output folder. If 'None', no output is stored.
+
+    Returns:
+        dataframe: dataframe containing the expected metrics of the random baseline and the p-values per repetition.
+    """    
+
+    rows = []
+    for X_df, y_df, eval_dict in results:
+        row = {'{} (expected)'.format(key): value for key, value in expected_random_metrics(y_df.y_test, y_df.y_pred, y_df.y_prob).items()}
+        row.update(significance_test(y_df.y_test, y_df.y_pred, y_df.y_prob))
+        rows.append(row)
+
+    df = pd.DataFrame(rows)
+    df.index.name = 'run'
+
+    print('INFO: largest p-value of all runs is {0:0.3g} for the predictions and {1:0.3g} for the ROC AUC score'.format(df['p-value predictions'].max(), df['p-value ROC AUC'].max()))
+
+    if (out_dir != None) and isinstance(out_dir, str):
+        df.to_csv(os.path.join(out_dir, 'significance.csv'))
+
+    return df
@@ -0,0 +1,144 @@
+import numpy as np
+from sklearn import ensemble
+
+def compile_forest(clf):
+    """Flattens the trees of a fitted random forest classifier into contiguous node arrays.
+    The nodes of all trees are concatenated, and the nodes of each tree are found between two subsequent entries of the bounds.
+    Children are stored per node as pair (left, right) of indices within the tree, leaves point to themselves.
+    Thresholds are rounded down to single precision, such that comparisons with single precision variable values give the same result as in scikit-learn.
+    The resulting dictionary only contains numpy arrays and can thus be stored and memory-mapped with joblib.
+
+    Args:
+        clf (classifier): the fitted random forest classifier.
+
+    Raises:
+        ValueError: raised if the classifier is not a fitted random forest classifier.
+
+    Returns:
+        dict: compiled forest containing node arrays (feature, threshold, children, is_leaf, value), the bounds of each tree, and the classes.
+    """
+
+    if not (isinstance(clf, ensemble.RandomForestClassifier) and hasattr(clf, 'estimators_')):
+        raise ValueError('ERROR: only fitted random forest classifiers can be compiled')
+
+    n_classes = clf.n_classes_
+
+    feature, threshold, children, is_leaf, value = [], [], [], [], []
+    bounds = [0]
+
+    for estimator in clf.estimators_:
+
+        tree = estimator.tree_
+        node_ids = np.arange(tree.node_count)
+        leaf = tree.children_left == -1
+
+        feature.append(np.where(leaf, 0, tree.feature))
+        threshold.append(tree.threshold)
+        children.append(np.column_stack((np.where(leaf, node_ids, tree.children_left),
+                                         np.where(leaf, node_ids, tree.children_right))).ravel())
+        is_leaf.append(leaf)
+
+        ##- same normalization of leaf values as in DecisionTreeClassifier.predict_proba()
+        proba = tree.value[:, 0, :n_classes]
+        normalizer = proba.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value.append(proba / normalizer)
+
+        bounds.append(bounds[-1] + tree.node_count)
+
+    ##- x <= t holds for a single precision x if and only if x <= t', with t' the largest single precision value not larger than t
+    threshold = np.concatenate(threshold)
+    threshold_32 = threshold.astype(np.float32)
+    rounded_up = threshold_32 > threshold
+    threshold_32[rounded_up] = np.nextafter(threshold_32[rounded_up], np.float32(-np.inf))
+
+    forest = {'feature': np.concatenate(feature).astype(np.int32),
+              'threshold': threshold_32,
+              'children': np.concatenate(children).astype(np.int32),
+              'is_leaf': np.concatenate(is_leaf),
+              'value': np.concatenate(value).astype(np.float64),
+              'bounds': np.asarray(bounds, dtype=np.int64),
+              'classes': np.asarray(clf.classes_)}
+
+    return forest
+
+def apply_tree(forest, X, n_tree):
+    """Determines the leaf reached by each sample in one tree of a compiled forest.
+    All samples are moved down the tree level by level, and samples having reached a leaf are removed from the active set.
+
+    Args:
+        forest (dict): compiled forest, see 'forest.compile_forest()'.
+        X (array): array containing the variable values in single precision.
+        n_tree (int): number of the tree.
+
+    Returns:
+        array: leaf index within the tree per sample.
+    """
+
+    start, end = forest['bounds'][n_tree], forest['bounds'][n_tree+1]
+    feature, threshold = forest['feature'][start:end], forest['threshold'][start:end]
+    children, is_leaf = forest['children'][2*start:2*end], forest['is_leaf'][start:end]
+
+    n_samples, n_features = X.shape
+    X_flat = X.ravel()
+
+    leaf = np.empty(n_samples, dtype=np.int32)
+    active = np.arange(n_samples)
+    offset = active * n_features
+    node = np.zeros(n_samples, dtype=np.int32)
+
+    while True:
+        reached = is_leaf[node]
+        if reached.any():
+            leaf[active[reached]] = node[reached]
+            keep = ~reached
+            active, offset, node = active[keep], offset[keep], node[keep]
+            if len(active) == 0:
+                break
+        go_right = X_flat[offset + feature[node]] > threshold[node]
+        node = children[2*node + go_right]
+
+    return leaf
+
+def predict_proba(forest, X):
+    """Predicts the probability per class with a compiled forest.
+    The probabilities are accumulated in the order of the trees, which gives the same results as the original random forest classifier executed with one job.
+
+    Args:
+        forest (dict): compiled forest, see 'forest.compile_forest()'.
+        X (array): array containing the scaled variable values.
+
+    Returns:
+        array: probabilities per class.
+    """
+
+    ##- as in scikit-learn, variable values are compared in single precision
+    X = np.ascontiguousarray(X, dtype=np.float32)
+
+    bounds, value = forest['bounds'], forest['value']
+    n_trees = len(bounds) - 1
+
+    y_prob = np.zeros((len(X), value.shape[1]))
+
+    for n_tree in range(n_trees):
+        leaf = apply_tree(forest, X, n_tree)
+        y_prob += value[bounds[n_tree] + leaf]
+
+    y_prob /= n_trees
+
+    return y_prob
+
+def predict(forest, X):
+    """Predicts the class with a compiled forest, i.e. the class with the highest mean probability across all trees.
+
+    Args:
+        forest (dict): compiled forest, see 'forest.compile_forest()'.
+        X (array): array containing the scaled variable values.
+
+    Returns:
+        array: predicted classes.
+    """
+
+    y_prob = predict_proba(forest, X)
+
+    return forest['classes'].take(np.argmax(y_prob, axis=1), axis=0)
@@ -0,0 +1,299 @@
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import rasterio as rio
+from rasterio import features
+from copro import machine_learning, compute
+
+def get_grid(config, root_dir):
+    """Derives the raster grid used in gridded mode from the netCDF-file of the first variable specified in the cfg-file.
+    All other variables must be provided on the same grid.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        root_dir (str): path to location of cfg-file.
+
+    Raises:
+        ValueError: raised if the grid has less than two cells in latitude or longitude direction.
+
+    Returns:
+        dict: cell centres in latitude and longitude direction, names of these dimensions, number of cells per dimension, and affine transformation of the grid.
+    """
+
+    var_name = config.items('data')[0][0]
+    with xr.open_dataset(os.path.join(root_dir, config.get('general', 'input_dir'), config.get('data', var_name))) as nc_ds:
+        lat_dim, lon_dim = nc_ds[var_name].dims[-2:]
+        lat, lon = nc_ds[lat_dim].values, nc_ds[lon_dim].values
+    if (len(lat) < 2) or (len(lon) < 2):
+        raise ValueError('ERROR: the grid of {} needs at least two cells in each direction'.format(var_name))
+
+    ##- the grid is assumed to be regular, with cell centres as coordinates
+    d_lat, d_lon = lat[1] - lat[0], lon[1] - lon[0]
+    affine = rio.Affine(d_lon, 0, lon[0] - d_lon / 2, 0, d_lat, lat[0] - d_lat / 2)
+
+    if config.getboolean('general', 'verbose'): print('DEBUG: grid with {} by {} cells derived from {}'.format(len(lat), len(lon), var_name))
+
+    return {'lat': lat, 'lon': lon, 'lat_dim': lat_dim, 'lon_dim': lon_dim, 'shape': (len(lat), len(lon)), 'affine': affine}
+
+def get_grid_cells(extent_gdf, grid):
+    """Determines the cells of the grid of which the center lies within one of the polygons, i.e. the cells used in gridded mode.
+
+    Args:
+        extent_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
+        grid (dict): raster grid, see 'grid.get_grid()'.
+
+    Returns:
+        array: sorted flat indices of the cells.
+    """
+
+    mask = features.geometry_mask(extent_gdf.geometry, out_shape=grid['shape'], transform=grid['affine'], invert=True)
+
+    return np.flatnonzero(mask)
+
+def get_time_index(nc_ds, sim_year, nc_fo):
+    """Determines the index of a simulation year along the time dimension of a netCDF-file with annual data.
+    Both integer (year-)values and datetime values are supported as time variable.
+
+    Args:
+        nc_ds (dataset): netCDF-file opened with xarray.
+        sim_year (int): simulation year.
+        nc_fo (str): path to netCDF-file.
+
+    Raises:
+        Warning: raised if the time variable has a non-supported dtype.
+        ValueError: raised if the simulation year is not contained in the netCDF-file.
+
+    Returns:
+        int: index of the simulation year.
+    """
+
+    if (np.dtype(nc_ds.time) == np.float32) or (np.dtype(nc_ds.time) == np.float64):
+        years = nc_ds.time.values.astype(int)
+    elif np.dtype(nc_ds.time) == 'datetime64[ns]':
+        years = pd.to_datetime(nc_ds.time.values).year.to_numpy()
+    else:
+        raise Warning('WARNING: this nc-file does have a different dtype for the time variable than currently supported: {}'.format(nc_fo))
+
+    if sim_year not in years:
+        raise ValueError('the simulation year {0} can not be found in file {1}'.format(sim_year, nc_fo))
+
+    return int(np.where(years == sim_year)[0][0])
+
+def conflict_grid(conflict_gdf, grid, sim_year):
+    """Bins the conflicts of one year onto the grid with a two-dimensional histogram, without any spatial join.
+
+    Args:
+        conflict_gdf (geo-dataframe): geo-dataframe containing the selected conflicts.
+        grid (dict): raster grid, see 'grid.get_grid()'.
+        sim_year (int): simulation year.
+
+    Returns:
+        array: boolean array with the shape of the grid, True if at least one conflict took place in a cell.
+    """
+
+    temp_sel_year = conflict_gdf.loc[conflict_gdf.year == sim_year]
+
+    lat_edges = grid['affine'].f + grid['affine'].e * np.arange(grid['shape'][0] + 1)
+    lon_edges = grid['affine'].c + grid['affine'].a * np.arange(grid['shape'][1] + 1)
+
+    ##- histogram bins must be increasing, hence descending coordinates are flipped back afterwards
+    counts, _, _ = np.histogram2d(temp_sel_year.geometry.y, temp_sel_year.geometry.x, bins=[np.sort(lat_edges), np.sort(lon_edges)])
+    if grid['affine'].e < 0:
+        counts = counts[::-1]
+    if grid['affine'].a < 0:
+        counts = counts[:, ::-1]
+
+    return counts > 0
+
+def iter_grid_year(config, root_dir, grid, cells, sim_year, conflict_gdf=None):
+    """Reads the variable values of the selected cells for one year in chunks of grid rows, such that never more than about batch_size cells are held in memory.
+    Per chunk, only the corresponding rows are read from the netCDF-files, which are closed once all chunks are read.
+    If the conflicts are provided, the binary conflict data per cell is added as last column.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        root_dir (str): path to location of cfg-file.
+        grid (dict): raster grid, see 'grid.get_grid()'.
+        cells (array): sorted flat indices of the selected cells, see 'grid.get_grid_cells()'.
+        sim_year (int): simulation year.
+        conflict_gdf (geo-dataframe, optional): geo-dataframe containing the selected conflicts. Defaults to None.
+
+    Raises:
+        ValueError: raised if a variable is not provided on the grid.
+
+    Yields:
+        array: flat indices of the cells of the chunk.
+        array: variable values (and conflict data) with one row per cell of the chunk.
+    """
+
+    n_lat, n_lon = grid['shape']
+    n_rows = max(1, config.getint('settings', 'batch_size', fallback=100000) // n_lon)
+    dtype = compute.get_dtype(config)
+
+    nc_dss, nc_vars = [], []
+    try:
+        for key, value in config.items('data'):
+            nc_fo = os.path.join(root_dir, config.get('general', 'input_dir'), value)
+            nc_ds = xr.open_dataset(nc_fo)
+            nc_dss.append(nc_ds)
+            if nc_ds[key].shape[-2:] != grid['shape']:
+                raise ValueError('ERROR: variable {} is not provided on the grid of {} by {} cells'.format(key, n_lat, n_lon))
+            nc_vars.append(nc_ds[key].isel(time=get_time_index(nc_ds, sim_year, nc_fo)))
+
+        if conflict_gdf is not None:
+            conflict_arr = conflict_grid(conflict_gdf, grid, sim_year).ravel()
+
+        for row_0 in range(0, n_lat, n_rows):
+
+            row_1 = min(row_0 + n_rows, n_lat)
+            cells_chunk = cells[np.searchsorted(cells, row_0 * n_lon):np.searchsorted(cells, row_1 * n_lon)]
+            if len(cells_chunk) == 0:
+                continue
+
+            cols = [nc_var.isel({grid['lat_dim']: slice(row_0, row_1)}).values.ravel()[cells_chunk - row_0 * n_lon] for nc_var in nc_vars]
+            if conflict_gdf is not None:
+                cols.append(conflict_arr[cells_chunk])
+
+            yield cells_chunk, np.column_stack(cols).astype(dtype)
+
+    finally:
+        for nc_ds in nc_dss:
+            nc_ds.close()
+
+def fill_XY_grid(config, root_dir, conflict_gdf, extent_gdf, fo):
+    """Fills an on-disk array with the variable values (X) and binary conflict data (Y) for each cell within the polygons for each simulation year.
+    In contrast to 'data.fill_XY()', no zonal statistics are computed: each cell-year is one data point.
+    The rows of each simulation year are stacked, and within one year the cells are ordered as returned by 'grid.get_grid_cells()'.
+    As with 'data.fill_XY_memmap()', the array can be memory-mapped for out-of-core training.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        root_dir (str): path to location of cfg-file.
+        conflict_gdf (geo-dataframe): geo-dataframe containing the selected conflicts.
+        extent_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
+        fo (str): path to the npy-file to be written.
+
+    Returns:
+        memmap: memory-mapped array containing the variable values and binary conflict data.
+    """
+
+    grid = get_grid(config, root_dir)
+    cells = get_grid_cells(extent_gdf, grid)
+    model_period = np.arange(config.getint('settings', 'y_start'), config.getint('settings', 'y_end') + 1, 1)
+
+    print('INFO: reading data for {} cells for period from {} to {}'.format(len(cells), model_period[0], model_period[-1]))
+    XY = np.lib.format.open_memmap(fo, mode='w+', dtype=compute.get_dtype(config), shape=(len(cells) * len(model_period), len(config.items('data')) + 1))
+
+    for n, sim_year in enumerate(model_period):
+
+        print('INFO: entering year {}'.format(sim_year))
+
+        start = n * len(cells)
+        for cells_chunk, XY_chunk in iter_grid_year(config, root_dir, grid, cells, sim_year, conflict_gdf=conflict_gdf):
+            XY[start:start + len(XY_chunk)] = XY_chunk
+            start += len(XY_chunk)
+        XY.flush()
+
+    print('INFO: all data read')
+
+    return XY
+
+def iter_XY_grid(config, XY, cells, n_years):
+    """Reads the XY-data written by 'grid.fill_XY_grid()' in batches of at most batch_size cells of one year.
+    As the rows are stacked per year in the order of the cells, the cells of each batch follow from its position in the array.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        XY (array): (memory-mapped) array containing the variable values and binary conflict data.
+        cells (array): sorted flat indices of the selected cells, see 'grid.get_grid_cells()'.
+        n_years (int): number of simulation years.
+
+    Raises:
+        ValueError: raised if the number of rows does not match the number of cells and years.
+
+    Yields:
+        int: index of the simulation year.
+        array: flat indices of the cells of the batch.
+        array: variable values and conflict data with one row per cell of the batch.
+    """
+
+    if len(XY) != len(cells) * n_years:
+        raise ValueError('ERROR: XY-data with {} rows does not match {} cells for {} years'.format(len(XY), len(cells), n_years))
+
+    batch_size = config.getint('settings', 'batch_size', fallback=100000)
+
+    for i in range(n_years):
+        for start in range(0, len(cells), batch_size):
+            stop = min(start + batch_size, len(cells))
+            yield i, cells[start:stop], np.asarray(XY[i * len(cells) + start:i * len(cells) + stop])
+
+def predict_grid(config, root_dir, extent_gdf, scaler, clf, out_dir, negative_fraction=None, conflict_gdf=None, XY=None):
+    """Predicts conflict and the probability of conflict for each cell within the polygons for each simulation year, processing the cells in chunks.
+    If the XY-data of the same period is provided, e.g. in the reference run, it is read in batches from this (memory-mapped) array, see 'grid.iter_XY_grid()'.
+    Otherwise, the variable values are read from the netCDF-files, see 'grid.iter_grid_year()'.
+    The results are stored as rasters to ``output_per_cell.nc`` in the output folder, with missing values outside the polygons and for cells with missing variable values.
+    If the XY-data or the conflicts are provided, the observed conflict per cell is stored too.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        root_dir (str): path to location of cfg-file.
+        extent_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
+        scaler (scaler): the fitted scaling method instance.
+        clf (classifier): the fitted model instance.
+        out_dir (str): path to output folder.
+        negative_fraction (float, optional): fraction of non-conflict data points kept for training, see 'machine_learning.correct_probabilities()'. If None, it is read from the cfg-file. Defaults to None.
+        conflict_gdf (geo-dataframe, optional): geo-dataframe containing the selected conflicts. Ignored if XY is provided. Defaults to None.
+        XY (array, optional): XY-data of the simulation period as written by 'grid.fill_XY_grid()'. Defaults to None.
+
+    Returns:
+        dataset: predictions and probabilities of conflict (plus observed conflict) per year and cell.
+    """
+
+    grid = get_grid(config, root_dir)
+    cells = get_grid_cells(extent_gdf, grid)
+    model_period = np.arange(config.getint('settings', 'y_start'), config.getint('settings', 'y_end') + 1, 1)
+    n_vars = len(config.items('data'))
+    dtype = compute.get_dtype(config)
+
+    if XY is not None:
+        chunks = iter_XY_grid(config, XY, cells, len(model_period))
+    else:
+        chunks = ((i, cells_chunk, XY_chunk) for i, sim_year in enumerate(model_period)
+                  for cells_chunk, XY_chunk in iter_grid_year(config, root_dir, grid, cells, sim_year, conflict_gdf=conflict_gdf))
+    observed = (XY is not None) or (conflict_gdf is not None)
+
+    out_shape = (len(model_period), grid['shape'][0] * grid['shape'][1])
+    y_pred, y_prob = np.full(out_shape, np.nan, dtype=np.float32), np.full(out_shape, np.nan, dtype=np.float32)
+    if observed:
+        y_obs = np.full(out_shape, np.nan, dtype=np.float32)
+
+    print('INFO: making predictions for {} cells for period from {} to {}'.format(len(cells), model_period[0], model_period[-1]))
+
+    for i, cells_chunk, XY_chunk in chunks:
+
+        if observed:
+            y_obs[i, cells_chunk] = XY_chunk[:, -1]
+
+        X_chunk = XY_chunk[:, :n_vars]
+        valid = ~np.isnan(X_chunk).any(axis=1)
+        if not valid.any():
+            continue
+
+        X_ft = scaler.transform(X_chunk[valid]).astype(dtype, copy=False)
+        y_pred_chunk, y_prob_chunk = machine_learning.correct_prediction(clf.predict(X_ft), clf.predict_proba(X_ft), config, negative_fraction=negative_fraction)
+        y_pred[i, cells_chunk[valid]] = y_pred_chunk
+        y_prob[i, cells_chunk[valid]] = y_prob_chunk[:, 1]
+
+    dims = ('time', grid['lat_dim'], grid['lon_dim'])
+    out_shape = (len(model_period),) + grid['shape']
+    ds = xr.Dataset({'y_pred': (dims, y_pred.reshape(out_shape)), 'y_prob': (dims, y_prob.reshape(out_shape))},
+                    coords={'time': model_period, grid['lat_dim']: grid['lat'], grid['lon_dim']: grid['lon']})
+    if observed:
+        ds['conflict'] = (dims, y_obs.reshape(out_shape))
+
+    fo = os.path.join(out_dir, 'output_per_cell.nc')
+    print('INFO: saving output per cell to file {}'.format(fo))
+    ds.to_netcdf(fo)
+
+    return ds
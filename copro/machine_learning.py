@@ -1,9 +1,35 @@
 import os
-import pickle
+import ast
+import hashlib
+import warnings
+import joblib
 import pandas as pd
 import numpy as np
-from sklearn import svm, neighbors, ensemble, preprocessing, model_selection, metrics
-from copro import conflict, data
+import sklearn
+from sklearn import svm, neighbors, ensemble, preprocessing, model_selection, metrics, kernel_approximation, calibration, linear_model
+from sklearn.pipeline import make_pipeline
+from sklearn.utils.class_weight import compute_sample_weight
+from copro import conflict, data, compute, forest
+
+try:
+    from sklearn.ensemble import HistGradientBoostingClassifier
+except ImportError:
+    #- scikit-learn versions lower than 1.0 require explicitly enabling the estimator
+    from sklearn.experimental import enable_hist_gradient_boosting
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+try:
+    from sklearn.experimental import enable_halving_search_cv
+    from sklearn.model_selection import HalvingGridSearchCV
+except ImportError:
+    #- successive halving is only available from scikit-learn 0.24 onwards
+    HalvingGridSearchCV = None
+
+#- the logistic loss of SGDClassifier is called 'log' in scikit-learn versions lower than 1.1
+SGD_LOG_LOSS = 'log_loss' if tuple(int(v) for v in sklearn.__version__.split('.')[:2]) >= (1, 1) else 'log'
+
+#- version of the model bundle layout, to be increased whenever the content of the bundle changes
+BUNDLE_VERSION = 2
 
 def define_scaling(config):
     """Defines scaling method based on model configurations.
@@ -33,18 +59,40 @@ def define_scaling(config):
 
     return scaler
 
+def parse_parameter_value(value):
+    """Converts a parameter value specified in the cfg-file to the corresponding python type.
+    Values which cannot be evaluated as python literal (e.g. 'rbf') are returned as string.
+
+    Args:
+        value (str): parameter value as specified in the cfg-file.
+
+    Returns:
+        int, float, bool, None, or str: parsed parameter value.
+    """    
+
+    try:
+        return ast.literal_eval(value.strip())
+    except (ValueError, SyntaxError):
+        return value.strip()
+
 def define_model(config):
     """Defines model based on model configurations. Model parameter were optimized beforehand using GridSearchCV.
+    Parameters specified in the optional [model_parameters] section of the cfg-file (e.g. resulting from 'machine_learning.tune_model()') overrule these defaults.
 
     Args:
         config (ConfigParser-object): object containing the parsed configuration-settings of the model.
 
     Raises:
         ValueError: raised if a non-supported model is specified.
+        ValueError: raised if a compiled forest is specified for another model than RFClassifier.
 
     Returns:
         classifier: the specified model instance.
     """    
+
+    ##- checked here, such that the run fails before fitting instead of when the fitted classifier is stored
+    if config.getboolean('compute', 'compile_forest', fallback=False) and (config.get('machine_learning', 'model') != 'RFClassifier'):
+        raise ValueError('ERROR: compile_forest is only supported for RFClassifier, not for {}'.format(config.get('machine_learning', 'model')))
     
     if config.get('machine_learning', 'model') == 'NuSVC':
         clf = svm.NuSVC(nu=0.1, kernel='rbf', class_weight={1: 100}, probability=True, degree=10, gamma=10, random_state=42)
@@ -52,23 +100,110 @@ def define_model(config):
         clf = neighbors.KNeighborsClassifier(n_neighbors=10, weights='distance')
     elif config.get('machine_learning', 'model') == 'RFClassifier':
         clf = ensemble.RandomForestClassifier(n_estimators=1000, class_weight={1: 100}, random_state=42)
+    elif config.get('machine_learning', 'model') == 'HistGradientBoostingClassifier':
+        clf = HistGradientBoostingClassifier(max_iter=200, random_state=42)
+    elif config.get('machine_learning', 'model') == 'NystroemSVC':
+        #- approximates the kernel of NuSVC with an explicit feature map, followed by a linear SVM (trained with SGD) calibrated with Platt scaling
+        clf = make_pipeline(kernel_approximation.Nystroem(kernel='rbf', gamma=10, n_components=300, random_state=42),
+                            calibration.CalibratedClassifierCV(linear_model.SGDClassifier(loss='hinge', class_weight={1: 100}, random_state=42), method='sigmoid', cv=3))
+    elif config.get('machine_learning', 'model') == 'SGDClassifier':
+        #- logistic regression trained with SGD, which can be fitted incrementally in out-of-core mode
+        clf = linear_model.SGDClassifier(loss=SGD_LOG_LOSS, class_weight={1: 100}, random_state=42)
     else:
-        raise ValueError('no supported ML model selected - choose between NuSVC, KNeighborsClassifier or RFClassifier')
+        raise ValueError('no supported ML model selected - choose between NuSVC, KNeighborsClassifier, RFClassifier, HistGradientBoostingClassifier, NystroemSVC or SGDClassifier')
+
+    if config.has_section('model_parameters'):
+        clf.set_params(**{key: parse_parameter_value(value) for key, value in config.items('model_parameters')})
 
     if config.getboolean('general', 'verbose'): print('DEBUG: chosen ML model is {}'.format(clf))
 
     return clf
 
-def split_scale_train_test_split(X, Y, config, scaler):
+def supports_missing_values(config):
+    """Determines whether the specified model can handle missing variable values natively.
+    If so, data points with missing values do not need to be dropped.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+
+    Returns:
+        bool: True if the model handles missing values natively.
+    """    
+
+    return config.get('machine_learning', 'model', fallback='') == 'HistGradientBoostingClassifier'
+
+def fit_clf(clf, X, Y):
+    """Fits the classifier. 
+    Classifiers without a class_weight parameter (i.e. HistGradientBoostingClassifier) are weighted with sample weights instead, 
+    such that conflict data points receive the same weight as in the RFClassifier.
+
+    Args:
+        clf (classifier): the specified model instance.
+        X (array): scaled variable values.
+        Y (array): conflict data.
+
+    Returns:
+        classifier: the fitted model instance.
+    """    
+
+    clf.fit(X, Y, **get_fit_params(clf, Y))
+
+    return clf
+
+def get_fit_params(clf, Y):
+    """Determines the additional parameters needed to fit the classifier, i.e. sample weights for classifiers without a class_weight parameter.
+
+    Args:
+        clf (classifier): the specified model instance.
+        Y (array): conflict data.
+
+    Returns:
+        dict: keyword arguments to be passed to the fit method of the classifier.
+    """    
+
+    if isinstance(clf, HistGradientBoostingClassifier):
+        return {'sample_weight': compute_sample_weight({1: 100}, Y)}
+
+    return {}
+
+def scale_X(X, config, scaler):
+    """Fits the scaler to the variable values of the X-array and transforms them.
+    As the scaler is fitted to all data, this only needs to be done once per reference run. 
+    The resulting array can then be re-used in all model repetitions, and the fitted scaler can be re-used for projections.
+
+    Args:
+        X (array): array containing the variable values plus unique identifer and geometry information.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        scaler (scaler): the specified scaling method instance.
+
+    Returns:
+        array: array containing the scaled variable values with the precision specified in the cfg-file, without unique identifier and geometry information.
+    """    
+
+    X_ID, X_geom, X_data = conflict.split_conflict_geom_data(X)
+
+    ##- variable values are copied from the object-array into one contiguous array of the specified precision
+    dtype = compute.get_dtype(config)
+    X_data = np.ascontiguousarray(X_data, dtype=dtype)
+
+    if config.getboolean('general', 'verbose'): print('DEBUG: fitting and transforming X with dtype {}'.format(dtype))
+    X_ft = scaler.fit_transform(X_data).astype(dtype, copy=False)
+
+    return X_ft
+
+def split_scale_train_test_split(X, Y, config, scaler, random_state=None, X_ft=None):
     """Splits and transforms the X-array and Y-array in test-data and training-data.
     The fraction of data used to split the data is specified in the configuration file.
     Additionally, the unique identifier and geometry of each data point in both test-data and training-data is retrieved in separate arrays.
+    If the scaled variable values are provided, they are indexed directly instead of fitting the scaler again.
 
     Args:
         X (array): array containing the variable values plus unique identifer and geometry information.
         Y (array): array containing merely the binary conflict classifier data.
         config (ConfigParser-object): object containing the parsed configuration-settings of the model.
         scaler (scaler): the specified scaling method instance.
+        random_state (int, optional): seed used to split the data. Defaults to None.
+        X_ft (array, optional): pre-computed scaled variable values of X, see 'machine_learning.scale_X()'. Defaults to None.
 
     Raises:
         AssertionError: raised if after all manipulations the number of unique identifiers does not match number of data points in test-data.
@@ -81,21 +216,21 @@ def split_scale_train_test_split(X, Y, config, scaler):
     ##- separate arrays for geomety and variable values
     X_ID, X_geom, X_data = conflict.split_conflict_geom_data(X)
 
-    if config.getboolean('general', 'verbose'): print('DEBUG: fitting and transforming X')
-    ##- scaling only the variable values
-    X_ft = scaler.fit_transform(X_data)
-
-    ##- combining geometry and scaled variable values
-    X_cs = np.column_stack((X_ID, X_geom, X_ft))
+    ##- scaling only the variable values, unless already done
+    if X_ft is None:
+        X_ft = scale_X(X, config, scaler)
 
     if config.getboolean('general', 'verbose'): print('DEBUG: splitting both X and Y in train and test data')
-    ##- splitting in train and test samples
-    X_train, X_test, y_train, y_test = model_selection.train_test_split(X_cs,
-                                                                        Y,
-                                                                        test_size=1-config.getfloat('machine_learning', 'train_fraction'))    
+    ##- splitting the indices in train and test samples
+    idx_train, idx_test = model_selection.train_test_split(np.arange(len(X_ft)),
+                                                           test_size=1-config.getfloat('machine_learning', 'train_fraction'),
+                                                           random_state=random_state)
 
-    X_train_ID, X_train_geom, X_train = conflict.split_conflict_geom_data(X_train)
-    X_test_ID, X_test_geom, X_test = conflict.split_conflict_geom_data(X_test)
+    Y = np.asarray(Y)
+    X_train, X_test = X_ft[idx_train], X_ft[idx_test]
+    y_train, y_test = Y[idx_train], Y[idx_test]
+    X_train_ID, X_test_ID = X_ID[idx_train], X_ID[idx_test]
+    X_train_geom, X_test_geom = X_geom[idx_train], X_geom[idx_test]
 
     if not len(X_test_ID) == len(X_test):
         raise AssertionError('lenght X_test_ID does not match lenght X_test - {} vs {}'.format(len(X_test_ID), len(X_test)))
@@ -105,37 +240,279 @@ def split_scale_train_test_split(X, Y, config, scaler):
 
     return X_train, X_test, y_train, y_test, X_train_geom, X_test_geom, X_train_ID, X_test_ID
 
-def fit_predict(X_train, y_train, X_test, clf, config, pickle_dump=True):
+def undersample(X_train, y_train, config, random_state=None):
+    """Randomly keeps only a fraction of the non-conflict data points for training, as specified in the cfg-file.
+    As conflict data points are a small minority, this reduces the training cost roughly in proportion to the kept fraction without losing much information.
+    All conflict data points are kept.
+
+    Args:
+        X_train (array): training-data of variable values.
+        y_train (array): training-data of conflict data.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        random_state (int, optional): seed used to draw the non-conflict data points. Defaults to None.
+
+    Raises:
+        ValueError: raised if the specified fraction is not larger than 0 and at most 1.
+
+    Returns:
+        arrays: training-data of variable values and conflict data after undersampling.
+    """    
+
+    negative_fraction = config.getfloat('machine_learning', 'negative_fraction', fallback=1.)
+
+    if not 0 < negative_fraction <= 1:
+        raise ValueError('ERROR: negative_fraction must be larger than 0 and at most 1, currently it is {}'.format(negative_fraction))
+
+    if negative_fraction == 1:
+        return X_train, y_train
+
+    y_train = np.asarray(y_train)
+    rng = np.random.default_rng(random_state)
+    keep = (y_train != 0) | (rng.random(len(y_train)) < negative_fraction)
+
+    if config.getboolean('general', 'verbose'): print('DEBUG: keeping {} of {} data points for training after undersampling'.format(np.sum(keep), len(keep)))
+
+    return X_train[keep], y_train[keep]
+
+def correct_probabilities(y_prob, config, negative_fraction=None):
+    """Corrects the predicted probabilities for the undersampling of non-conflict data points, such that they are comparable to probabilities predicted by a classifier trained with all data points.
+    With the fraction of non-conflict data points kept beta, the probability of conflict p_s is corrected to beta * p_s / (beta * p_s - p_s + 1).
+
+    Args:
+        y_prob (array): probabilities per class predicted by the classifier trained with undersampled data.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        negative_fraction (float, optional): fraction of non-conflict data points kept for training. If None, it is read from the cfg-file. Defaults to None.
+
+    Returns:
+        array: corrected probabilities per class.
+    """    
+
+    if negative_fraction is None:
+        beta = config.getfloat('machine_learning', 'negative_fraction', fallback=1.)
+    else:
+        beta = negative_fraction
+
+    if beta == 1:
+        return y_prob
+
+    p_s = y_prob[:, 1]
+    p = np.clip(beta * p_s / (beta * p_s - p_s + 1), 0, 1)
+
+    return np.column_stack((1 - p, p))
+
+def correct_prediction(y_pred, y_prob, config, negative_fraction=None):
+    """Corrects the predicted probabilities for the undersampling of non-conflict data points, see 'machine_learning.correct_probabilities()'.
+    If undersampling was applied, the predictions are derived from the corrected probabilities too, such that all metrics describe the same classifier.
+
+    Args:
+        y_pred (array): predictions of the classifier trained with undersampled data.
+        y_prob (array): probabilities per class predicted by the classifier trained with undersampled data.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        negative_fraction (float, optional): fraction of non-conflict data points kept for training. If None, it is read from the cfg-file. Defaults to None.
+
+    Returns:
+        arrays: corrected predictions and probabilities per class.
+    """    
+
+    if negative_fraction is None:
+        negative_fraction = config.getfloat('machine_learning', 'negative_fraction', fallback=1.)
+
+    y_prob = correct_probabilities(y_prob, config, negative_fraction=negative_fraction)
+
+    if negative_fraction < 1:
+        y_pred = (y_prob[:, 1] > 0.5).astype(int)
+
+    return y_pred, y_prob
+
+def fit_predict(X_train, y_train, X_test, clf, config, pickle_dump=True, random_state=None):
     """Fits the classifier based on training-data and makes predictions.
     Additionally, the prediction probability is determined.
+    If specified in the cfg-file, the non-conflict data points are undersampled before fitting and the predictions are corrected accordingly, see 'machine_learning.correct_prediction()'.
 
     Args:
         X_train (array): training-data of variable values
         y_train ([type]): training-data of conflict data
         X_test ([type]): test-data of variable values
         clf (classifier): the specified model instance.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        random_state (int, optional): seed used for undersampling. Defaults to None.
 
     Returns:
         arrays: arrays including the predictions made and their probabilities
     """    
 
-    clf.fit(X_train, y_train)
+    X_train, y_train = undersample(X_train, y_train, config, random_state=random_state)
 
-    y_pred = clf.predict(X_test)
+    clf = fit_clf(clf, X_train, y_train)
 
-    y_prob = clf.predict_proba(X_test)
+    y_pred, y_prob = correct_prediction(clf.predict(X_test), clf.predict_proba(X_test), config)
 
     return y_pred, y_prob
 
-def pickle_clf(scaler, clf, config, root_dir):
-    """(Re)fits a classifier with all available data and pickles it.
-    Can then be used to make projections in conjuction with projected values.
+def split_batch(start, batch, config, run_seed):
+    """Splits a batch of an on-disk XY-array in training-data and test-data, see 'data.iter_XY_batches()'.
+    Each data point is assigned by a random draw seeded with the seed of the repetition and the position of the batch. 
+    Thereby, the assignment is identical in every pass over the data, regardless of the order in which the batches are read.
+    Data points with missing values are dropped afterwards.
 
     Args:
+        start (int): index of the first data point of the batch.
+        batch (array): variable values and conflict data of the batch.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        run_seed (int): seed of this model repetition.
+
+    Returns:
+        arrays: training-data and test-data of the batch, with conflict data in the last column.
+    """    
+
+    is_test = np.random.default_rng([run_seed, start]).random(len(batch)) >= config.getfloat('machine_learning', 'train_fraction')
+
+    batch = np.column_stack((batch, is_test))
+    batch = batch[~np.isnan(batch).any(axis=1)]
+    is_test = batch[:, -1].astype(bool)
+
+    return batch[~is_test, :-1], batch[is_test, :-1]
+
+def partial_fit_scaler(XY, config, scaler):
+    """Fits the scaler to the variable values of an on-disk XY-array in one streaming pass over batches of data points. 
+    Data points with missing values are skipped.
+    Only scalers which can be fitted incrementally are supported, i.e. MinMaxScaler and StandardScaler.
+
+    Args:
+        XY (array): array containing variable values and conflict data, e.g. as memory-mapped by 'data.fill_XY_memmap()'.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
         scaler (scaler): the specified scaling method instance.
+
+    Raises:
+        ValueError: raised if the scaler cannot be fitted incrementally.
+
+    Returns:
+        scaler: the fitted scaling method instance.
+    """    
+
+    if not hasattr(scaler, 'partial_fit'):
+        raise ValueError('ERROR: out-of-core training requires a scaler which can be fitted incrementally - choose between MinMaxScaler or StandardScaler')
+
+    print('INFO: fitting scaler in batches of {} data points'.format(config.getint('settings', 'batch_size', fallback=100000)))
+    for start, batch in data.iter_XY_batches(XY, config.getint('settings', 'batch_size', fallback=100000)):
+        batch = batch[~np.isnan(batch).any(axis=1)]
+        if len(batch) > 0:
+            scaler.partial_fit(batch[:, :-1])
+
+    return scaler
+
+def partial_fit_clf(XY, config, scaler, clf, run_seed=None):
+    """Fits the classifier incrementally with shuffled minibatches of an on-disk XY-array, such that the XY-data never needs to fit in memory at once.
+    In each of n_epochs passes over the data, both the order of the batches and the order of the data points within each batch are shuffled.
+    If a seed is provided, only the training-data of this repetition is used, see 'machine_learning.split_batch()'. Otherwise, all data points are used.
+    If specified in the cfg-file, the non-conflict data points are undersampled per batch.
+
+    Args:
+        XY (array): array containing variable values and conflict data, e.g. as memory-mapped by 'data.fill_XY_memmap()'.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        scaler (scaler): the fitted scaling method instance.
+        clf (classifier): the specified model instance.
+        run_seed (int, optional): seed of this model repetition. Defaults to None.
+
+    Raises:
+        ValueError: raised if the classifier cannot be fitted incrementally.
+
+    Returns:
+        classifier: the fitted model instance.
+    """    
+
+    if not hasattr(clf, 'partial_fit'):
+        raise ValueError('ERROR: out-of-core training requires a model which can be fitted incrementally - choose SGDClassifier')
+
+    batch_size = config.getint('settings', 'batch_size', fallback=100000)
+    dtype = compute.get_dtype(config)
+    rng = np.random.default_rng(42 if run_seed is None else run_seed)
+
+    for epoch in range(config.getint('settings', 'n_epochs', fallback=5)):
+
+        if config.getboolean('general', 'verbose'): print('DEBUG: epoch {}'.format(epoch + 1))
+
+        for start, batch in data.iter_XY_batches(XY, batch_size, random_state=rng):
+
+            if run_seed is None:
+                batch_train = batch[~np.isnan(batch).any(axis=1)]
+            else:
+                batch_train, batch_test = split_batch(start, batch, config, run_seed)
+            batch_train = batch_train[rng.permutation(len(batch_train))]
+
+            X_train = scaler.transform(batch_train[:, :-1]).astype(dtype, copy=False)
+            X_train, y_train = undersample(X_train, batch_train[:, -1].astype(int), config, random_state=rng)
+
+            if len(y_train) > 0:
+                clf.partial_fit(X_train, y_train, classes=np.array([0, 1]))
+
+    return clf
+
+def tune_model(X_ft, Y, config, clf, out_dir):
+    """Searches the best parameters of the classifier with a successive halving grid search.
+    The candidate values per parameter are specified in the [tuning] section of the cfg-file as comma-separated lists.
+    All candidates are first evaluated with a small share of the data, and only the best candidates are evaluated with increasingly more data.
+    The candidates are evaluated in parallel with the core budget specified in the cfg-file.
+    The best parameters are stored as cfg-snippet which can be copied into the cfg-file, where they overrule the default parameters of the classifier.
+
+    Args:
+        X_ft (array): scaled variable values.
+        Y (array): conflict data.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        clf (classifier): the specified model instance.
+        out_dir (str): path to output folder.
+
+    Raises:
+        ImportError: raised if the installed scikit-learn version does not support successive halving.
+        ValueError: raised if no search space is specified in the cfg-file.
+
+    Returns:
+        dict: best parameters found.
+    """    
+
+    if HalvingGridSearchCV is None:
+        raise ImportError('ERROR: tuning requires scikit-learn version 0.24 or higher')
+
+    if not config.has_section('tuning'):
+        raise ValueError('ERROR: no search space specified in [tuning] section of cfg-file')
+
+    param_grid = {key: [parse_parameter_value(value) for value in values.rsplit(',')] for key, values in config.items('tuning')}
+    print('INFO: tuning classifier with search space {}'.format(param_grid))
+
+    search = HalvingGridSearchCV(clf, param_grid, factor=3, scoring='roc_auc', 
+                                 cv=model_selection.StratifiedKFold(n_splits=3, shuffle=True, random_state=42), 
+                                 n_jobs=compute.get_core_budget(config), random_state=42)
+    search.fit(X_ft, Y, **get_fit_params(clf, Y))
+
+    print('INFO: best parameters are {} with ROC AUC score {:0.3f}'.format(search.best_params_, search.best_score_))
+
+    fo = os.path.join(out_dir, 'best_parameters.cfg')
+    print('INFO: saving best parameters to {}'.format(fo))
+    with open(fo, 'w') as f:
+        f.write('[model_parameters]\n')
+        for key, value in search.best_params_.items():
+            f.write('{}={}\n'.format(key, repr(value)))
+
+    pd.DataFrame(search.cv_results_).to_csv(os.path.join(out_dir, 'tuning_results.csv'))
+
+    return search.best_params_
+
+def pickle_clf(scaler, clf, config, root_dir, X_ft=None, Y=None):
+    """(Re)fits a classifier with all available data and stores it together with the fitted scaler as model bundle.
+    Can then be used to make projections in conjuction with projected values.
+    By default, the already scaled variable values and conflict data of the reference run are used. 
+    Only if they are not provided, the XY-data is loaded from the pre-computed file specified in the cfg-file and the scaler is fitted again.
+
+    Args:
+        scaler (scaler): the specified scaling method instance. Must already be fitted if X_ft is provided.
         clf (classifier): the specified model instance.
         config (ConfigParser-object): object containing the parsed configuration-settings of the model.
         root_dir (str): path to location of cfg-file.
+        X_ft (array, optional): scaled variable values of all data points, see 'machine_learning.scale_X()'. Defaults to None.
+        Y (array, optional): conflict data of all data points. Defaults to None.
+
+    Raises:
+        ValueError: raised if neither the data nor a pre-computed XY-file are provided.
 
     Returns:
         classifier: classifier fitted with all available data.
@@ -143,21 +520,203 @@ def pickle_clf(scaler, clf, config, root_dir):
 
     print('INFO: fitting the classifier with all data from reference period')
 
-    if config.get('pre_calc', 'XY') is '':
-        if config.getboolean('general', 'verbose'): print('DEBUG: loading XY data from {}'.format(os.path.join(root_dir, config.get('general', 'output_dir'), 'XY.npy')))
-        XY_fit = np.load(os.path.join(root_dir, config.get('general', 'output_dir'), 'XY.npy'), allow_pickle=True)
-    else:
+    if (X_ft is None) or (Y is None):
+
+        if config.get('pre_calc', 'XY') is '':
+            raise ValueError('ERROR: neither XY-data nor a pre-computed XY-file are provided to fit the classifier')
+
         if config.getboolean('general', 'verbose'): print('DEBUG: loading XY data from {}'.format(os.path.join(root_dir, config.get('pre_calc', 'XY'))))
         XY_fit = np.load(os.path.join(root_dir, config.get('pre_calc', 'XY')), allow_pickle=True)
 
-    X_fit, Y_fit = data.split_XY_data(XY_fit, config)
-    X_ID_fit, X_geom_fit, X_data_fit = conflict.split_conflict_geom_data(X_fit)
-    X_ft_fit = scaler.fit_transform(X_data_fit)
+        X_fit, Y = data.split_XY_data(XY_fit, config)
+        X_ft = scale_X(X_fit, config, scaler)
+
+    ##- non-conflict data points are undersampled reproducibly with the master seed
+    master_seed = config.get('settings', 'seed', fallback='')
+    X_ft, Y = undersample(X_ft, Y, config, random_state=None if master_seed == '' else int(master_seed))
+
+    clf = compute.set_n_jobs(clf, compute.get_core_budget(config))
+    with compute.limit_threads(compute.get_core_budget(config)):
+        clf = fit_clf(clf, X_ft, Y)
+
+    dump_model_bundle(scaler, clf, config, os.path.join(root_dir, config.get('general', 'output_dir')))
+
+    return clf
+
+def config_fingerprint(config):
+    """Computes a fingerprint of those model settings which determine how a classifier has to be used, i.e. the variables and their order as well as the machine learning settings.
+    Paths to files are not part of the fingerprint, such that reference and projection runs with different input files share the same fingerprint.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+
+    Returns:
+        str: hexadecimal fingerprint.
+    """    
+
+    items = [key for key, value in config.items('data')]
+    items += ['{}={}'.format(key, value) for key, value in config.items('machine_learning') if key != 'train_fraction']
+
+    return hashlib.sha256(';'.join(items).encode('utf-8')).hexdigest()
+
+def dump_model_bundle(scaler, clf, config, out_dir):
+    """Stores the fitted scaler and classifier as one versioned model bundle, together with the order of variables, the fraction of non-conflict data points used for training, and the fingerprint of the model settings.
+    The bundle is written uncompressed with joblib, such that numpy arrays can be memory-mapped when loading.
+    If specified in the cfg-file, a random forest classifier is stored as compiled forest, which is smaller and loaded considerably faster, but slower in predicting, see 'forest.compile_forest()'.
+
+    Args:
+        scaler (scaler): the fitted scaling method instance.
+        clf (classifier): the fitted model instance.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        out_dir (str): path to output folder.
+
+    Returns:
+        str: path to the model bundle.
+    """    
+
+    ##- if specified, the random forest is stored as compiled node arrays instead of the classifier instance
+    if config.getboolean('compute', 'compile_forest', fallback=False):
+        print('INFO: compiling fitted classifier to node arrays')
+        compiled_forest = forest.compile_forest(clf)
+        clf = None
+    else:
+        compiled_forest = None
+
+    bundle = {'version': BUNDLE_VERSION,
+              'scaler': scaler,
+              'clf': clf,
+              'forest': compiled_forest,
+              'features': [key for key, value in config.items('data')],
+              'negative_fraction': config.getfloat('machine_learning', 'negative_fraction', fallback=1.),
+              'fingerprint': config_fingerprint(config)}
+
+    fo = os.path.join(out_dir, 'clf.joblib')
+    print('INFO: dumping model bundle to {}'.format(fo))
+    joblib.dump(bundle, fo)
+
+    return fo
+
+def load_model_bundle(config, root_dir):
+    """Loads the model bundle specified in the cfg-file of a projection run. Numpy arrays are memory-mapped.
+    The variables of the projection run must be identical, and in the same order, as the variables used to fit the classifier.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        root_dir (str): path to location of cfg-file.
+
+    Raises:
+        ValueError: raised if path to model bundle is incorrect.
+        ValueError: raised if the file is not a model bundle or was written with another bundle version.
+        ValueError: raised if the variables of the projection run do not match those used to fit the classifier.
+
+    Returns:
+        dict: model bundle containing fitted scaler, fitted classifier or compiled forest, order of variables, and fingerprint of model settings.
+    """    
+
+    fo = os.path.join(root_dir, config.get('pre_calc', 'clf'))
+
+    if not os.path.isfile(fo):
+        raise ValueError('ERROR: no pre-computed classifier specified in cfg-file, currently specified file {} does not exist'.format(fo))
+
+    print('INFO: loading model bundle from {}'.format(fo))
+    bundle = joblib.load(fo, mmap_mode='r')
+
+    if (not isinstance(bundle, dict)) or (bundle.get('version') != BUNDLE_VERSION):
+        raise ValueError('ERROR: file {} is not a model bundle of version {}, please re-run the reference run'.format(fo, BUNDLE_VERSION))
+
+    features = [key for key, value in config.items('data')]
+    if features != bundle['features']:
+        raise ValueError('ERROR: variables {} do not match variables {} used to fit the classifier'.format(features, bundle['features']))
+
+    if config_fingerprint(config) != bundle['fingerprint']:
+        warnings.warn('WARNING: machine learning settings differ from those used to fit the classifier, the settings of the model bundle are used')
+
+    ##- if specified, the classifiers of all repetitions of the reference run are added to the bundle
+    if config.get('pre_calc', 'ensemble', fallback='') != '':
+        bundle['ensemble'] = load_ensemble(config, root_dir)
+
+    return bundle
+
+def dump_ensemble(clfs, config, out_dir):
+    """Stores the fitted classifiers of all repetitions of the reference run, such that projections can be made with all of them.
+    As all repetitions use the variable values scaled once with all data, the scaler of the model bundle applies to all classifiers.
+    If specified in the cfg-file, random forest classifiers are stored as compiled forests, see 'forest.compile_forest()'.
+
+    Args:
+        clfs (list): fitted model instances of all repetitions.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        out_dir (str): path to output folder.
+
+    Returns:
+        str: path to the ensemble file.
+    """    
+
+    if config.getboolean('compute', 'compile_forest', fallback=False):
+        members = [forest.compile_forest(clf) for clf in clfs]
+    else:
+        members = list(clfs)
+
+    ensemble = {'version': BUNDLE_VERSION,
+                'members': members,
+                'features': [key for key, value in config.items('data')],
+                'fingerprint': config_fingerprint(config)}
+
+    fo = os.path.join(out_dir, 'ensemble.joblib')
+    print('INFO: dumping classifiers of {} repetitions to {}'.format(len(members), fo))
+    joblib.dump(ensemble, fo)
+
+    return fo
+
+def load_ensemble(config, root_dir):
+    """Loads the classifiers of all repetitions of the reference run as specified in the cfg-file of a projection run. Numpy arrays are memory-mapped.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        root_dir (str): path to location of cfg-file.
+
+    Raises:
+        ValueError: raised if path to ensemble file is incorrect.
+        ValueError: raised if the file is not an ensemble file or was written with another bundle version.
+        ValueError: raised if the variables of the projection run do not match those used to fit the classifiers.
+
+    Returns:
+        list: fitted classifiers or compiled forests of all repetitions.
+    """    
+
+    fo = os.path.join(root_dir, config.get('pre_calc', 'ensemble'))
+
+    if not os.path.isfile(fo):
+        raise ValueError('ERROR: specified ensemble file {} does not exist'.format(fo))
+
+    print('INFO: loading classifiers of all repetitions from {}'.format(fo))
+    ensemble = joblib.load(fo, mmap_mode='r')
+
+    if (not isinstance(ensemble, dict)) or (ensemble.get('version') != BUNDLE_VERSION):
+        raise ValueError('ERROR: file {} is not an ensemble file of version {}, please re-run the reference run'.format(fo, BUNDLE_VERSION))
+
+    features = [key for key, value in config.items('data')]
+    if features != ensemble['features']:
+        raise ValueError('ERROR: variables {} do not match variables {} used to fit the classifiers'.format(features, ensemble['features']))
+
+    return ensemble['members']
+
+def predict_proba_ensemble(ensemble, X_ft):
+    """Predicts the probability of conflict with all classifiers of an ensemble.
+
+    Args:
+        ensemble (list): fitted classifiers or compiled forests.
+        X_ft (array): array containing the scaled variable values.
+
+    Returns:
+        array: probability of conflict per classifier (rows) and data point (columns).
+    """    
 
-    clf.fit(X_ft_fit, Y_fit)
+    y_prob = np.empty((len(ensemble), len(X_ft)))
 
-    print('INFO: dumping classifier to {}'.format(os.path.join(root_dir, config.get('general', 'output_dir'), 'clf.pkl')))
-    with open(os.path.join(root_dir, config.get('general', 'output_dir'), 'clf.pkl'), 'wb') as f:
-        pickle.dump(clf, f)
+    for i, member in enumerate(ensemble):
+        if isinstance(member, dict):
+            y_prob[i] = forest.predict_proba(member, X_ft)[:, 1]
+        else:
+            y_prob[i] = member.predict_proba(X_ft)[:, 1]
 
-    return clf
\ No newline at end of file
+    return y_prob
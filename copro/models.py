@@ -1,10 +1,10 @@
-from copro import machine_learning, conflict, utils, evaluation, data
+from copro import machine_learning, conflict, utils, evaluation, data, compute, forest
+from sklearn import ensemble, model_selection
 import pandas as pd
 import numpy as np
-import pickle
 import os, sys
 
-def all_data(X, Y, config, scaler, clf, out_dir):
+def all_data(X, Y, config, scaler, clf, out_dir, run_seed=None, X_ft=None):
     """Main model workflow when all data is used. The model workflow is executed for each model simulation.
 
     Args:
@@ -14,6 +14,8 @@ def all_data(X, Y, config, scaler, clf, out_dir):
         scaler (scaler): the specified scaling method instance.
         clf (classifier): the specified model instance.
         out_dir (str): path to output folder.
+        run_seed (int, optional): seed of this model repetition, used to split the data. Defaults to None.
+        X_ft (array, optional): pre-computed scaled variable values of X. If None, X is scaled in this repetition. Defaults to None.
 
     Returns:
         dataframe: containing the test-data X-array values.
@@ -22,23 +24,23 @@ def all_data(X, Y, config, scaler, clf, out_dir):
     """    
     print('INFO: using all data')
 
-    X_train, X_test, y_train, y_test, X_train_geom, X_test_geom, X_train_ID, X_test_ID = machine_learning.split_scale_train_test_split(X, Y, config, scaler)
+    X_train, X_test, y_train, y_test, X_train_geom, X_test_geom, X_train_ID, X_test_ID = machine_learning.split_scale_train_test_split(X, Y, config, scaler, random_state=run_seed, X_ft=X_ft)
     
-    y_pred, y_prob = machine_learning.fit_predict(X_train, y_train, X_test, clf, config)
+    y_pred, y_prob = machine_learning.fit_predict(X_train, y_train, X_test, clf, config, random_state=run_seed)
 
     eval_dict = evaluation.evaluate_prediction(y_test, y_pred, y_prob, X_test, clf, config)
 
-    y_df = conflict.get_pred_conflict_geometry(X_test_ID, X_test_geom, y_test, y_pred)
+    y_df = conflict.get_pred_conflict_geometry(X_test_ID, X_test_geom, y_test, y_pred, y_prob[:, 1])
 
     X_df = pd.DataFrame(X_test)
 
     return X_df, y_df, eval_dict
 
-def leave_one_out(X, Y, config, scaler, clf, out_dir):
-    """Model workflow when each variable is left out from analysis once. Output is limited to the metric scores. 
-    Output is stored to sub-folders of the output directory, with each sub-folder containing output for a n-1 variable combination.
-    After computing metric scores per prediction (i.e. n-1 variables combinations), model exit is forced.
-    Not tested yet for more than one simulation!
+def out_of_bag(X, Y, config, scaler, clf, out_dir, X_ft=None):
+    """Model workflow when the generalization error of a RFClassifier is estimated with its out-of-bag samples instead of repeated train-test splits.
+    The classifier is fitted only once with all data. Each data point is then predicted only by those trees which did not see this data point during training.
+    As such, each data point is evaluated once, and the output is comparable to the output of multiple model simulations.
+    Note that the class weights are computed per bootstrap sample ('balanced_subsample') in this workflow.
 
     Args:
         X (array): array containing the variable values plus unique identifer and geometry information.
@@ -47,39 +49,52 @@ def leave_one_out(X, Y, config, scaler, clf, out_dir):
         scaler (scaler): the specified scaling method instance.
         clf (classifier): the specified model instance.
         out_dir (str): path to output folder.
+        X_ft (array, optional): pre-computed scaled variable values of X. If None, X is scaled here. Defaults to None.
 
     Raises:
-        DeprecationWarning: this function will most likely be deprecated due to lack of added value and applicability.
+        ValueError: raised if the specified model is not a RFClassifier.
+
+    Returns:
+        dataframe: containing the X-array values of all evaluated data points.
+        datatrame: containing model output on polygon-basis.
+        dict: dictionary containing evaluation metrics.
     """    
 
-    raise DeprecationWarning('WARNING: the leave-one-out model will be most likely be deprecated in near future')
+    if not isinstance(clf, ensemble.RandomForestClassifier):
+        raise ValueError('ERROR: out-of-bag evaluation is only possible with RFClassifier')
 
-    X_train, X_test, y_train, y_test, X_train_geom, X_test_geom, X_train_ID, X_test_ID = machine_learning.split_scale_train_test_split(X, Y, config, scaler)
+    print('INFO: using all data with out-of-bag evaluation')
 
-    for i, key in zip(range(X_train.shape[1]), config.items('data')):
+    X_ID, X_geom, X_data = conflict.split_conflict_geom_data(X)
+    if X_ft is None:
+        X_ft = machine_learning.scale_X(X, config, scaler)
+    Y = np.asarray(Y)
 
-        print('INFO: removing data for variable {}'.format(key[0]))
+    #- class weights are computed per bootstrap sample, as fixed class weights bias which data points end up out-of-bag
+    clf.set_params(oob_score=True, bootstrap=True, class_weight='balanced_subsample')
+    clf = machine_learning.fit_clf(clf, X_ft, Y)
 
-        X_train_loo = np.delete(X_train, i, axis=1)
-        X_test_loo = np.delete(X_test, i, axis=1)
+    #- data points which were part of all bootstrap samples do not have an out-of-bag prediction
+    y_prob = clf.oob_decision_function_
+    valid = ~np.isnan(y_prob).any(axis=1)
+    if config.getboolean('general', 'verbose'): print('DEBUG: {} data points without out-of-bag prediction'.format(np.sum(~valid)))
 
-        sub_out_dir = os.path.join(out_dir, '_only_'+str(key[0]))
-        if not os.path.isdir(sub_out_dir):
-            os.makedirs(sub_out_dir)
+    y_prob = y_prob[valid]
+    y_pred = clf.classes_[np.argmax(y_prob, axis=1)]
+    y_test = Y[valid]
 
-        y_pred, y_prob = machine_learning.fit_predict(X_train_loo, y_train, X_test_loo, clf, config)
+    eval_dict = evaluation.evaluate_prediction(y_test, y_pred, y_prob, X_ft[valid], clf, config)
 
-        eval_dict = evaluation.evaluate_prediction(y_test, y_pred, y_prob, X_test_loo, clf, config)
+    y_df = conflict.get_pred_conflict_geometry(X_ID[valid], X_geom[valid], y_test, y_pred, y_prob[:, 1])
 
-        utils.save_to_csv(eval_dict, sub_out_dir, 'evaluation_metrics')
-    
-    sys.exit('INFO: leave-one-out model execution stops here.')
+    X_df = pd.DataFrame(X_ft[valid])
 
-def single_variables(X, Y, config, scaler, clf, out_dir):
-    """Model workflow when the model is based on only one single variable. Output is limited to the metric scores. 
-    Output is stored to sub-folders of the output directory, with each sub-folder containing output for a 1 variable combination.
-    After computing metric scores per prediction (i.e. per variable), model exit is forced.
-    Not tested yet for more than one simulation!
+    return X_df, y_df, eval_dict
+
+def k_fold(X, Y, config, scaler, clf, out_dir, train_idx, test_idx, run_seed=None, X_ft=None):
+    """Model workflow for one fold of a (repeated) stratified k-fold cross-validation.
+    The data points to train and test the model are provided as indices, such that all folds of one repetition together test each data point exactly once.
+    No metrics are computed here, as they are computed from all folds of one repetition together.
 
     Args:
         X (array): array containing the variable values plus unique identifer and geometry information.
@@ -88,104 +103,206 @@ def single_variables(X, Y, config, scaler, clf, out_dir):
         scaler (scaler): the specified scaling method instance.
         clf (classifier): the specified model instance.
         out_dir (str): path to output folder.
+        train_idx (array): indices of data points used to train the model.
+        test_idx (array): indices of data points used to test the model.
+        run_seed (int, optional): seed of this model repetition. Defaults to None.
+        X_ft (array, optional): pre-computed scaled variable values of X. If None, X is scaled here. Defaults to None.
+
+    Returns:
+        dataframe: containing the test-data X-array values.
+        datatrame: containing model output on polygon-basis.
+    """    
+
+    X_ID, X_geom, X_data = conflict.split_conflict_geom_data(X)
+    if X_ft is None:
+        X_ft = machine_learning.scale_X(X, config, scaler)
+    Y = np.asarray(Y)
+
+    y_pred, y_prob = machine_learning.fit_predict(X_ft[train_idx], Y[train_idx], X_ft[test_idx], clf, config, random_state=run_seed)
+
+    y_df = conflict.get_pred_conflict_geometry(X_ID[test_idx], X_geom[test_idx], Y[test_idx], y_pred, y_prob[:, 1])
+
+    X_df = pd.DataFrame(X_ft[test_idx])
+
+    return X_df, y_df
+
+def rolling_origin(X, Y, years, config, scaler, clf, out_dir, run_seed=None, X_ft=None):
+    """Model workflow for a temporal validation with rolling forecast origin.
+    For each year t of the validation period, the model is trained with all data points of years before t and tested with the data points of year t.
+    Instead of training a new RFClassifier for each year, the forest is extended using 'warm_start': 
+    for each year, additional trees are fitted with all data available up to that year and added to the trees of previous years.
+    The trees are evenly distributed over all years of the validation period, such that the final forest contains the specified number of trees.
+    Years without both conflict and non-conflict data points cannot be evaluated and are skipped.
+    The metrics per year are additionally stored to csv-file.
+
+    Args:
+        X (array): array containing the variable values plus unique identifer and geometry information.
+        Y (array): array containing merely the binary conflict classifier data.
+        years (array): array containing the simulation year of each data point.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        scaler (scaler): the specified scaling method instance.
+        clf (classifier): the specified model instance.
+        out_dir (str): path to output folder.
+        run_seed (int, optional): seed used for undersampling. Defaults to None.
+        X_ft (array, optional): pre-computed scaled variable values of X. If None, X is scaled here. Defaults to None.
 
     Raises:
-        DeprecationWarning: this function will most likely be deprecated due to lack of added value and applicability.
+        ValueError: raised if the specified model is not a RFClassifier.
+        ValueError: raised if the first year of the validation period is not later than the start year.
+
+    Returns:
+        list: list with a tuple of test-data X-array values, model output on polygon-basis, and evaluation metrics per year.
     """    
 
-    raise DeprecationWarning('WARNING: the single-variable model will be most likely be deprecated in near future')
+    if not isinstance(clf, ensemble.RandomForestClassifier):
+        raise ValueError('ERROR: temporal evaluation is only possible with RFClassifier')
 
-    X_train, X_test, y_train, y_test, X_train_geom, X_test_geom, X_train_ID, X_test_ID = machine_learning.split_scale_train_test_split(X, Y, config, scaler)
+    y_start = config.getint('settings', 'y_start')
+    y_end = config.getint('settings', 'y_end')
+    first_test_year = config.getint('settings', 'first_test_year', fallback=y_start + (y_end - y_start + 1) // 2)
+    if first_test_year <= y_start:
+        raise ValueError('ERROR: the first year of the validation period must be later than the start year {}'.format(y_start))
 
-    for i, key in zip(range(X_train.shape[1]), config.items('data')):
+    X_ID, X_geom, X_data = conflict.split_conflict_geom_data(X)
+    if X_ft is None:
+        X_ft = machine_learning.scale_X(X, config, scaler)
+    Y = np.asarray(Y)
+    years = np.asarray(years)
 
-        print('INFO: single-variable model with variable {}'.format(key[0]))
+    test_years = np.arange(first_test_year, y_end + 1)
+    n_trees_per_year = max(1, clf.n_estimators // len(test_years))
+    clf.set_params(warm_start=True, n_estimators=0)
 
-        X_train_svmod = X_train[:, i].reshape(-1, 1)
-        X_test_svmod = X_test[:, i].reshape(-1, 1)
+    results = []
+    metrics_per_year = {}
 
-        sub_out_dir = os.path.join(out_dir, '_excl_'+str(key[0]))
-        if not os.path.isdir(sub_out_dir):
-            os.makedirs(sub_out_dir)
+    for test_year in test_years:
 
-        y_pred, y_prob = machine_learning.fit_predict(X_train_svmod, y_train, X_test_svmod, clf, config)
+        train, test = (years < test_year), (years == test_year)
+        if len(np.unique(Y[test])) < 2:
+            print('WARNING: skipping year {} as it does not contain both conflict and non-conflict data points'.format(test_year))
+            continue
 
-        eval_dict = evaluation.evaluate_prediction(y_test, y_pred, y_prob, X_test_svmod, clf, config)
+        print('INFO: training with years {} to {}, testing with year {}'.format(y_start, test_year - 1, test_year))
+        clf.set_params(n_estimators=clf.n_estimators + n_trees_per_year)
 
-        utils.save_to_csv(eval_dict, sub_out_dir, 'evaluation_metrics')
+        y_pred, y_prob = machine_learning.fit_predict(X_ft[train], Y[train], X_ft[test], clf, config, random_state=run_seed)
 
-    sys.exit('INFO: single-variable model execution stops here.')
+        eval_dict = evaluation.evaluate_prediction(Y[test], y_pred, y_prob, X_ft[test], clf, config)
 
-def dubbelsteen(X, Y, config, scaler, clf, out_dir):
-    """Model workflow when the relation between variables and conflict is based on randomness.
-    Thereby, the fraction of actual conflict is equal to observations, but the location in array is randomized by shuffling.
-    The model workflow is executed for each model simulation.
+        y_df = conflict.get_pred_conflict_geometry(X_ID[test], X_geom[test], Y[test], y_pred, y_prob[:, 1])
+
+        X_df = pd.DataFrame(X_ft[test])
+
+        results.append((X_df, y_df, eval_dict))
+        metrics_per_year[test_year] = eval_dict
+
+    if (out_dir != None) and isinstance(out_dir, str):
+        utils.save_to_csv(pd.DataFrame.from_dict(metrics_per_year, orient='index'), out_dir, 'evaluation_metrics_per_year')
+
+    return results
+
+def variable_subset(X_ft, Y, config, clf, columns, run_seed=None):
+    """Model workflow when only a subset of the variables is used, e.g. to leave out one variable or to use one variable only.
+    The data is split as in 'models.all_data()' for the same seed, such that all subsets of one repetition are trained and tested with the same data points.
+    The variables are selected from the scaled variable values by their column index, without copying the data of the other variables.
+    Output is limited to the metric scores.
 
     Args:
-        X (array): array containing the variable values plus unique identifer and geometry information.
+        X_ft (array): scaled variable values of all data points.
         Y (array): array containing merely the binary conflict classifier data.
         config (ConfigParser-object): object containing the parsed configuration-settings of the model.
-        scaler (scaler): the specified scaling method instance.
         clf (classifier): the specified model instance.
-        out_dir (str): path to output folder.
+        columns (list): column indices of the variables to be used.
+        run_seed (int, optional): seed of this model repetition, used to split the data. Defaults to None.
 
     Returns:
-        dataframe: containing the test-data X-array values.
-        datatrame: containing model output on polygon-basis.
-        dict: dictionary containing evaluation metrics per simulation.
-    """   
+        dict: dictionary containing evaluation metrics for this subset of variables.
+    """    
 
-    print('INFO: dubbelsteenmodel running')
+    idx_train, idx_test = model_selection.train_test_split(np.arange(len(X_ft)),
+                                                           test_size=1-config.getfloat('machine_learning', 'train_fraction'),
+                                                           random_state=run_seed)
 
-    Y = utils.create_artificial_Y(Y)
+    Y = np.asarray(Y)
+    X_train, X_test = X_ft[np.ix_(idx_train, columns)], X_ft[np.ix_(idx_test, columns)]
 
-    X_train, X_test, y_train, y_test, X_train_geom, X_test_geom, X_train_ID, X_test_ID = machine_learning.split_scale_train_test_split(X, Y, config, scaler)
+    y_pred, y_prob = machine_learning.fit_predict(X_train, Y[idx_train], X_test, clf, config, random_state=run_seed)
 
-    y_pred, y_prob = machine_learning.fit_predict(X_train, y_train, X_test, clf, config)
+    eval_dict = evaluation.evaluate_prediction(Y[idx_test], y_pred, y_prob, X_test, clf, config)
 
-    eval_dict = evaluation.evaluate_prediction(y_test, y_pred, y_prob, X_test, clf, config)
+    return eval_dict
 
-    y_df = conflict.get_pred_conflict_geometry(X_test_ID, X_test_geom, y_test, y_pred)
+def dubbelsteen(X_ft, Y_r, config, clf, run_seed=None):
+    """Model workflow when the relation between variables and conflict is based on randomness.
+    Thereby, the fraction of actual conflict is equal to observations, but the location in array is randomized by shuffling, see 'utils.create_artificial_Y()'.
+    The model is fitted and evaluated with all variables as in 'models.variable_subset()'.
+    Output is limited to the metric scores.
 
-    X_df = pd.DataFrame(X_test)
+    Args:
+        X_ft (array): scaled variable values of all data points.
+        Y_r (array): array containing reshuffled binary conflict classifier data.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        clf (classifier): the specified model instance.
+        run_seed (int, optional): seed of this model repetition, used to split the data. Defaults to None.
 
-    return X_df, y_df, eval_dict
+    Returns:
+        dict: dictionary containing evaluation metrics of this replicate.
+    """   
+
+    return variable_subset(X_ft, Y_r, config, clf, list(range(X_ft.shape[1])), run_seed=run_seed)
 
-def predictive(X, scaler, config, root_dir):
+def predictive(X, config, root_dir, bundle=None):
     """Predictive model to use the already fitted classifier to make projections.
-    As other models, it reads data which are then scaled and used in conjuction with the classifier to project conflict risk.
+    As other models, it reads data which are then scaled with the scaler fitted in the reference run and used in conjuction with the classifier to project conflict risk.
+    If the model bundle contains the classifiers of all repetitions of the reference run, the probability of conflict is their mean, and its standard deviation is added as spread.
+    The prediction is then derived from this mean probability too, such that all output describes the same ensemble.
 
     Args:
         X (array): array containing the variable values plus unique identifer and geometry information.
-        scaler (scaler): the specified scaling method instance.
         config (ConfigParser-object): object containing the parsed configuration-settings of the model.
-
-    Raises:
-        ValueError: raised if path to pickled classifier is incorrect.
+        root_dir (str): path to location of cfg-file.
+        bundle (dict, optional): model bundle with fitted scaler and classifier or compiled forest. If None, it is loaded from the file specified in the cfg-file. Defaults to None.
 
     Returns:
         datatrame: containing model output on polygon-basis.
     """    
 
+    if bundle is None:
+        bundle = machine_learning.load_model_bundle(config, root_dir)
+
     print('INFO: scaling the data from projection period')
     X = pd.DataFrame(X)
     if config.getboolean('general', 'verbose'): print('DEBUG: number of data points including missing values: {}'.format(len(X)))
-    X = X.dropna()
-    if config.getboolean('general', 'verbose'): print('DEBUG: number of data points excluding missing values: {}'.format(len(X)))
+    if not machine_learning.supports_missing_values(config):
+        X = X.dropna()
+        if config.getboolean('general', 'verbose'): print('DEBUG: number of data points excluding missing values: {}'.format(len(X)))
     X_ID, X_geom, X_data = conflict.split_conflict_geom_data(X.to_numpy())
-    ##- scaling only the variable values
-    X_ft = scaler.fit_transform(X_data)
-
-    if os.path.isfile(os.path.join(root_dir, config.get('pre_calc', 'clf'))):
-        with open(os.path.join(root_dir, config.get('pre_calc', 'clf')), 'rb') as f:
-            print('INFO: loading classifier from {}'.format(os.path.join(root_dir, config.get('pre_calc', 'clf'))))
-            clf = pickle.load(f)
-    else:
-        raise ValueError('ERROR: no pre-computed classifier specified in cfg-file, currently specified file {} does not exist'.format(os.path.join(root_dir, config.get('pre_calc', 'clf'))))
+    ##- scaling only the variable values with the scaler fitted in the reference run
+    dtype = compute.get_dtype(config)
+    X_ft = bundle['scaler'].transform(np.ascontiguousarray(X_data, dtype=dtype)).astype(dtype, copy=False)
         
     print('INFO: making the projection')
-    y_pred = clf.predict(X_ft)
+    if bundle.get('forest') is not None:
+        y_prob = forest.predict_proba(bundle['forest'], X_ft)
+        y_pred = bundle['forest']['classes'].take(np.argmax(y_prob, axis=1), axis=0)
+    else:
+        y_pred = bundle['clf'].predict(X_ft)
+        y_prob = bundle['clf'].predict_proba(X_ft)
+    ##- predictions are corrected with the fraction of non-conflict data points used to fit the classifier
+    y_pred, y_prob = machine_learning.correct_prediction(y_pred, y_prob, config, negative_fraction=bundle['negative_fraction'])
     arr = np.column_stack((X_ID, X_geom, y_pred))
     y_df = pd.DataFrame(arr, columns=['ID', 'geometry', 'y_pred'])
+    y_df['y_prob'] = y_prob[:, 1].astype(float)
+
+    ##- if available, the probability of conflict and the prediction are determined with the classifiers of all repetitions instead
+    if bundle.get('ensemble') is not None:
+        print('INFO: making the projection with the classifiers of {} repetitions'.format(len(bundle['ensemble'])))
+        y_prob_ens = machine_learning.predict_proba_ensemble(bundle['ensemble'], X_ft)
+        y_prob_ens = np.array([machine_learning.correct_probabilities(np.column_stack((1 - p, p)), config, negative_fraction=bundle['negative_fraction'])[:, 1] 
+                               for p in y_prob_ens])
+        y_df['y_prob'] = y_prob_ens.mean(axis=0)
+        y_df['y_pred'] = (y_df['y_prob'].to_numpy() > 0.5).astype(int)
+        y_df['y_prob_std'] = y_prob_ens.std(axis=0)
 
     return y_df
\ No newline at end of file
@@ -1,10 +1,13 @@
-from copro import models, data, machine_learning, evaluation
+from copro import models, data, machine_learning, evaluation, utils, compute, grid
+from sklearn.base import clone
+from sklearn import model_selection
+from joblib import Parallel, delayed
 import pandas as pd
 import numpy as np
-import os, sys
+import os, sys, copy
 
 
-def create_XY(config, out_dir, root_dir, polygon_gdf, conflict_gdf):
+def create_XY(config, out_dir, root_dir, polygon_gdf, conflict_gdf, return_years=False):
     """Top-level function to create the X-array and Y-array.
     If the XY-data was pre-computed and specified in cfg-file, the data is loaded.
     If not, variable values and conflict data are read from file and stored in array. The resulting array is by default saved as npy-format to file.
@@ -15,10 +18,12 @@ def create_XY(config, out_dir, root_dir, polygon_gdf, conflict_gdf):
         root_dir (str): path to location of cfg-file.
         polygon_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
         conflict_gdf (geo-dataframe): geo-dataframe containing the selected conflicts.
+        return_years (bool, optional): whether or not to return the simulation year of each data point. Defaults to False.
 
     Returns:
         array: X-array containing variable values.
         array: Y-array containing conflict data.
+        array: array containing simulation year per data point, only if specified.
     """    
 
     if config.get('pre_calc', 'XY') is '':
@@ -35,11 +40,9 @@ def create_XY(config, out_dir, root_dir, polygon_gdf, conflict_gdf):
         print('INFO: loading XY data from file {}'.format(os.path.join(root_dir, config.get('pre_calc', 'XY'))))
         XY = np.load(os.path.join(root_dir, config.get('pre_calc', 'XY')), allow_pickle=True)
         
-    X, Y = data.split_XY_data(XY, config)    
+    return data.split_XY_data(XY, config, return_years=return_years)
 
-    return X, Y
-
-def create_X(config, out_dir, root_dir, polygon_gdf, conflict_gdf=None):
+def create_X(config, out_dir, root_dir, polygon_gdf, conflict_gdf=None, polygon_cells=None):
     """Top-level function to create the X-array.
     If the X-data was pre-computed and specified in cfg-file, the data is loaded.
     If not, variable values are read from file and stored in array. 
@@ -51,6 +54,7 @@ def create_X(config, out_dir, root_dir, polygon_gdf, conflict_gdf=None):
         root_dir (str): path to location of cfg-file.
         polygon_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
         conflict_gdf (geo-dataframe): geo-dataframe containing the selected conflicts.
+        polygon_cells (dict, optional): cache with the cells per set of polygons and raster grid, see 'variables.get_polygon_cells()'. Defaults to None.
 
     Returns:
         array: X-array containing variable values.
@@ -60,7 +64,7 @@ def create_X(config, out_dir, root_dir, polygon_gdf, conflict_gdf=None):
 
         X = data.initiate_X_data(config)
 
-        X = data.fill_XY(X, config, root_dir, conflict_gdf, polygon_gdf)
+        X = data.fill_XY(X, config, root_dir, conflict_gdf, polygon_gdf, polygon_cells=polygon_cells)
 
         print('INFO: saving X data by default to file {}'.format(os.path.join(out_dir, 'X.npy')))
         np.save(os.path.join(out_dir,'X'), X)
@@ -89,7 +93,7 @@ def prepare_ML(config):
 
     return scaler, clf
 
-def run_reference(X, Y, config, scaler, clf, out_dir):
+def run_reference(X, Y, config, scaler, clf, out_dir, run_seed=None, X_ft=None):
     """Top-level function to run one of the four supported models.
 
     Args:
@@ -99,8 +103,12 @@ def run_reference(X, Y, config, scaler, clf, out_dir):
         scaler (scaler): the specified scaler instance.
         clf (classifier): the specified model instance.
         out_dir (str): path to output folder.
+        run_seed (int, optional): seed of this model repetition. Defaults to None.
+        X_ft (array, optional): pre-computed scaled variable values of X. Defaults to None.
 
     Raises:
+        ValueError: raised if the variable ablation model is specified, see 'pipeline.run_ablation()'.
+        ValueError: raised if the dubbelsteen model is specified, see 'pipeline.run_dubbelsteen()'.
         ValueError: raised if unsupported model is specified.
 
     Returns:
@@ -110,26 +118,505 @@ def run_reference(X, Y, config, scaler, clf, out_dir):
     """    
 
     if config.getint('general', 'model') == 1:
-        X_df, y_df, eval_dict = models.all_data(X, Y, config, scaler, clf, out_dir)
-    elif config.getint('general', 'model') == 2:
-        X_df, y_df, eval_dict = models.leave_one_out(X, Y, config, scaler, clf, out_dir)
-    elif config.getint('general', 'model') == 3:
-        X_df, y_df, eval_dict = models.single_variables(X, Y, config, scaler, clf, out_dir)
+        X_df, y_df, eval_dict = models.all_data(X, Y, config, scaler, clf, out_dir, run_seed=run_seed, X_ft=X_ft)
+    elif config.getint('general', 'model') in [2, 3]:
+        raise ValueError('ERROR: the variable ablation model evaluates all repetitions at once, use pipeline.run_ablation() instead')
     elif config.getint('general', 'model') == 4:
-        X_df, y_df, eval_dict = models.dubbelsteen(X, Y, config, scaler, clf, out_dir)
+        raise ValueError('ERROR: the dubbelsteen model evaluates all replicates at once, use pipeline.run_dubbelsteen() instead')
     else:
         raise ValueError('the specified model type in the cfg-file is invalid - specify either 1, 2, 3 or 4.')
 
     return X_df, y_df, eval_dict
 
-def run_prediction(X, scaler, config, root_dir):
-    """Top-level function to run a predictive model with a already fitted classifier and new data.
+def _pack_meta(X):
+    """Reduces the unique identifier and geometry of each data point to an integer code per data point plus the identifier and geometry per polygon.
+    Thereby, only the codes grow with the number of data points, and they can be shared with workers like any other numeric array, see 'compute.shared_arrays()'.
+    """    
+
+    codes, uniques = pd.factorize(X[:, 0])
+    first_idx = np.unique(codes, return_index=True)[1]
+
+    return codes, X[first_idx, :2]
+
+def _unpack_meta(X, meta):
+    """Restores the unique identifier and geometry of each data point from the codes returned by '_pack_meta()'.
+    """    
+
+    if meta is None:
+        return X
+
+    return meta[X]
+
+def _permutation_importance(clf, X_df, y_df, config, run_seed):
+    """Determines the permutation importance with the classifier and test-data of one repetition or fold, see 'evaluation.permutation_importance()'.
+    Returns None if the number of permutations specified in the cfg-file is 0.
+    """    
+
+    n_repeats = config.getint('settings', 'n_permutations', fallback=5)
+    if n_repeats == 0:
+        return None
+
+    return evaluation.permutation_importance(clf, X_df, y_df.y_test, n_repeats=n_repeats, random_state=run_seed)
+
+def _run_reference_once(X, Y, config, scaler, clf, out_dir, run_seed, n_threads=1, X_ft=None, meta=None):
+    """Executes one model repetition with fresh copies of scaler and classifier.
+    If the classifier accepts a random state, it is set to the seed of this repetition.
+    The classifier as well as BLAS and OpenMP libraries are limited to the number of threads assigned to this repetition.
+    Besides the output of the repetition, the fitted classifier is returned if it is kept for ensemble projections, otherwise None is returned instead.
+    The permutation importance is determined here, where classifier and test-data are at hand, such that only the importances need to be returned.
+    """    
+
+    X = _unpack_meta(X, meta)
+    scaler = clone(scaler)
+    clf = clone(clf)
+    if 'random_state' in clf.get_params():
+        clf.set_params(random_state=run_seed)
+    clf = compute.set_n_jobs(clf, n_threads)
+
+    with compute.limit_threads(n_threads):
+        result = run_reference(X, Y, config, scaler, clf, out_dir, run_seed=run_seed, X_ft=X_ft)
+        importance = _permutation_importance(clf, result[0], result[1], config, run_seed)
+
+    ##- the fitted classifier is only sent back to the parent process if it is needed, as it can be large
+    if not config.getboolean('machine_learning', 'ensemble', fallback=False):
+        clf = None
+
+    return result, clf, importance
+
+def _run_fold_once(X, Y, config, scaler, clf, out_dir, run_seed, train_idx, test_idx, n_threads=1, X_ft=None, meta=None):
+    """Executes one fold of a repeated k-fold cross-validation with a fresh copy of the classifier.
+    Besides the output of the fold, the permutation importance determined with the test-data of this fold is returned.
+    """    
+
+    X = _unpack_meta(X, meta)
+    clf = clone(clf)
+    if 'random_state' in clf.get_params():
+        clf.set_params(random_state=run_seed)
+    clf = compute.set_n_jobs(clf, n_threads)
+
+    with compute.limit_threads(n_threads):
+        fold = models.k_fold(X, Y, config, scaler, clf, out_dir, train_idx, test_idx, run_seed=run_seed, X_ft=X_ft)
+        return fold, _permutation_importance(clf, fold[0], fold[1], config, run_seed)
+
+def _run_until_converged(X, Y, config, scaler, clf, out_dir, seeds, n_workers, n_threads, X_ft, meta=None):
+    """Executes model repetitions in batches of as many repetitions as there are workers, until the half-width of the confidence intervals 
+    of all evaluation metrics and of the chance of conflict per polygon is below the tolerances specified in the cfg-file, see 'evaluation.get_confidence_intervals()'.
+    At least min_runs and at most n_runs repetitions are executed. As the seed of each repetition does not depend on the number of repetitions, 
+    the results are identical to a run with a fixed number of repetitions equal to the number of repetitions needed.
+    The confidence intervals after each batch are stored to csv-file.
+    """    
+
+    tolerance = config.getfloat('settings', 'convergence_tolerance')
+    polygon_tolerance = config.get('settings', 'polygon_tolerance', fallback='')
+    polygon_tolerance = tolerance if polygon_tolerance == '' else float(polygon_tolerance)
+    min_runs = min(config.getint('settings', 'min_runs', fallback=10), len(seeds))
+
+    runs, history = [], []
+    converged = False
+    with Parallel(n_jobs=n_workers) as parallel:
+        while len(runs) < len(seeds):
+            n_next = min(max(min_runs, len(runs) + n_workers), len(seeds))
+            runs += parallel(delayed(_run_reference_once)(X, Y, config, scaler, clf, out_dir, seed, n_threads, X_ft, meta) for seed in seeds[len(runs):n_next])
+
+            ci_dict = evaluation.get_confidence_intervals([run[0] for run in runs])
+            history.append(dict(n_runs=len(runs), **ci_dict))
+            ci_polygon = ci_dict['chance_of_conflict']
+            ci_metrics = max(value for key, value in ci_dict.items() if key != 'chance_of_conflict')
+            if config.getboolean('general', 'verbose'): print('DEBUG: half-width of confidence intervals after {} runs is {} for metrics and {} for polygons'.format(len(runs), ci_metrics, ci_polygon))
+
+            converged = (ci_metrics <= tolerance) and (ci_polygon <= polygon_tolerance)
+            if converged:
+                break
+
+    if converged:
+        print('INFO: results converged after {} runs'.format(len(runs)))
+    else:
+        print('WARNING: results did not converge within the maximum of {} runs'.format(len(seeds)))
+
+    pd.DataFrame(history).to_csv(os.path.join(out_dir, 'convergence.csv'), index=False)
+
+    return runs
+
+def run_reference_n_times(X, Y, config, scaler, clf, out_dir, X_ft=None, years=None, return_importances=False):
+    """Top-level function to execute all model repetitions of the reference run.
+    Each repetition obtains its own seed derived from the master seed in the cfg-file.
+    The core budget specified in the cfg-file is split between concurrent repetitions and threads per repetition.
+    As the results are returned in order of the repetitions, the output is identical to executing the repetitions sequentially.
+    The variable values are scaled only once and all repetitions index into the scaled array.
+    If repetitions are executed by multiple worker processes, the scaled variable values and conflict data are shared with them via memory-mapped files instead of being copied to each worker, see 'compute.shared_arrays()'.
+    If specified in the cfg-file, the classifiers of all repetitions are stored for ensemble projections, see 'machine_learning.dump_ensemble()'.
+    With split and kfold evaluation, the permutation importance is determined per repetition or fold with its classifier and test-data. 
+    With oob and temporal evaluation, no held-out data of the final forest exists, and the impurity-based importances of the forest are used instead.
+
+    The evaluation mode is specified in the cfg-file:
+
+    * split: the model is fitted and evaluated with n repeated train-test splits (default);
+    * oob: a RFClassifier is fitted once and evaluated with its out-of-bag predictions;
+    * kfold: the model is evaluated with n repetitions of a stratified k-fold cross-validation. All folds are executed in parallel, and each repetition tests every data point exactly once;
+    * temporal: a RFClassifier is trained with all years before and tested on each year of the validation period, extending the forest for each year.
+
+    Args:
+        X (array): X-array containing variable values.
+        Y (array): Y-array containing conflict data.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        scaler (scaler): the specified scaler instance.
+        clf (classifier): the specified model instance.
+        out_dir (str): path to output folder.
+        X_ft (array, optional): pre-computed scaled variable values of X. If None, the scaler is fitted to X here. Defaults to None.
+        years (array, optional): simulation year per data point. Only needed for temporal evaluation. Defaults to None.
+        return_importances (bool, optional): whether to return the feature importances too. Defaults to False.
+
+    Raises:
+        ValueError: raised if unsupported evaluation mode is specified.
+        ValueError: raised if the classifiers of all repetitions should be kept with another evaluation mode than split.
+        ValueError: raised if temporal evaluation is specified without providing the simulation years.
+
+    Returns:
+        list: list with a tuple of test-data X-array values, model output on polygon-basis, and evaluation metrics per repetition.
+        array: feature importance per repetition (or fold), feature, and permutation, if return_importances is True. None if the number of permutations is 0.
+    """    
+
+    if X_ft is None:
+        X_ft = machine_learning.scale_X(X, config, scaler)
+
+    importances = None
+
+    evaluation_mode = config.get('settings', 'evaluation', fallback='split')
+
+    if config.getboolean('machine_learning', 'ensemble', fallback=False) and (evaluation_mode != 'split'):
+        raise ValueError('ERROR: keeping the classifiers of all repetitions is only possible with split evaluation')
+
+    if evaluation_mode == 'split':
+
+        seeds = utils.get_run_seeds(config)
+
+        n_workers, n_threads = compute.schedule(config, len(seeds))
+
+        #- the data is placed in memory-mapped files once, to which all workers attach
+        X_codes, meta = _pack_meta(X)
+        with compute.shared_arrays(config, [X_codes, Y, X_ft], n_workers) as (X_shared, Y_shared, X_ft_shared):
+
+            #- either execute all repetitions at once, or add repetitions in batches until the results have converged
+            if config.get('settings', 'convergence_tolerance', fallback='') == '':
+                print('INFO: executing {} runs with {} worker(s) and {} thread(s) per worker'.format(len(seeds), n_workers, n_threads))
+                runs = Parallel(n_jobs=n_workers)(delayed(_run_reference_once)(X_shared, Y_shared, config, scaler, clf, out_dir, seed, n_threads, X_ft_shared, meta) for seed in seeds)
+            else:
+                print('INFO: executing up to {} runs with {} worker(s) and {} thread(s) per worker until convergence'.format(len(seeds), n_workers, n_threads))
+                runs = _run_until_converged(X_shared, Y_shared, config, scaler, clf, out_dir, seeds, n_workers, n_threads, X_ft_shared, meta)
+        results = [run[0] for run in runs]
+        if runs and (runs[0][2] is not None):
+            importances = np.array([run[2] for run in runs])
+
+        #- if specified, keep the classifiers of all repetitions for ensemble projections
+        if config.getboolean('machine_learning', 'ensemble', fallback=False):
+            machine_learning.dump_ensemble([run[1] for run in runs], config, out_dir)
+
+    elif evaluation_mode == 'oob':
+
+        n_threads = compute.get_core_budget(config)
+        clf = compute.set_n_jobs(clone(clf), n_threads)
+        with compute.limit_threads(n_threads):
+            results = [models.out_of_bag(X, Y, config, scaler, clf, out_dir, X_ft=X_ft)]
+        importances = clf.feature_importances_[np.newaxis, :, np.newaxis]
+
+    elif evaluation_mode == 'kfold':
+
+        seeds = utils.get_run_seeds(config)
+        n_folds = config.getint('settings', 'n_folds', fallback=5)
+
+        tasks = []
+        for n, seed in enumerate(seeds):
+            kfold = model_selection.StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+            for train_idx, test_idx in kfold.split(X_ft, Y):
+                tasks.append((n, seed, train_idx, test_idx))
+
+        n_workers, n_threads = compute.schedule(config, len(tasks))
+        print('INFO: executing {} runs with {} folds each with {} worker(s) and {} thread(s) per worker'.format(len(seeds), n_folds, n_workers, n_threads))
+
+        #- the data is placed in memory-mapped files once, to which all workers attach
+        X_codes, meta = _pack_meta(X)
+        with compute.shared_arrays(config, [X_codes, Y, X_ft], n_workers) as (X_shared, Y_shared, X_ft_shared):
+            runs = Parallel(n_jobs=n_workers)(delayed(_run_fold_once)(X_shared, Y_shared, config, scaler, clf, out_dir, seed, train_idx, test_idx, n_threads, X_ft_shared, meta) 
+                                              for n, seed, train_idx, test_idx in tasks)
+        folds = [run[0] for run in runs]
+        if runs and (runs[0][1] is not None):
+            importances = np.array([run[1] for run in runs])
+
+        #- merge all folds per repetition and evaluate them together
+        results = []
+        for n in range(len(seeds)):
+            X_df = pd.concat([fold[0] for task, fold in zip(tasks, folds) if task[0] == n], ignore_index=True)
+            y_df = pd.concat([fold[1] for task, fold in zip(tasks, folds) if task[0] == n], ignore_index=True)
+            y_prob = np.column_stack((1 - y_df.y_prob.to_numpy(), y_df.y_prob.to_numpy()))
+            eval_dict = evaluation.evaluate_prediction(y_df.y_test.astype(int), y_df.y_pred.astype(int), y_prob, X_df.to_numpy(), clf, config)
+            results.append((X_df, y_df, eval_dict))
+
+    elif evaluation_mode == 'temporal':
+
+        if years is None:
+            raise ValueError('ERROR: temporal evaluation requires the simulation year per data point')
+
+        n_threads = compute.get_core_budget(config)
+        clf = compute.set_n_jobs(clone(clf), n_threads)
+        with compute.limit_threads(n_threads):
+            results = models.rolling_origin(X, Y, years, config, scaler, clf, out_dir, run_seed=utils.get_run_seeds(config)[0], X_ft=X_ft)
+        importances = clf.feature_importances_[np.newaxis, :, np.newaxis]
+
+    else:
+        raise ValueError('the specified evaluation mode in the cfg-file is invalid - specify either split, oob, kfold, or temporal.')
+
+    if return_importances:
+        return results, importances
+
+    return results
+
+def _run_subset_once(X_ft, Y, config, clf, run_seed, columns, n_threads=1):
+    """Executes one model repetition with a subset of the variables and a fresh copy of the classifier, see 'models.variable_subset()'.
+    """    
+
+    clf = clone(clf)
+    if 'random_state' in clf.get_params():
+        clf.set_params(random_state=run_seed)
+    clf = compute.set_n_jobs(clf, n_threads)
+
+    with compute.limit_threads(n_threads):
+        return models.variable_subset(X_ft, Y, config, clf, columns, run_seed=run_seed)
+
+def run_ablation(X, Y, config, scaler, clf, out_dir, X_ft=None):
+    """Top-level function to determine the contribution of each variable with the variable ablation model.
+    For each repetition, the model is evaluated with all variables, with each variable left out once, and with each variable as single predictor. 
+    All combinations of repetitions and variable subsets are executed concurrently, sharing the scaled variable values, see 'compute.shared_arrays()'.
+    Within one repetition, all subsets are trained and tested with the same data points.
+    The metrics are stored to ``ablation_metrics.csv`` in the output folder, with one row per repetition and subset.
 
     Args:
         X (array): X-array containing variable values.
+        Y (array): Y-array containing conflict data.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
         scaler (scaler): the specified scaler instance.
+        clf (classifier): the specified model instance.
+        out_dir (str): path to output folder.
+        X_ft (array, optional): pre-computed scaled variable values of X. If None, the scaler is fitted to X here. Defaults to None.
+
+    Returns:
+        dataframe: evaluation metrics per repetition ('run'), type of subset ('subset', either 'all', 'leave_one_out', or 'single_variable'), and variable left out or used ('variable', empty if all variables are used).
+    """    
+
+    if X_ft is None:
+        X_ft = machine_learning.scale_X(X, config, scaler)
+
+    variables = [key for key, value in config.items('data')]
+    subsets = [('all', '', list(range(len(variables))))]
+    subsets += [('leave_one_out', var, [j for j in range(len(variables)) if j != i]) for i, var in enumerate(variables) if len(variables) > 1]
+    subsets += [('single_variable', var, [i]) for i, var in enumerate(variables)]
+
+    seeds = utils.get_run_seeds(config)
+    tasks = [(n, seed, subset) for n, seed in enumerate(seeds) for subset in subsets]
+
+    n_workers, n_threads = compute.schedule(config, len(tasks))
+    print('INFO: executing {} runs with {} variable subsets each with {} worker(s) and {} thread(s) per worker'.format(len(seeds), len(subsets), n_workers, n_threads))
+
+    with compute.shared_arrays(config, [X_ft, np.asarray(Y)], n_workers) as (X_ft_shared, Y_shared):
+        results = Parallel(n_jobs=n_workers)(delayed(_run_subset_once)(X_ft_shared, Y_shared, config, clf, seed, columns, n_threads) 
+                                             for n, seed, (subset, variable, columns) in tasks)
+
+    df = pd.DataFrame([dict(run=n, subset=subset, variable=variable, **eval_dict) for (n, seed, (subset, variable, columns)), eval_dict in zip(tasks, results)])
+    df.to_csv(os.path.join(out_dir, 'ablation_metrics.csv'), index=False)
+
+    if config.getboolean('general', 'verbose'): print('DEBUG: average metrics per variable subset are' + os.linesep + '{}'.format(df.drop('run', axis=1).groupby(['subset', 'variable']).mean()))
+
+    return df
+
+def _run_dubbelsteen_once(X_ft, Y_r, n, config, clf, run_seed, n_threads=1):
+    """Executes one replicate of the dubbelsteen model with a fresh copy of the classifier, see 'models.dubbelsteen()'.
+    """    
+
+    clf = clone(clf)
+    if 'random_state' in clf.get_params():
+        clf.set_params(random_state=run_seed)
+    clf = compute.set_n_jobs(clf, n_threads)
+
+    with compute.limit_threads(n_threads):
+        return models.dubbelsteen(X_ft, Y_r[n], config, clf, run_seed=run_seed)
+
+def run_dubbelsteen(X, Y, config, scaler, clf, out_dir, X_ft=None):
+    """Top-level function to determine the null distribution of the evaluation metrics with the dubbelsteen model.
+    The conflict data of all replicates is reshuffled at once, see 'utils.create_artificial_Y()', and one replicate is executed per repetition.
+    All replicates are executed concurrently, sharing the scaled variable values and reshuffled conflict data, see 'compute.shared_arrays()'.
+    The metrics are stored to ``dubbelsteen_metrics.csv`` in the output folder, with one row per replicate.
+
+    Args:
+        X (array): X-array containing variable values.
+        Y (array): Y-array containing conflict data.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        scaler (scaler): the specified scaler instance.
+        clf (classifier): the specified model instance.
+        out_dir (str): path to output folder.
+        X_ft (array, optional): pre-computed scaled variable values of X. If None, the scaler is fitted to X here. Defaults to None.
+
+    Returns:
+        dataframe: evaluation metrics per replicate ('run').
+    """    
+
+    if X_ft is None:
+        X_ft = machine_learning.scale_X(X, config, scaler)
+
+    seeds = utils.get_run_seeds(config)
+    Y_r = utils.create_artificial_Y(Y, random_state=seeds, n_replicates=len(seeds))
+
+    n_workers, n_threads = compute.schedule(config, len(seeds))
+    print('INFO: executing {} dubbelsteen replicates with {} worker(s) and {} thread(s) per worker'.format(len(seeds), n_workers, n_threads))
+
+    with compute.shared_arrays(config, [X_ft, Y_r], n_workers) as (X_ft_shared, Y_r_shared):
+        results = Parallel(n_jobs=n_workers)(delayed(_run_dubbelsteen_once)(X_ft_shared, Y_r_shared, n, config, clf, seed, n_threads) 
+                                             for n, seed in enumerate(seeds))
+
+    df = pd.DataFrame(results)
+    df.index.name = 'run'
+    df.to_csv(os.path.join(out_dir, 'dubbelsteen_metrics.csv'))
+
+    if config.getboolean('general', 'verbose'): print('DEBUG: 95th percentile of metrics of all replicates is' + os.linesep + '{}'.format(df.quantile(0.95)))
+
+    return df
+
+def create_XY_memmap(config, out_dir, root_dir, polygon_gdf, conflict_gdf):
+    """Top-level function to create the on-disk XY-array used for out-of-core training.
+    If the XY-data was pre-computed in a previous out-of-core run and specified in cfg-file, the data is memory-mapped from file.
+    If not, variable values and conflict data are read from file one year at a time and stored by default as ``XY_data.npy`` in the output folder, see 'data.fill_XY_memmap()'.
+    In gridded mode, each cell-year is one data point instead of each polygon-year, see 'grid.fill_XY_grid()'.
+
+    Args:
         config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        out_dir (str): path to output folder.
         root_dir (str): path to location of cfg-file.
+        polygon_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
+        conflict_gdf (geo-dataframe): geo-dataframe containing the selected conflicts.
+
+    Raises:
+        ValueError: raised if the pre-computed XY-data is not a numeric array.
+
+    Returns:
+        memmap: memory-mapped array containing the variable values and binary conflict data.
+    """    
+
+    if config.get('pre_calc', 'XY') == '':
+
+        print('INFO: saving XY data by default to file {}'.format(os.path.join(out_dir, 'XY_data.npy')))
+        if config.getboolean('settings', 'gridded', fallback=False):
+            XY = grid.fill_XY_grid(config, root_dir, conflict_gdf, polygon_gdf, os.path.join(out_dir, 'XY_data.npy'))
+        else:
+            XY = data.fill_XY_memmap(config, root_dir, conflict_gdf, polygon_gdf, os.path.join(out_dir, 'XY_data.npy'))
+
+    else:
+
+        print('INFO: memory-mapping XY data from file {}'.format(os.path.join(root_dir, config.get('pre_calc', 'XY'))))
+        XY = np.load(os.path.join(root_dir, config.get('pre_calc', 'XY')), mmap_mode='r')
+        if XY.dtype == object:
+            raise ValueError('ERROR: out-of-core training requires a numeric XY-file as written in out-of-core mode, not {}'.format(config.get('pre_calc', 'XY')))
+
+    return XY
+
+def _run_out_of_core_once(XY, config, scaler, clf, run_seed, n_threads=1):
+    """Executes one model repetition in out-of-core mode with a fresh copy of the classifier. 
+    The classifier is fitted with the training-data of this repetition and evaluated batch by batch with the test-data, see 'machine_learning.split_batch()'.
+    """    
+
+    clf = clone(clf)
+    if 'random_state' in clf.get_params():
+        clf.set_params(random_state=run_seed)
+    dtype = compute.get_dtype(config)
+
+    with compute.limit_threads(n_threads):
+
+        clf = machine_learning.partial_fit_clf(XY, config, scaler, clf, run_seed=run_seed)
+
+        counts = evaluation.init_streaming_metrics()
+        for start, batch in data.iter_XY_batches(XY, config.getint('settings', 'batch_size', fallback=100000)):
+            batch_train, batch_test = machine_learning.split_batch(start, batch, config, run_seed)
+            if len(batch_test) == 0:
+                continue
+            X_test = scaler.transform(batch_test[:, :-1]).astype(dtype, copy=False)
+            y_pred, y_prob = machine_learning.correct_prediction(clf.predict(X_test), clf.predict_proba(X_test), config)
+            counts = evaluation.update_streaming_metrics(counts, batch_test[:, -1].astype(int), y_pred, y_prob)
+
+    return evaluation.evaluate_streaming_metrics(counts)
+
+def check_out_of_core(config, tune=False):
+    """Checks whether the settings in the cfg-file can be used in out-of-core and gridded mode.
+    These modes only fit and evaluate the classifier with split evaluation, such that other settings would otherwise be ignored without notice.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        tune (bool, optional): whether the parameters of the classifier are to be tuned. Defaults to False.
+
+    Raises:
+        ValueError: raised if tuning, another model type than 1, another evaluation mode than split, an ensemble, or a sensitivity analysis is specified.
+    """    
+
+    if tune:
+        raise ValueError('ERROR: tuning the classifier is not supported in out-of-core and gridded mode')
+    if config.getint('general', 'model') != 1:
+        raise ValueError('ERROR: out-of-core and gridded mode only support model type 1, i.e. using all data')
+    if config.get('settings', 'evaluation', fallback='split') != 'split':
+        raise ValueError('ERROR: out-of-core and gridded mode only support split evaluation')
+    if config.getboolean('machine_learning', 'ensemble', fallback=False):
+        raise ValueError('ERROR: keeping the classifiers of all repetitions is not supported in out-of-core and gridded mode')
+    if config.get('settings', 'sensitivity_analysis', fallback='') != '':
+        raise ValueError('ERROR: a sensitivity analysis is not supported in out-of-core and gridded mode')
+
+def run_reference_out_of_core(config, out_dir, root_dir, polygon_gdf, conflict_gdf, scaler, clf, XY=None):
+    """Top-level function to execute the reference run without holding the XY-data in memory.
+    The XY-data is stored on disk and memory-mapped, see 'pipeline.create_XY_memmap()', unless it is already provided. 
+    The scaler is fitted in a first streaming pass over the data, after which each repetition fits the classifier with shuffled minibatches of its training-data 
+    and accumulates the evaluation metrics over batches of its test-data. Repetitions are executed concurrently and share the memory-mapped data.
+    Finally, the classifier is fitted with all data and stored together with the scaler as model bundle.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        out_dir (str): path to output folder.
+        root_dir (str): path to location of cfg-file.
+        polygon_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
+        conflict_gdf (geo-dataframe): geo-dataframe containing the selected conflicts.
+        scaler (scaler): the specified scaler instance.
+        clf (classifier): the specified model instance.
+        XY (array, optional): (memory-mapped) XY-data, see 'pipeline.create_XY_memmap()'. Defaults to None.
+
+    Returns:
+        dict: dictionary with evaluation metrics of all repetitions.
+        classifier: classifier fitted with all data.
+    """    
+
+    check_out_of_core(config)
+
+    if XY is None:
+        XY = create_XY_memmap(config, out_dir, root_dir, polygon_gdf, conflict_gdf)
+
+    scaler = machine_learning.partial_fit_scaler(XY, config, scaler)
+
+    seeds = utils.get_run_seeds(config)
+    n_workers, n_threads = compute.schedule(config, len(seeds))
+    print('INFO: executing {} out-of-core runs with {} worker(s) and {} thread(s) per worker'.format(len(seeds), n_workers, n_threads))
+    results = Parallel(n_jobs=n_workers)(delayed(_run_out_of_core_once)(XY, config, scaler, clf, seed, n_threads) for seed in seeds)
+
+    out_dict = evaluation.init_out_dict()
+    for eval_dict in results:
+        out_dict = evaluation.fill_out_dict(out_dict, eval_dict)
+
+    print('INFO: fitting the classifier with all data from reference period')
+    with compute.limit_threads(compute.get_core_budget(config)):
+        clf = machine_learning.partial_fit_clf(XY, config, scaler, clone(clf))
+    machine_learning.dump_model_bundle(scaler, clf, config, out_dir)
+
+    return out_dict, clf
+
+def run_prediction(X, config, root_dir, bundle=None):
+    """Top-level function to run a predictive model with a already fitted classifier and new data.
+
+    Args:
+        X (array): X-array containing variable values.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        root_dir (str): path to location of cfg-file.
+        bundle (dict, optional): model bundle with fitted scaler and classifier. If None, it is loaded from the file specified in the cfg-file. Defaults to None.
 
     Raises:
         ValueError: raised if another model type than the one using all data is specified in cfg-file.
@@ -141,6 +628,184 @@ def run_prediction(X, scaler, config, root_dir):
     if config.getint('general', 'model') != 1:
         raise ValueError('ERROR: making a prediction is only possible with model type 1, i.e. using all data')
 
-    y_df = models.predictive(X, scaler, config, root_dir)
+    y_df = models.predictive(X, config, root_dir, bundle=bundle)
+
+    return y_df
+
+
+def run_prediction_stream(config, out_dir, root_dir, polygon_gdf, bundle=None, polygon_cells=None):
+    """Top-level function to run a predictive model with a already fitted classifier, whereby the projection period is processed one year at a time.
+    For each year, the variable values are read, scaled, and predicted. The predictions and probabilities of conflict are appended to file ``projection_per_year.csv`` in the output folder,
+    and only the counts per polygon are kept in memory. As such, the memory used does not grow with the length of the projection period.
+    The X-data of each year is stored to ``X_per_year.npz`` in the output folder, see 'data.save_X_year()'.
+    If such a file was pre-computed and specified in cfg-file, the X-data is read from it one year at a time instead.
+    A pre-computed X-array of a projection run without streaming (npy-file) is loaded at once and sliced per year.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        out_dir (str): path to output folder.
+        root_dir (str): path to location of cfg-file.
+        polygon_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
+        bundle (dict, optional): model bundle with fitted scaler and classifier. If None, it is loaded from the file specified in the cfg-file. Defaults to None.
+        polygon_cells (dict, optional): cache with the cells per set of polygons and raster grid, see 'variables.get_polygon_cells()'. If None, a cache is used for this call only. Defaults to None.
+
+    Raises:
+        ValueError: raised if another model type than the one using all data is specified in cfg-file.
+        ValueError: raised if the number of data points of a pre-computed npy-file is not a multiple of the number of simulation years.
+
+    Returns:
+        dataframe: counts of predictions, predicted conflicts, and sum of conflict probabilities per polygon.
+    """  
+
+    if config.getint('general', 'model') != 1:
+        raise ValueError('ERROR: making a prediction is only possible with model type 1, i.e. using all data')
+
+    if bundle is None:
+        bundle = machine_learning.load_model_bundle(config, root_dir)
+
+    model_period = np.arange(config.getint('settings', 'y_start'), config.getint('settings', 'y_end') + 1, 1)
+
+    if polygon_cells is None:
+        polygon_cells = {}
+
+    X_all, X_file = None, None
+    if config.get('pre_calc', 'X', fallback='') != '':
+        X_file = os.path.join(root_dir, config.get('pre_calc', 'X'))
+        if X_file.endswith('.npz'):
+            print('INFO: reading X data per year from file {}'.format(X_file))
+        else:
+            ##- object-arrays cannot be memory-mapped, hence the entire file needs to be loaded
+            print('WARNING: loading all X data from file {}, provide X_per_year.npz of a streamed projection run to read one year at a time'.format(X_file))
+            X_all = np.load(X_file, allow_pickle=True)
+            if len(X_all) % len(model_period) != 0:
+                raise ValueError('ERROR: the number of data points {} is not a multiple of the number of simulation years {}'.format(len(X_all), len(model_period)))
+            ##- the rows of each simulation year are stacked, hence the data of one year are found in one slice
+            n_rows_year = len(X_all) // len(model_period)
+    else:
+        fo_X = os.path.join(out_dir, 'X_per_year.npz')
+        if os.path.isfile(fo_X):
+            os.remove(fo_X)
+        print('INFO: saving X data per year by default to file {}'.format(fo_X))
+
+    fo = os.path.join(out_dir, 'projection_per_year.csv')
+    if os.path.isfile(fo):
+        os.remove(fo)
+    print('INFO: writing projections per year to file {}'.format(fo))
+
+    count_df = evaluation.init_proj_count()
+
+    for i, sim_year in enumerate(model_period):
+
+        if X_all is not None:
+            X = X_all[i*n_rows_year:(i+1)*n_rows_year]
+        elif X_file is not None:
+            X = data.load_X_year(X_file, sim_year)
+        else:
+            X = data.fill_XY(data.initiate_X_data(config), config, root_dir, None, polygon_gdf, sim_years=[sim_year], polygon_cells=polygon_cells)
+            data.save_X_year(X, fo_X, sim_year)
+
+        y_df = models.predictive(X, config, root_dir, bundle=bundle)
+
+        y_df = y_df.drop('geometry', axis=1)
+        y_df.insert(0, 'year', sim_year)
+        y_df.to_csv(fo, mode='a', header=(i == 0), index=False)
+
+        count_df = evaluation.fill_proj_count(count_df, y_df)
+
+    return count_df
+
+def run_projection(config, out_dir, root_dir, polygon_gdf, global_df, bundle=None, n_threads=None, polygon_cells=None):
+    """Top-level function to make one projection run, i.e. reading the variable values, making the projection, and determining the output per polygon.
+    In gridded mode, the output is determined per cell instead, see 'grid.predict_grid()'.
+    If the number of cores is specified, it is set in a copy of the configuration and of the classifiers in the model bundle, such that neither the configuration 
+    nor the (shared) model bundle of the caller is modified.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the projection run.
+        out_dir (str): path to output folder of the projection run.
+        root_dir (str): path to location of cfg-file of the projection run.
+        polygon_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
+        global_df (dataframe): global look-up dataframe to associate unique identifier with geometry.
+        bundle (dict, optional): model bundle with fitted scaler and classifier. If None, it is loaded from the file specified in the cfg-file. Defaults to None.
+        n_threads (int, optional): number of cores available to this projection run. If None, the core budget of the cfg-file is used. Defaults to None.
+        polygon_cells (dict, optional): cache with the cells per set of polygons and raster grid, see 'variables.get_polygon_cells()'. Defaults to None.
+
+    Returns:
+        (geo-)dataframe: dataframe and geo-dataframe with data per polygon; in gridded mode, dataset with data per cell.
+    """
+
+    if n_threads is not None:
+        config = copy.deepcopy(config)
+        if not config.has_section('compute'): config.add_section('compute')
+        config.set('compute', 'n_cores', str(n_threads))
+
+        if bundle is None:
+            bundle = machine_learning.load_model_bundle(config, root_dir)
+        ##- shallow copies, such that the fitted classifiers are shared but their number of threads is set per projection run
+        bundle = dict(bundle)
+        if bundle['clf'] is not None:
+            bundle['clf'] = compute.set_n_jobs(copy.copy(bundle['clf']), n_threads)
+        if bundle.get('ensemble') is not None:
+            bundle['ensemble'] = [member if isinstance(member, dict) else compute.set_n_jobs(copy.copy(member), n_threads) for member in bundle['ensemble']]
+
+    if config.getboolean('settings', 'gridded', fallback=False):
+
+        if bundle is None:
+            bundle = machine_learning.load_model_bundle(config, root_dir)
+
+        return grid.predict_grid(config, root_dir, polygon_gdf, bundle['scaler'], bundle['clf'], out_dir, negative_fraction=bundle['negative_fraction'])
+
+    #- either process the projection period year by year, or all years at once
+    if config.getboolean('settings', 'stream_projection', fallback=False):
+
+        count_df = run_prediction_stream(config, out_dir, root_dir, polygon_gdf, bundle=bundle, polygon_cells=polygon_cells)
+
+        df_hit, gdf_hit = evaluation.polygon_projection(count_df, global_df, out_dir=out_dir)
+
+    else:
+
+        X = create_X(config, out_dir, root_dir, polygon_gdf, polygon_cells=polygon_cells)
+
+        y_df = run_prediction(X, config, root_dir, bundle=bundle)
+
+        df_hit, gdf_hit = evaluation.polygon_model_accuracy(y_df, global_df, out_dir=out_dir, make_proj=True)
+
+    return df_hit, gdf_hit
+
+def run_projections(config, projection_setups, polygon_gdf, global_df):
+    """Top-level function to make multiple projection runs concurrently.
+    Each model bundle is loaded only once and shared read-only by all projection runs using it. 
+    The projection runs are executed by a pool of threads, such that also the raster cells per polygon are shared between them, see 'variables.get_polygon_cells()'. 
+    This cache is discarded once all projection runs are finished.
+    The core budget of the reference run is split between concurrent projection runs and cores per projection run.
+    Each projection run sets the number of threads of its own copy of the classifiers, and the threads of BLAS and OpenMP libraries are limited for all projection runs at once.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the reference run.
+        projection_setups (list): list with parsed configuration, output folder, and location of cfg-file per projection run, see 'utils.initiate_setup()'.
+        polygon_gdf (geo-dataframe): geo-dataframe containing the selected polygons.
+        global_df (dataframe): global look-up dataframe to associate unique identifier with geometry.
+
+    Returns:
+        list: dataframe and geo-dataframe with data per polygon for each projection run.
+    """
+
+    ##- load each model bundle, including the classifiers of all repetitions if specified, once
+    bundles, keys = {}, []
+    for proj_config, out_dir, root_dir in projection_setups:
+        key = tuple(os.path.abspath(os.path.join(root_dir, proj_config.get('pre_calc', option, fallback=''))) for option in ['clf', 'ensemble'])
+        if key not in bundles:
+            bundles[key] = machine_learning.load_model_bundle(proj_config, root_dir)
+        keys.append(key)
+
+    polygon_cells = {}
+
+    n_workers, n_threads = compute.schedule(config, len(projection_setups))
+    print('INFO: executing {} projection runs with {} worker(s) and {} core(s) per worker'.format(len(projection_setups), n_workers, n_threads))
+
+    ##- the thread limits apply to the entire process, hence they are set once for all threads executing projection runs
+    with compute.limit_threads(n_threads):
+        results = Parallel(n_jobs=n_workers, prefer='threads')(delayed(run_projection)(proj_config, out_dir, root_dir, polygon_gdf, global_df, bundle=bundles[key], n_threads=n_threads, polygon_cells=polygon_cells) 
+                                                               for (proj_config, out_dir, root_dir), key in zip(projection_setups, keys))
 
-    return y_df
\ No newline at end of file
+    return results
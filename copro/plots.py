@@ -114,29 +114,36 @@ def polygon_categorization(gdf, category='sub', method='median', **kwargs):
 
     return ax
 
-def plot_ROC_curve_n_times(ax, clf, X_test, y_test, tprs, aucs, mean_fpr, **kwargs):
+def plot_ROC_curve_n_times(ax, clf, X_test, y_test, tprs, aucs, mean_fpr, y_prob=None, **kwargs):
     """Plots the ROC-curve per model simulation to a pre-initiated matplotlib-instance.
+    If the probabilities of conflict are already known, the classifier is not needed anymore.
 
     Args:
         ax (axis): axis of pre-initaited matplotlib-instance
-        clf (classifier): sklearn-classifier used in the simulation.
-        X_test (array): array containing test-sample variable values.
+        clf (classifier): sklearn-classifier used in the simulation. Can be None if y_prob is provided.
+        X_test (array): array containing test-sample variable values. Can be None if y_prob is provided.
         y_test (list): list containing test-sample conflict data.
         tprs (list): list with false positive rates.
         aucs (list): list with area-under-curve values.
         mean_fpr (array): array with mean false positive rate.
+        y_prob (list, optional): list containing the predicted probability of conflict. Defaults to None.
 
     Returns:
         list: lists with true positive rates and area-under-curve values per plot.
     """    
 
-    viz = metrics.plot_roc_curve(clf, X_test, y_test, ax=ax,
-                            	 alpha=0.15, color='b', lw=1, label=None, **kwargs)
+    if y_prob is None:
+        y_prob = clf.predict_proba(X_test)[:, 1]
 
-    interp_tpr = np.interp(mean_fpr, viz.fpr, viz.tpr)
+    fpr, tpr, _ = metrics.roc_curve(y_test, y_prob)
+    roc_auc = metrics.auc(fpr, tpr)
+
+    ax.plot(fpr, tpr, alpha=0.15, color='b', lw=1, **kwargs)
+
+    interp_tpr = np.interp(mean_fpr, fpr, tpr)
     interp_tpr[0] = 0.0
     tprs.append(interp_tpr)
-    aucs.append(viz.roc_auc)
+    aucs.append(roc_auc)
 
     return tprs, aucs
 
@@ -167,11 +174,12 @@ def plot_ROC_curve_n_mean(ax, tprs, aucs, mean_fpr, **kwargs):
 
     ax.legend(loc="lower right")
 
-def factor_importance(clf, config, out_dir=None, **kwargs):
-    """Plots the relative importance of each factor as bar plot. Note, this works only for RFClassifier as ML-model!
+def factor_importance(importances, config, out_dir=None, **kwargs):
+    """Plots the importance of each factor as bar plot, with the standard deviation across all repetitions and permutations as error bars.
+    See 'evaluation.get_feature_importance()' for details.
 
     Args:
-        clf (classifier): sklearn-classifier used in the simulation.
+        importances (array): feature importance per repetition, feature, and permutation.
         config (ConfigParser-object): object containing the parsed configuration-settings of the model.
         out_dir (str): path to output folder. If None, output is not saved.
 
@@ -182,9 +190,9 @@ def factor_importance(clf, config, out_dir=None, **kwargs):
         ax: Matplotlib axis object.
     """    
 
-    df = evaluation.get_feature_importance(clf, config, out_dir)
+    df = evaluation.get_feature_importance(importances, config, out_dir)
 
-    ax = df.plot.bar(**kwargs)
+    ax = df.feature_importance.plot.bar(yerr=df['std'], **kwargs)
 
     return ax
     
@@ -0,0 +1,70 @@
+import click
+import configparser
+import time
+import numpy as np
+import pandas as pd
+from sklearn import datasets, metrics, model_selection, preprocessing
+from copro import machine_learning
+
+def create_fake_config(model):
+
+    config = configparser.ConfigParser()
+
+    config.add_section('general')
+    config.set('general', 'verbose', str(False))
+    config.add_section('machine_learning')
+    config.set('machine_learning', 'model', model)
+
+    return config
+
+@click.command()
+@click.option('-n', '--n-samples', help='number of data points, i.e. polygons times years', default=100000, type=int)
+@click.option('-f', '--n-features', help='number of variables', default=4, type=int)
+@click.option('-m', '--models', help='comma-separated list of models to compare', default='RFClassifier,HistGradientBoostingClassifier')
+@click.option('-o', '--output-file', help='path to csv-file to store results', default=None, type=click.Path())
+
+def main(n_samples=100000, n_features=4, models='RFClassifier,HistGradientBoostingClassifier', output_file=None):
+    """Compares fit and predict throughput as well as scores of the supported classifiers on synthetic, imbalanced XY-data.
+    The fraction of conflict data points is set to roughly 5 percent, similar to observed data. 
+    As in the model, the variable values are scaled with a QuantileTransformer.
+    """
+
+    X, Y = datasets.make_classification(n_samples=n_samples, n_features=n_features, n_informative=n_features, n_redundant=0, 
+                                        weights=[0.95], random_state=42)
+    X = preprocessing.QuantileTransformer(random_state=42).fit_transform(X)
+    X_train, X_test, y_train, y_test = model_selection.train_test_split(X, Y, test_size=0.3, random_state=42)
+
+    results = []
+
+    for model in models.rsplit(','):
+
+        clf = machine_learning.define_model(create_fake_config(model))
+        click.echo('benchmarking {} with {} data points'.format(model, n_samples))
+
+        t0 = time.perf_counter()
+        machine_learning.fit_clf(clf, X_train, y_train)
+        t_fit = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        y_pred = clf.predict(X_test)
+        y_prob = clf.predict_proba(X_test)
+        t_predict = time.perf_counter() - t0
+
+        results.append({'model': model,
+                        'fit time [s]': t_fit,
+                        'fit throughput [samples/s]': len(X_train) / t_fit,
+                        'predict time [s]': t_predict,
+                        'predict throughput [samples/s]': len(X_test) / t_predict,
+                        'F1 score': metrics.f1_score(y_test, y_pred),
+                        'ROC AUC score': metrics.roc_auc_score(y_test, y_prob[:, 1])})
+
+    df = pd.DataFrame(results).set_index('model')
+    click.echo(df.to_string())
+
+    if output_file is not None:
+        click.echo('saving results to {}'.format(output_file))
+        df.to_csv(output_file)
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,112 @@
+import click
+import configparser
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from sklearn import datasets
+from shapely.geometry import Point
+from copro import machine_learning, data
+
+def create_fake_config(model, dtype):
+
+    config = configparser.ConfigParser()
+
+    config.add_section('general')
+    config.set('general', 'verbose', str(False))
+    config.add_section('machine_learning')
+    config.set('machine_learning', 'scaler', 'QuantileTransformer')
+    config.set('machine_learning', 'model', model)
+    config.set('machine_learning', 'negative_fraction', str(1))
+    config.add_section('compute')
+    config.set('compute', 'dtype', dtype)
+
+    return config
+
+def create_fake_data(n_samples, n_features):
+
+    X_data, Y = datasets.make_classification(n_samples=n_samples, n_features=n_features, n_informative=n_features, n_redundant=0, 
+                                             weights=[0.95], random_state=42)
+
+    return X_data, Y
+
+def create_fake_XY(X_data, Y):
+
+    ##- same layout as the XY-array of the model, i.e. ID and geometry followed by the variable values and conflict data in one object-array
+    ##- as in 'data.fill_XY()', each value is stored as separate Python object
+    XY = np.empty((len(X_data), X_data.shape[1] + 3), dtype=object)
+    XY[:, 0] = (np.arange(len(X_data)) % 1000).tolist()
+    XY[:, 1] = Point(0, 0)
+    XY[:, 2:-1] = X_data.tolist()
+    XY[:, -1] = Y.tolist()
+
+    return XY
+
+@click.command()
+@click.option('-n', '--n-samples', help='number of data points, i.e. polygons times years', default=500000, type=int)
+@click.option('-f', '--n-features', help='number of variables', default=4, type=int)
+@click.option('-m', '--model', help='model to be fitted', default='RFClassifier')
+@click.option('-o', '--output-file', help='path to csv-file to store results', default=None, type=click.Path())
+
+def main(n_samples=500000, n_features=4, model='RFClassifier', output_file=None):
+    """Compares peak memory and run time of creating the XY-array, scaling, and fitting with variable values in float64 and float32 precision on synthetic XY-data.
+    Memory is traced with tracemalloc from the construction of the XY-array onwards, i.e. it covers the Python objects of the XY-array as well as the allocations made by numpy and scikit-learn.
+    Note that the precision only applies to the scaled variable values, as the XY-array stores each value as Python object regardless of the precision.
+    """
+
+    X_data, Y_data = create_fake_data(n_samples, n_features)
+
+    results = []
+
+    for dtype in ['float64', 'float32']:
+
+        config = create_fake_config(model, dtype)
+        scaler = machine_learning.define_scaling(config)
+        clf = machine_learning.define_model(config)
+        if 'n_estimators' in clf.get_params():
+            clf.set_params(n_estimators=100)
+        click.echo('benchmarking {} with {} data points in {}'.format(model, n_samples, dtype))
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+
+        XY = create_fake_XY(X_data, Y_data)
+        size_XY, peak_XY = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        X, Y = data.split_XY_data(XY, config)
+        del XY
+        _, peak_split = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        X_ft = machine_learning.scale_X(X, config, scaler)
+        _, peak_scale = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        machine_learning.fit_clf(clf, X_ft, Y)
+        _, peak_fit = tracemalloc.get_traced_memory()
+
+        t_total = time.perf_counter() - t0
+        tracemalloc.stop()
+
+        results.append({'dtype': dtype,
+                        'XY size [MB]': size_XY / 1e6,
+                        'X_ft size [MB]': X_ft.nbytes / 1e6,
+                        'peak memory XY creation [MB]': peak_XY / 1e6,
+                        'peak memory splitting [MB]': peak_split / 1e6,
+                        'peak memory scaling [MB]': peak_scale / 1e6,
+                        'peak memory fitting [MB]': peak_fit / 1e6,
+                        'run time [s]': t_total})
+
+        del X, Y, X_ft, clf
+
+    df = pd.DataFrame(results).set_index('dtype')
+    click.echo(df.to_string())
+
+    if output_file is not None:
+        click.echo('saving results to {}'.format(output_file))
+        df.to_csv(output_file)
+
+if __name__ == '__main__':
+
+    main()
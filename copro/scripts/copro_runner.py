@@ -13,12 +13,14 @@ warnings.filterwarnings("ignore")
 @click.argument('cfg', type=click.Path())
 @click.option('--projection-settings', '-proj', help='path to cfg-file with settings for a projection run', multiple=True, type=click.Path())
 @click.option('--verbose', '-v', help='command line switch to turn on verbose mode', is_flag=True)
+@click.option('--tune', '-t', help='command line switch to only tune the parameters of the classifier', is_flag=True)
 
-def cli(cfg, projection_settings=[], verbose=False):   
+def cli(cfg, projection_settings=[], verbose=False, tune=False):   
     """Main command line script to execute the model. 
     All settings are read from cfg-file.
     One cfg-file is required argument to train, test, and evaluate the model.
     Additional cfg-files can be provided as optional arguments, whereby each file corresponds to one projection to be made.
+    In tune mode, only the parameters of the classifier are tuned with the search space specified in the cfg-file.
 
     Args:
         CFG (str): (relative) path to cfg-file
@@ -40,84 +42,147 @@ def cli(cfg, projection_settings=[], verbose=False):
     copro.plots.selected_conflicts(conflict_gdf, ax=ax)
     plt.savefig(os.path.join(out_dir, 'selected_polygons_and_conflicts.png'), dpi=300, bbox_inches='tight')
 
-    #- create X and Y arrays by reading conflict and variable files;
-    #- or by loading a pre-computed array (npy-file)
-    X, Y = copro.pipeline.create_XY(config, out_dir, root_dir, extent_active_polys_gdf, conflict_gdf)
+    #- in out-of-core mode, the XY-data is streamed from disk and never held in memory at once;
+    #- the gridded mode always runs out-of-core, as each cell-year is a data point
+    if config.getboolean('settings', 'out_of_core', fallback=False) or config.getboolean('settings', 'gridded', fallback=False):
 
-    #- defining scaling and model algorithms
-    scaler, clf = copro.pipeline.prepare_ML(config)
+        #- settings which are not supported in out-of-core mode raise an error before any data is read
+        copro.pipeline.check_out_of_core(config, tune=tune)
 
-    #- initializing output variables
-    #TODO: put all this into one function
-    out_X_df = copro.evaluation.init_out_df()
-    out_y_df = copro.evaluation.init_out_df()
-    out_dict = copro.evaluation.init_out_dict()
-    trps, aucs, mean_fpr = copro.evaluation.init_out_ROC_curve()
+        #- defining scaling and model algorithms
+        scaler, clf = copro.pipeline.prepare_ML(config)
 
-    #- create plot instance for ROC plots
-    fig, ax1 = plt.subplots(1, 1, figsize=(20,10))
+        #- create memory-mapped XY-data, which is re-used for the predictions per cell in gridded mode
+        XY = copro.pipeline.create_XY_memmap(config, out_dir, root_dir, extent_active_polys_gdf, conflict_gdf)
 
-    click.echo('INFO: training and testing machine learning model')
-    #- go through all n model executions
-    for n in range(config.getint('settings', 'n_runs')):
-        
-        click.echo('INFO: run {} of {}'.format(n+1, config.getint('settings', 'n_runs')))
+        click.echo('INFO: training and testing machine learning model out-of-core')
+        out_dict, clf = copro.pipeline.run_reference_out_of_core(config, out_dir, root_dir, extent_active_polys_gdf, conflict_gdf, scaler, clf, XY=XY)
 
-        #- run machine learning model and return outputs
-        X_df, y_df, eval_dict = copro.pipeline.run_reference(X, Y, config, scaler, clf, out_dir)
-        
-        #- append per model execution
-        #TODO: put all this into one function
-        out_X_df = copro.evaluation.fill_out_df(out_X_df, X_df)
-        out_y_df = copro.evaluation.fill_out_df(out_y_df, y_df)
-        out_dict = copro.evaluation.fill_out_dict(out_dict, eval_dict)
-
-        #- plot ROC curve per model execution
-        tprs, aucs = copro.plots.plot_ROC_curve_n_times(ax1, clf, X_df.to_numpy(), y_df.y_test.to_list(),
-                                                                    trps, aucs, mean_fpr)
-
-    #- plot mean ROC curve
-    copro.plots.plot_ROC_curve_n_mean(ax1, tprs, aucs, mean_fpr)
-    #- save plot
-    plt.savefig(os.path.join(out_dir, 'ROC_curve_per_run.png'), dpi=300, bbox_inches='tight')
-    #- save data for plot
-    copro.evaluation.save_out_ROC_curve(tprs, aucs, out_dir)
-
-    #- save output dictionary to csv-file
-    copro.utils.save_to_csv(out_dict, out_dir, 'evaluation_metrics')
-    copro.utils.save_to_npy(out_y_df, out_dir, 'raw_output_data')
-    
-    #- print mean values of all evaluation metrics
-    for key in out_dict:
-        if config.getboolean('general', 'verbose'):
-            click.echo('DEBUG: average {0} of run with {1} repetitions is {2:0.3f}'.format(key, config.getint('settings', 'n_runs'), np.mean(out_dict[key])))
+        #- save output dictionary to csv-file
+        copro.utils.save_to_csv(out_dict, out_dir, 'evaluation_metrics')
 
-    # create accuracy values per polygon and save to output folder
-    df_hit, gdf_hit = copro.evaluation.polygon_model_accuracy(out_y_df, global_df, out_dir)
+        #- plot distribution of all evaluation metrics
+        fig, ax = plt.subplots(1, 1)
+        copro.plots.metrics_distribution(out_dict, figsize=(20, 10))
+        plt.savefig(os.path.join(out_dir, 'metrics_distribution.png'), dpi=300, bbox_inches='tight')
 
-    #- plot distribution of all evaluation metrics
-    fig, ax = plt.subplots(1, 1)
-    copro.plots.metrics_distribution(out_dict, figsize=(20, 10))
-    plt.savefig(os.path.join(out_dir, 'metrics_distribution.png'), dpi=300, bbox_inches='tight')
+        #- in gridded mode, store predictions of the classifier fitted with all data as rasters
+        if config.getboolean('settings', 'gridded', fallback=False):
+            copro.grid.predict_grid(config, root_dir, extent_active_polys_gdf, scaler, clf, out_dir, XY=XY)
 
-    clf = copro.machine_learning.pickle_clf(scaler, clf, config, root_dir)
-    #- plot relative importance of each feature based on ALL data points
-    fig, ax = plt.subplots(1, 1)
-    copro.plots.factor_importance(clf, config, out_dir=out_dir, ax=ax, figsize=(20, 10))
-    plt.savefig(os.path.join(out_dir, 'feature_importances.png'), dpi=300, bbox_inches='tight')
+    else:
+
+        #- create X and Y arrays by reading conflict and variable files;
+        #- or by loading a pre-computed array (npy-file)
+        #- the simulation year per data point is only needed for temporal evaluation
+        if config.get('settings', 'evaluation', fallback='split') == 'temporal':
+            X, Y, years = copro.pipeline.create_XY(config, out_dir, root_dir, extent_active_polys_gdf, conflict_gdf, return_years=True)
+        else:
+            X, Y = copro.pipeline.create_XY(config, out_dir, root_dir, extent_active_polys_gdf, conflict_gdf)
+            years = None
+
+        #- defining scaling and model algorithms
+        scaler, clf = copro.pipeline.prepare_ML(config)
+
+        #- initializing output variables
+        #TODO: put all this into one function
+        out_X_df = copro.evaluation.init_out_df()
+        out_y_df = copro.evaluation.init_out_df()
+        out_dict = copro.evaluation.init_out_dict()
+        trps, aucs, mean_fpr = copro.evaluation.init_out_ROC_curve()
+
+        #- create plot instance for ROC plots
+        fig, ax1 = plt.subplots(1, 1, figsize=(20,10))
+
+        click.echo('INFO: training and testing machine learning model')
+        #- scale variable values once, all model executions re-use them
+        X_ft = copro.machine_learning.scale_X(X, config, scaler)
+
+        #- in tune mode, search best parameters and stop
+        if tune:
+            copro.machine_learning.tune_model(X_ft, Y, config, clf, out_dir)
+            click.echo('INFO: tuning succesfully finished')
+            return
+
+        #- in variable ablation mode, evaluate all subsets of variables and stop
+        if config.getint('general', 'model') in [2, 3]:
+            copro.pipeline.run_ablation(X, Y, config, scaler, clf, out_dir, X_ft=X_ft)
+            click.echo('INFO: variable ablation succesfully finished')
+            return
+
+        #- in dubbelsteen mode, evaluate all replicates with reshuffled conflict data and stop
+        if config.getint('general', 'model') == 4:
+            copro.pipeline.run_dubbelsteen(X, Y, config, scaler, clf, out_dir, X_ft=X_ft)
+            click.echo('INFO: dubbelsteen model succesfully finished')
+            return
+
+        #- execute all n model executions, possibly in parallel
+        results, importances = copro.pipeline.run_reference_n_times(X, Y, config, scaler, clf, out_dir, X_ft=X_ft, years=years, return_importances=True)
+
+        #- merge outputs in order of model executions
+        for n, (X_df, y_df, eval_dict) in enumerate(results):
+        
+            click.echo('INFO: run {} of {}'.format(n+1, len(results)))
+
+            #- append per model execution
+            #TODO: put all this into one function
+            out_X_df = copro.evaluation.fill_out_df(out_X_df, X_df)
+            out_y_df = copro.evaluation.fill_out_df(out_y_df, y_df)
+            out_dict = copro.evaluation.fill_out_dict(out_dict, eval_dict)
+
+            #- plot ROC curve per model execution
+            tprs, aucs = copro.plots.plot_ROC_curve_n_times(ax1, None, None, y_df.y_test.to_list(),
+                                                            trps, aucs, mean_fpr, y_prob=y_df.y_prob.to_list())
+
+        #- plot mean ROC curve
+        copro.plots.plot_ROC_curve_n_mean(ax1, tprs, aucs, mean_fpr)
+        #- save plot
+        plt.savefig(os.path.join(out_dir, 'ROC_curve_per_run.png'), dpi=300, bbox_inches='tight')
+        #- save data for plot
+        copro.evaluation.save_out_ROC_curve(tprs, aucs, out_dir)
+
+        #- save output dictionary to csv-file
+        copro.utils.save_to_csv(out_dict, out_dir, 'evaluation_metrics')
+        copro.utils.save_to_npy(out_y_df, out_dir, 'raw_output_data')
+
+        #- test whether model performs significantly better than a random baseline
+        copro.evaluation.evaluate_significance(results, out_dir)
+    
+        #- print mean values of all evaluation metrics
+        for key in out_dict:
+            if config.getboolean('general', 'verbose'):
+                click.echo('DEBUG: average {0} of run with {1} repetitions is {2:0.3f}'.format(key, len(results), np.mean(out_dict[key])))
+
+        # create accuracy values per polygon and save to output folder
+        df_hit, gdf_hit = copro.evaluation.polygon_model_accuracy(out_y_df, global_df, out_dir)
+
+        #- plot distribution of all evaluation metrics
+        fig, ax = plt.subplots(1, 1)
+        copro.plots.metrics_distribution(out_dict, figsize=(20, 10))
+        plt.savefig(os.path.join(out_dir, 'metrics_distribution.png'), dpi=300, bbox_inches='tight')
+
+        #- fit classifier with all data, re-using the scaled data of the reference run
+        clf = copro.machine_learning.pickle_clf(scaler, clf, config, root_dir, X_ft=X_ft, Y=Y)
+        #- plot importance of each feature determined during the repetitions
+        if importances is not None:
+            fig, ax = plt.subplots(1, 1)
+            copro.plots.factor_importance(importances, config, out_dir=out_dir, ax=ax, figsize=(20, 10))
+            plt.savefig(os.path.join(out_dir, 'feature_importances.png'), dpi=300, bbox_inches='tight')
+
+        #- if specified, determine the global sensitivity of the classifier fitted with all data
+        if config.get('settings', 'sensitivity_analysis', fallback='') != '':
+            copro.sensitivity.sensitivity_analysis(X_ft, clf, config, out_dir)
 
     click.echo('INFO: reference run succesfully finished')
 
     if projection_settings is not []:
 
+        projection_setups = []
         for proj in projection_settings:
 
             click.echo(click.style('\nINFO: projection run started, based on {}'.format(os.path.abspath(proj)), fg='cyan'))
 
-            config, out_dir, root_dir = copro.utils.initiate_setup(proj)
-
-            X = copro.pipeline.create_X(config, out_dir, root_dir, extent_active_polys_gdf)
-
-            y_df = copro.pipeline.run_prediction(X, scaler, config, root_dir)
+            projection_setups.append(copro.utils.initiate_setup(proj))
 
-            df_hit, gdf_hit = copro.evaluation.polygon_model_accuracy(y_df, global_df, out_dir=out_dir, make_proj=True)
\ No newline at end of file
+        #- projection runs are executed concurrently, sharing the loaded model bundle
+        copro.pipeline.run_projections(config, projection_setups, extent_active_polys_gdf, global_df)
@@ -0,0 +1,201 @@
+import os
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from copro import machine_learning, compute
+
+def to_quantiles(U, X_ft):
+    """Maps samples in the unit hypercube to variable values, using the empirical quantiles of each variable.
+    Thereby, the perturbed samples follow the distribution of the reference data per variable, regardless of the scaler used.
+    Each variable is sorted only once, hence this is fast also for the entire XY-data.
+
+    Args:
+        U (array): samples in the unit hypercube, with one column per variable.
+        X_ft (array): scaled variable values of all data points.
+
+    Returns:
+        array: scaled variable values of the samples.
+    """
+
+    X = np.empty(U.shape, dtype=X_ft.dtype)
+    for j in range(U.shape[1]):
+        X[:, j] = np.nanquantile(X_ft[:, j], U[:, j])
+
+    return X
+
+def sobol_sample(n_samples, n_vars, random_state=None):
+    """Creates the samples needed to estimate the Sobol' indices of all variables at once.
+    Two independent sample matrices A and B are drawn, and for each variable a matrix AB in which this variable is taken from B and all others from A.
+    All matrices are stacked into one array with n_samples * (n_vars + 2) rows.
+
+    Args:
+        n_samples (int): number of rows of each sample matrix.
+        n_vars (int): number of variables.
+        random_state (int, optional): seed used to draw the samples. Defaults to None.
+
+    Returns:
+        array: samples in the unit hypercube, ordered as A, B, AB of the first variable, AB of the second variable, etc.
+    """
+
+    rng = np.random.default_rng(random_state)
+    A, B = rng.random((n_samples, n_vars)), rng.random((n_samples, n_vars))
+
+    AB = np.repeat(A[np.newaxis], n_vars, axis=0)
+    AB[np.arange(n_vars), :, np.arange(n_vars)] = B.T
+
+    return np.vstack((A, B, AB.reshape(-1, n_vars)))
+
+def sobol_indices(y, n_samples, n_vars):
+    """Estimates the first-order and total Sobol' indices from the model output of the samples created with 'sensitivity.sobol_sample()'.
+    The first-order index is estimated after Saltelli et al. (2010), the total index after Jansen (1999).
+
+    Args:
+        y (array): model output per sample.
+        n_samples (int): number of rows of each sample matrix.
+        n_vars (int): number of variables.
+
+    Returns:
+        dataframe: first-order ('S1') and total ('ST') index per variable.
+    """
+
+    y_A, y_B, y_AB = y[:n_samples], y[n_samples:2*n_samples], y[2*n_samples:].reshape(n_vars, n_samples)
+
+    var = np.var(np.concatenate((y_A, y_B)))
+    if var == 0:
+        return pd.DataFrame({'S1': np.zeros(n_vars), 'ST': np.zeros(n_vars)})
+
+    S1 = np.mean(y_B * (y_AB - y_A), axis=1) / var
+    ST = 0.5 * np.mean((y_A - y_AB) ** 2, axis=1) / var
+
+    return pd.DataFrame({'S1': S1, 'ST': ST})
+
+def morris_sample(n_trajectories, n_vars, n_levels=4, random_state=None):
+    """Creates the trajectories needed to estimate the elementary effects of all variables after Morris (1991).
+    Each trajectory starts at a random point of a grid with n_levels levels per variable, and changes one variable after the other by the same step in random order and direction.
+    All trajectories are created at once and stacked into one array with n_trajectories * (n_vars + 1) rows.
+
+    Args:
+        n_trajectories (int): number of trajectories.
+        n_vars (int): number of variables.
+        n_levels (int, optional): number of levels of the grid. Must be even. Defaults to 4.
+        random_state (int, optional): seed used to draw the trajectories. Defaults to None.
+
+    Returns:
+        array: samples in the unit hypercube.
+        array: variable changed per step of each trajectory.
+        array: change of this variable per step of each trajectory.
+    """
+
+    rng = np.random.default_rng(random_state)
+    delta = n_levels / (2 * (n_levels - 1))
+
+    #- start such that all steps stay within the unit hypercube
+    sign = rng.choice([-1, 1], size=(n_trajectories, n_vars))
+    start = rng.integers(0, n_levels // 2, size=(n_trajectories, n_vars)) / (n_levels - 1) + delta * (sign == -1)
+
+    order = np.argsort(rng.random((n_trajectories, n_vars)), axis=1)
+    steps = np.take_along_axis(sign, order, axis=1) * delta
+
+    U = np.repeat(start[:, np.newaxis], n_vars + 1, axis=1)
+    for k in range(n_vars):
+        U[np.arange(n_trajectories), k+1:, order[:, k]] += steps[:, k, np.newaxis]
+
+    return U.reshape(-1, n_vars), order, steps
+
+def morris_indices(y, order, steps):
+    """Estimates the elementary effects of all variables from the model output of the trajectories created with 'sensitivity.morris_sample()'.
+
+    Args:
+        y (array): model output per sample.
+        order (array): variable changed per step of each trajectory.
+        steps (array): change of this variable per step of each trajectory.
+
+    Returns:
+        dataframe: mean ('mu'), mean absolute ('mu_star'), and standard deviation ('sigma') of the elementary effects per variable.
+    """
+
+    n_trajectories, n_vars = order.shape
+
+    effects = np.empty((n_trajectories, n_vars))
+    np.put_along_axis(effects, order, np.diff(y.reshape(n_trajectories, n_vars + 1), axis=1) / steps, axis=1)
+
+    return pd.DataFrame({'mu': effects.mean(axis=0), 'mu_star': np.abs(effects).mean(axis=0), 'sigma': effects.std(axis=0)})
+
+def predict_batches(clf, X, config, batch_size=None):
+    """Predicts the probability of conflict of a large array of samples in batches.
+    The batches are predicted concurrently by a pool of threads sharing the classifier, with one thread per prediction.
+    If specified in the cfg-file, the probabilities are corrected for the undersampling of non-conflict data points.
+
+    Args:
+        clf (classifier): fitted sklearn-classifier.
+        X (array): scaled variable values of the samples.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        batch_size (int, optional): number of samples per batch. If None, it is read from the cfg-file. Defaults to None.
+
+    Returns:
+        array: probability of conflict per sample.
+    """
+
+    if batch_size is None:
+        batch_size = config.getint('settings', 'batch_size', fallback=100000)
+
+    clf = compute.set_n_jobs(clf, 1)
+    with compute.limit_threads(1):
+        y_prob = Parallel(n_jobs=compute.get_core_budget(config), prefer='threads')(delayed(clf.predict_proba)(X[start:start+batch_size])
+                                                                                   for start in range(0, len(X), batch_size))
+
+    return machine_learning.correct_probabilities(np.vstack(y_prob), config)[:, 1]
+
+def sensitivity_analysis(X_ft, clf, config, out_dir):
+    """Determines the global sensitivity of the predicted probability of conflict to each variable, using the classifier fitted with all data.
+    The samples are drawn from the distribution of each variable in the reference data, see 'sensitivity.to_quantiles()'.
+    Supported methods are 'sobol' (first-order and total Sobol' indices) and 'morris' (elementary effects).
+    The number of samples (sobol) or trajectories (morris) is specified in the cfg-file.
+    All samples are created as one array and predicted in batches, see 'sensitivity.predict_batches()'.
+    Returns dataframe and saves it to csv too.
+
+    Args:
+        X_ft (array): scaled variable values of all data points.
+        clf (classifier): fitted sklearn-classifier.
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+        out_dir (str): path to output folder. If 'None', no output is stored.
+
+    Raises:
+        ValueError: raised if an unsupported method is specified.
+
+    Returns:
+        dataframe: sensitivity indices per variable.
+    """
+
+    method = config.get('settings', 'sensitivity_analysis', fallback='')
+    n_samples = config.getint('settings', 'sensitivity_samples', fallback=1000)
+    seed = config.get('settings', 'seed', fallback='')
+    random_state = None if seed == '' else int(seed)
+
+    variables = [key for key, value in config.items('data')]
+    n_vars = len(variables)
+
+    if method == 'sobol':
+        U = sobol_sample(n_samples, n_vars, random_state=random_state)
+    elif method == 'morris':
+        U, order, steps = morris_sample(n_samples, n_vars, random_state=random_state)
+    else:
+        raise ValueError('ERROR: the specified sensitivity analysis method in the cfg-file is invalid - specify either sobol or morris')
+
+    print('INFO: {} sensitivity analysis with {} perturbed samples'.format(method, len(U)))
+
+    X = to_quantiles(U, np.asarray(X_ft, dtype=compute.get_dtype(config)))
+    y = predict_batches(clf, X, config)
+
+    if method == 'sobol':
+        df = sobol_indices(y, n_samples, n_vars)
+    else:
+        df = morris_indices(y, order, steps)
+    df.index = variables
+
+    if config.getboolean('general', 'verbose'): print('DEBUG: sensitivity indices per variable are' + os.linesep + '{}'.format(df))
+
+    if (out_dir != None) and isinstance(out_dir, str):
+        df.to_csv(os.path.join(out_dir, 'sensitivity_indices.csv'))
+
+    return df
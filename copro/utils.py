@@ -6,7 +6,6 @@ import urllib.request
 import zipfile
 from configparser import RawConfigParser
 from shutil import copyfile
-from sklearn import utils
 from datetime import date
 import click
 import copro
@@ -109,7 +108,7 @@ def make_output_dir(config, root_dir):
             if config.getboolean('general', 'verbose'): print('DEBUG: remove files in folder {}'.format(os.path.abspath(root)))
             for fo in files:
                 # print(fo)
-                if (fo == 'clf.pkl') or (fo =='XY.npy') or (fo == 'X.npy'):
+                if (fo == 'clf.pkl') or (fo == 'clf.joblib') or (fo == 'ensemble.joblib') or (fo =='XY.npy') or (fo == 'XY_data.npy') or (fo == 'X.npy'):
                     if config.getboolean('general', 'verbose'): print('DEBUG: sparing {}'.format(fo))
                     pass
                 else:
@@ -186,30 +185,60 @@ def initiate_setup(settings_file):
     if config['conflict']['conflict_file'] == 'download':
         download_PRIO(config)
 
-    if (config.getint('general', 'model') == 2) or (config.getint('general', 'model') == 3):
-        config.set('settings', 'n_runs', str(1))
-        print('INFOL changed nr of runs to {}'.format(config.getint('settings', 'n_runs')))
-
     return config, out_dir, root_dir
 
-def create_artificial_Y(Y):
+def create_artificial_Y(Y, random_state=None, n_replicates=None):
     """Creates an array with identical percentage of conflict points as input array.
+    Multiple replicates are created at once by shuffling each row of a tiled int8-array in place, such that only one byte per entry is used.
 
     Args:
         Y (array): original array containing binary conflict classifier data.
+        random_state (int, optional): seed used to shuffle the conflict data. Defaults to None.
+        n_replicates (int, optional): number of replicates with reshuffled conflict data. If None, one replicate is returned as 1-D array. Defaults to None.
 
     Returns:
-        array: array with reshuffled conflict classifier data.
+        array: array with reshuffled conflict classifier data, with one row per replicate if n_replicates is specified.
     """    
 
-    arr_1 = np.ones(len(np.where(Y != 0)[0]))
-    arr_0 = np.zeros(int(len(Y) - len(np.where(Y != 0)[0])))
-    Y_r_1 = np.append(arr_1, arr_0)
+    Y_r_1 = (np.asarray(Y) != 0).astype(np.int8)
+
+    rng = np.random.default_rng(random_state)
+    Y_r = np.tile(Y_r_1, (1 if n_replicates is None else n_replicates, 1))
+    for row in Y_r:
+        rng.shuffle(row)
 
-    Y_r = utils.shuffle(Y_r_1, random_state=42)
+    if n_replicates is None:
+        return Y_r[0]
 
     return Y_r
 
+def get_run_seeds(config):
+    """Derives one seed per model repetition from the master seed specified in the cfg-file.
+    The seeds are spawned from a numpy SeedSequence, such that each run obtains an independent but reproducible random stream,
+    regardless of whether the runs are executed sequentially or in parallel.
+    If no master seed is specified, one is drawn from the operating system and printed to allow reproducing the run.
+
+    Args:
+        config (ConfigParser-object): object containing the parsed configuration-settings of the model.
+
+    Returns:
+        list: list with one integer seed per model repetition.
+    """    
+
+    master_seed = config.get('settings', 'seed', fallback='')
+
+    if master_seed == '':
+        seed_seq = np.random.SeedSequence()
+        print('INFO: no master seed specified, using {}'.format(seed_seq.entropy))
+    else:
+        seed_seq = np.random.SeedSequence(int(master_seed))
+
+    seeds = [int(child.generate_state(1)[0]) for child in seed_seq.spawn(config.getint('settings', 'n_runs'))]
+
+    if config.getboolean('general', 'verbose'): print('DEBUG: seeds per run are {}'.format(seeds))
+
+    return seeds
+
 def global_ID_geom_info(gdf):
     """Retrieves unique ID and geometry information from geo-dataframe for a global look-up dataframe. 
     The IDs currently supported are 'name' or 'watprovID'.
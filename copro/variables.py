@@ -1,15 +1,140 @@
 import xarray as xr
 import rasterio as rio
+import rasterio.features
 import pandas as pd
 import geopandas as gpd
 import rasterstats as rstats
 import numpy as np
 import os, sys
+from joblib import Parallel, delayed
+from copro import compute
 
 import warnings
 warnings.filterwarnings("ignore")
 
-def nc_with_float_timestamp(extent_gdf, config, root_dir, var_name, sim_year, stat_func='mean'):
+def cells_in_polygon(geometry, affine, shape):
+    """Determines the raster cells of which the center lies within a polygon, i.e. the same cells as used by rasterstats.
+
+    Args:
+        geometry (shapely geometry): geometry of the polygon.
+        affine (Affine): affine transformation of the raster.
+        shape (tuple): number of rows and columns of the raster.
+
+    Returns:
+        array: flat indices of the cells within the polygon.
+    """
+
+    ##- limit the rasterization to the bounding box of the polygon
+    x_min, y_min, x_max, y_max = geometry.bounds
+    x, y = np.array([x_min, x_max, x_min, x_max]) - affine.c, np.array([y_min, y_min, y_max, y_max]) - affine.f
+    det = affine.a * affine.e - affine.b * affine.d
+    cols, rows = (affine.e * x - affine.b * y) / det, (affine.a * y - affine.d * x) / det
+    row_0, row_1 = max(int(np.floor(rows.min())), 0), min(int(np.ceil(rows.max())), shape[0])
+    col_0, col_1 = max(int(np.floor(cols.min())), 0), min(int(np.ceil(cols.max())), shape[1])
+
+    if (row_1 <= row_0) or (col_1 <= col_0):
+        return np.array([], dtype=np.int64)
+
+    window_affine = rio.Affine(affine.a, affine.b, affine.c + affine.a * col_0 + affine.b * row_0, 
+                               affine.d, affine.e, affine.f + affine.d * col_0 + affine.e * row_0)
+    mask = rio.features.geometry_mask([geometry], out_shape=(row_1 - row_0, col_1 - col_0), transform=window_affine, invert=True, all_touched=False)
+
+    rows, cols = np.nonzero(mask)
+
+    return (rows + row_0).astype(np.int64) * shape[1] + (cols + col_0)
+
+def get_polygon_cells(extent_gdf, affine, shape, config, polygon_cells=None):
+    """Returns the raster cells per polygon in extent_gdf, see 'variables.cells_in_polygon()'. 
+    If a cache is provided, the cells are computed once per set of polygons and raster grid and then re-used for all variables and years with the same grid.
+    The cache is owned by the caller, e.g. 'data.fill_XY()' or 'pipeline.run_projections()', such that it lives no longer than one extraction or set of projection runs.
+    The polygons are split into chunks which are processed by as many workers as the core budget in the cfg-file allows.
+
+    Args:
+        extent_gdf (geodataframe): geo-dataframe containing one or more polygons with geometry information.
+        affine (Affine): affine transformation of the raster.
+        shape (tuple): number of rows and columns of the raster.
+        config (config): parsed configuration settings of run.
+        polygon_cells (dict, optional): cache with the cells per set of polygons and raster grid. If None, the cells are not cached. Defaults to None.
+
+    Returns:
+        array: flat indices of the cells within all polygons.
+        array: index of the polygon per cell.
+    """
+
+    if polygon_cells is None:
+        polygon_cells = {}
+
+    key = (hash(tuple(extent_gdf.geometry.to_wkb())), (affine.a, affine.b, affine.c, affine.d, affine.e, affine.f), tuple(shape))
+
+    if key not in polygon_cells:
+
+        if config.getboolean('general', 'verbose'): print('DEBUG: computing raster cells per polygon for raster of shape {}'.format(shape))
+
+        geometries = list(extent_gdf.geometry)
+        n_workers, _ = compute.schedule(config, len(geometries))
+        cells = Parallel(n_jobs=n_workers)(delayed(cells_in_polygon)(geometry, affine, shape) for geometry in geometries)
+
+        polygon_cells[key] = (np.concatenate(cells), np.repeat(np.arange(len(cells)), [len(c) for c in cells]))
+
+    return polygon_cells[key]
+
+def zonal_stats_per_polygon(extent_gdf, nc_arr_vals, affine, config, stat_func='mean', polygon_cells=None):
+    """Computes a statistical value of a raster for each polygon in extent_gdf.
+    The mean is computed from the raster cells per polygon, which are re-used for all rasters with the same grid.
+    Other statistical values are computed with rasterstats, whereby the polygons are split into chunks which are processed by as many workers as the core budget in the cfg-file allows.
+
+    Args:
+        extent_gdf (geodataframe): geo-dataframe containing one or more polygons with geometry information for which values are extracted.
+        nc_arr_vals (array): raster values for one time step.
+        affine (Affine): affine transformation of the raster.
+        config (config): parsed configuration settings of run.
+        stat_func (str, optional): Statistical function to be applied, choose from available options in rasterstats package. Defaults to 'mean'.
+        polygon_cells (dict, optional): cache with the cells per set of polygons and raster grid, see 'variables.get_polygon_cells()'. Defaults to None.
+
+    Returns:
+        list: list containing statistical value per polygon, i.e. with same length as extent_gdf
+    """
+
+    if stat_func == 'mean':
+
+        cells, polygon = get_polygon_cells(extent_gdf, affine, nc_arr_vals.shape, config, polygon_cells=polygon_cells)
+
+        ##- as in rasterstats, cells without data are ignored, and polygons without any valid cell get None
+        vals = nc_arr_vals.ravel()[cells]
+        valid = ~np.isnan(vals)
+        n_cells = np.bincount(polygon[valid], minlength=len(extent_gdf))
+        sum_cells = np.bincount(polygon[valid], weights=vals[valid], minlength=len(extent_gdf))
+
+        list_out = []
+        for n, total in zip(n_cells, sum_cells):
+            if n == 0:
+                if config.getboolean('general', 'verbose'): print('WARNING: NaN computed!')
+                list_out.append(None)
+            else:
+                list_out.append(float(total / n))
+
+        return list_out
+
+    n_workers, _ = compute.schedule(config, len(extent_gdf))
+
+    geometries = list(extent_gdf.geometry)
+
+    if n_workers == 1:
+        zonal_stats = rstats.zonal_stats(geometries, nc_arr_vals, affine=affine, stats=stat_func)
+    else:
+        chunks = np.array_split(np.arange(len(geometries)), n_workers)
+        results = Parallel(n_jobs=n_workers)(delayed(rstats.zonal_stats)([geometries[i] for i in chunk], nc_arr_vals, affine=affine, stats=stat_func) for chunk in chunks)
+        zonal_stats = [stats for result in results for stats in result]
+
+    list_out = []
+    for stats in zonal_stats:
+        if (stats[stat_func] == None) and (config.getboolean('general', 'verbose')): 
+            print('WARNING: NaN computed!')
+        list_out.append(stats[stat_func])
+
+    return list_out
+
+def nc_with_float_timestamp(extent_gdf, config, root_dir, var_name, sim_year, stat_func='mean', polygon_cells=None):
     """This function extracts a statistical value from a netCDF-file (specified in the config-file) for each polygon specified in extent_gdf for a given year.
     By default, the mean value of all cells within a polygon is computed.
     The resulting list does not contain additional meta-information about the files or polygons and is mostly intended for data-driven approaches such as machine learning.
@@ -30,6 +155,7 @@ def nc_with_float_timestamp(extent_gdf, config, root_dir, var_name, sim_year, st
         var_name (str): name of variable in nc-file, must also be the same under which path to nc-file is specified in cfg-file.
         sim_year (int): year for which data is extracted.
         stat_func (str, optional): Statistical function to be applied, choose from available options in rasterstats package. Defaults to 'mean'.
+        polygon_cells (dict, optional): cache with the cells per set of polygons and raster grid, see 'variables.get_polygon_cells()'. Defaults to None.
 
     Raises:
         ValueError: raised if the extracted variable at a time step does not contain data
@@ -59,21 +185,14 @@ def nc_with_float_timestamp(extent_gdf, config, root_dir, var_name, sim_year, st
     if nc_arr_vals.size == 0:
         raise ValueError('the data was found for this year in the nc-file {}, check if all is correct'.format(nc_fo))
 
-    # initialize output list
-    list_out = []
-    # loop through all polygons in geo-dataframe and compute statistics, then append to output file
-    for i in range(len(extent_gdf)):
-        prov = extent_gdf.iloc[i]
-        zonal_stats = rstats.zonal_stats(prov.geometry, nc_arr_vals, affine=affine, stats=stat_func)
-        if (zonal_stats[0][stat_func] == None) and (config.getboolean('general', 'verbose')): 
-            print('WARNING: NaN computed!')
-        list_out.append(zonal_stats[0][stat_func])
+    # compute statistics for all polygons in geo-dataframe
+    list_out = zonal_stats_per_polygon(extent_gdf, nc_arr_vals, affine, config, stat_func=stat_func, polygon_cells=polygon_cells)
 
     if config.getboolean('general', 'verbose'): print('DEBUG: ... done.')
 
     return list_out
 
-def nc_with_continous_datetime_timestamp(extent_gdf, config, root_dir, var_name, sim_year, stat_func='mean'):
+def nc_with_continous_datetime_timestamp(extent_gdf, config, root_dir, var_name, sim_year, stat_func='mean', polygon_cells=None):
     """This function extracts a statistical value from a netCDF-file (specified in the config-file) for each polygon specified in extent_gdf for a given year.
     By default, the mean value of all cells within a polygon is computed.
     The resulting list does not contain additional meta-information about the files or polygons and is mostly intended for data-driven approaches such as machine learning.
@@ -91,6 +210,7 @@ def nc_with_continous_datetime_timestamp(extent_gdf, config, root_dir, var_name,
         var_name (str): name of variable in nc-file, must also be the same under which path to nc-file is specified in cfg-file.
         sim_year (int): year for which data is extracted.
         stat_func (str, optional): Statistical function to be applied, choose from available options in rasterstats package. Defaults to 'mean'.
+        polygon_cells (dict, optional): cache with the cells per set of polygons and raster grid, see 'variables.get_polygon_cells()'. Defaults to None.
 
     Raises:
         ValueError: raised if specfied year cannot be found in years in nc-file
@@ -127,15 +247,8 @@ def nc_with_continous_datetime_timestamp(extent_gdf, config, root_dir, var_name,
     # open nc-file with rasterio to get affine information
     affine = rio.open(nc_fo).transform
 
-    # initialize output list
-    list_out = []
-    # loop through all polygons in geo-dataframe and compute statistics, then append to output file
-    for i in range(len(extent_gdf)):
-        prov = extent_gdf.iloc[i]
-        zonal_stats = rstats.zonal_stats(prov.geometry, nc_arr_vals, affine=affine, stats=stat_func)
-        if (zonal_stats[0][stat_func] == None) and (config.getboolean('general', 'verbose')): 
-            print('WARNING: NaN computed!')
-        list_out.append(zonal_stats[0][stat_func])
+    # compute statistics for all polygons in geo-dataframe
+    list_out = zonal_stats_per_polygon(extent_gdf, nc_arr_vals, affine, config, stat_func=stat_func, polygon_cells=polygon_cells)
 
     if config.getboolean('general', 'verbose'): print('DEBUG: ... done.')
 
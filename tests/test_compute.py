@@ -0,0 +1,72 @@
+import pytest
+import configparser
+import numpy as np
+from sklearn import ensemble
+from copro import compute
+
+def create_fake_config(n_cores):
+
+    config = configparser.ConfigParser()
+
+    config.add_section('general')
+    config.set('general', 'verbose', str(False))
+    config.add_section('compute')
+    config.set('compute', 'n_cores', str(n_cores))
+
+    return config
+
+def test_schedule():
+
+    config = create_fake_config(8)
+
+    n_workers, n_threads = compute.schedule(config, 3)
+
+    assert n_workers == 3
+    assert n_workers * n_threads <= 8
+
+def test_schedule_more_tasks_than_cores():
+
+    config = create_fake_config(4)
+
+    n_workers, n_threads = compute.schedule(config, 10)
+
+    assert (n_workers, n_threads) == (4, 1)
+
+def test_set_n_jobs():
+
+    clf = ensemble.RandomForestClassifier()
+
+    clf = compute.set_n_jobs(clf, 2)
+
+    assert clf.n_jobs == 2
+
+def test_get_dtype():
+
+    config = create_fake_config(1)
+
+    assert compute.get_dtype(config) == np.float64
+
+    config.set('compute', 'dtype', 'float32')
+
+    assert compute.get_dtype(config) == np.float32
+
+    config.set('compute', 'dtype', 'int8')
+
+    with pytest.raises(ValueError):
+        compute.get_dtype(config)
+
+def test_shared_arrays(tmp_path):
+
+    config = create_fake_config(2)
+    config.set('compute', 'temp_dir', str(tmp_path))
+
+    X_ft = np.random.rand(10, 2)
+    X_meta = np.array([['A', None]] * 10, dtype=object)
+
+    with compute.shared_arrays(config, [X_ft, X_meta], 2) as (X_ft_shared, X_meta_shared):
+
+        assert isinstance(X_ft_shared, np.memmap)
+        np.testing.assert_array_equal(X_ft_shared, X_ft)
+        assert X_meta_shared is X_meta
+
+    assert len(list(tmp_path.iterdir())) == 0
@@ -29,3 +29,33 @@ def test_split_XY_data():
     XY_false = np.where(np.equal(XY_in, XY_out) == False)[0]
 
     assert XY_false.size == 0
+
+def test_split_XY_data_years():
+
+    config = create_fake_config()
+    config.add_section('settings')
+    config.set('settings', 'y_start', str(2000))
+    config.set('settings', 'y_end', str(2001))
+
+    X_arr = [[1, 2], [3, np.nan], [1, 2], [5, 6]]
+    y_arr = [1, 0, 0, 1]
+
+    XY_in = np.column_stack((X_arr, y_arr))
+
+    X, Y, years = data.split_XY_data(XY_in, config, return_years=True)
+
+    assert list(years) == [2000, 2001, 2001]
+
+def test_save_load_X_year(tmp_path):
+
+    fo = str(tmp_path / 'X_per_year.npz')
+
+    for sim_year in [2000, 2001]:
+        X = np.array([['A', None, sim_year], ['B', None, sim_year + 0.5]], dtype=object)
+        data.save_X_year(X, fo, sim_year)
+
+    X = data.load_X_year(fo, 2001)
+
+    assert X[1, 2] == 2001.5
+    with pytest.raises(ValueError):
+        data.load_X_year(fo, 2002)
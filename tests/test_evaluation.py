@@ -0,0 +1,98 @@
+import pytest
+import configparser
+import pandas as pd
+import numpy as np
+from sklearn.neighbors import KNeighborsClassifier
+from copro import evaluation
+
+def create_fake_config():
+
+    config = configparser.ConfigParser()
+
+    config.add_section('general')
+    config.set('general', 'verbose', str(False))
+
+    return config
+
+def test_fill_proj_count():
+
+    count_df = evaluation.init_proj_count()
+
+    for y_pred in [[1, 0], [1, 1]]:
+        y_df = pd.DataFrame({'ID': ['A', 'B'], 'y_pred': y_pred, 'y_prob': [0.8, 0.4]})
+        count_df = evaluation.fill_proj_count(count_df, y_df)
+
+    global_df = pd.DataFrame({'ID': ['A', 'B'], 'geometry': [None, None]})
+    df_hit, gdf_hit = evaluation.polygon_projection(count_df, global_df, out_dir=None)
+
+    assert df_hit.nr_predictions.to_list() == [2, 2]
+    assert df_hit.chance_of_conflict.to_list() == [1.0, 0.5]
+    np.testing.assert_allclose(df_hit.mean_prob, [0.8, 0.4])
+
+def test_get_confidence_intervals():
+
+    results = []
+    for accuracy in [0.7, 0.8, 0.9]:
+        eval_dict = {metric: accuracy for metric in evaluation.init_out_dict().keys()}
+        y_df = pd.DataFrame({'ID': ['A', 'A', 'B'], 'y_pred': [1, 0, 0]})
+        results.append((None, y_df, eval_dict))
+
+    ci_dict = evaluation.get_confidence_intervals(results)
+
+    np.testing.assert_allclose(ci_dict['Accuracy'], 1.96 * 0.1 / np.sqrt(3))
+    assert ci_dict['chance_of_conflict'] > 0
+
+def test_streaming_metrics():
+
+    rng = np.random.default_rng(1)
+    y_test = (rng.random(1000) < 0.2).astype(int)
+    y_prob = np.clip(rng.random(1000) * 0.7 + y_test * 0.3, 0, 1)
+    y_prob = np.column_stack((1 - y_prob, y_prob))
+    y_pred = (y_prob[:, 1] > 0.5).astype(int)
+
+    counts = evaluation.init_streaming_metrics()
+    for start in range(0, 1000, 300):
+        counts = evaluation.update_streaming_metrics(counts, y_test[start:start + 300], y_pred[start:start + 300], y_prob[start:start + 300])
+    eval_dict = evaluation.evaluate_streaming_metrics(counts)
+
+    eval_dict_ref = evaluation.evaluate_prediction(y_test, y_pred, y_prob, None, None, create_fake_config())
+
+    for key in ['Accuracy', 'Precision', 'Recall', 'F1 score', 'Cohen-Kappa score', 'Brier loss score']:
+        assert eval_dict[key] == pytest.approx(eval_dict_ref[key])
+    assert eval_dict['ROC AUC score'] == pytest.approx(eval_dict_ref['ROC AUC score'], abs=1e-3)
+
+def test_get_feature_importance():
+
+    config = create_fake_config()
+    config.add_section('data')
+    for var in ['var1', 'var2']:
+        config.set('data', var, '{}.nc'.format(var))
+
+    rng = np.random.default_rng(0)
+    importances = []
+    for n in range(2):
+        X = rng.random((200, 2))
+        Y = (X[:, 0] > 0.5).astype(int)
+        clf = KNeighborsClassifier().fit(X[:100], Y[:100])
+        importances.append(evaluation.permutation_importance(clf, X[100:], Y[100:], n_repeats=3, random_state=n))
+
+    df = evaluation.get_feature_importance(importances, config, out_dir=None)
+
+    assert importances[0].shape == (2, 3)
+    assert df.index.to_list() == ['var1', 'var2']
+    assert df.loc['var1', 'feature_importance'] > df.loc['var2', 'feature_importance'] + 0.2
+
+def test_significance_test():
+
+    y_test = np.array([1, 1, 1, 0, 0, 0, 0, 0, 0, 0] * 5)
+    y_prob = np.where(y_test == 1, 0.8, 0.2)
+    y_pred = (y_prob > 0.5).astype(int)
+
+    expected = evaluation.expected_random_metrics(y_test, y_pred, y_prob)
+    p_values = evaluation.significance_test(y_test, y_pred, y_prob)
+
+    np.testing.assert_allclose(expected['Accuracy'], 0.3 ** 2 + 0.7 ** 2)
+    np.testing.assert_allclose(expected['Precision'], 0.3)
+    assert expected['ROC AUC score'] == 0.5
+    assert p_values['p-value predictions'] < 0.001
+    assert p_values['p-value ROC AUC'] < 0.001
@@ -0,0 +1,21 @@
+import pytest
+import numpy as np
+from sklearn import datasets, ensemble
+from copro import forest
+
+def test_compiled_forest_predictions():
+
+    X, Y = datasets.make_classification(n_samples=500, n_features=4, weights=[0.9], random_state=42)
+
+    clf = ensemble.RandomForestClassifier(n_estimators=10, class_weight={1: 100}, random_state=42)
+    clf.fit(X[:300], Y[:300])
+
+    compiled_forest = forest.compile_forest(clf)
+
+    np.testing.assert_array_equal(forest.predict_proba(compiled_forest, X[300:]), clf.predict_proba(X[300:]))
+    np.testing.assert_array_equal(forest.predict(compiled_forest, X[300:]), clf.predict(X[300:]))
+
+def test_compile_forest_unsupported():
+
+    with pytest.raises(ValueError):
+        forest.compile_forest(ensemble.RandomForestClassifier())
@@ -0,0 +1,77 @@
+import pytest
+import configparser
+import numpy as np
+import pandas as pd
+import xarray as xr
+import geopandas as gpd
+import rasterio as rio
+from shapely.geometry import Point, box
+from sklearn import preprocessing
+from copro import grid
+
+def create_fake_grid():
+
+    lat, lon = np.array([1.5, 0.5]), np.array([0.5, 1.5, 2.5])
+
+    return {'lat': lat, 'lon': lon, 'lat_dim': 'lat', 'lon_dim': 'lon', 'shape': (2, 3), 'affine': rio.Affine(1, 0, 0, 0, -1, 2)}
+
+def test_conflict_grid():
+
+    conflict_gdf = gpd.GeoDataFrame({'year': [2000, 2000, 2000, 2001]}, 
+                                    geometry=[Point(0.2, 1.8), Point(0.4, 1.6), Point(2.5, 0.5), Point(1.5, 0.5)])
+
+    conflict_arr = grid.conflict_grid(conflict_gdf, create_fake_grid(), 2000)
+
+    np.testing.assert_array_equal(conflict_arr, [[True, False, False], [False, False, True]])
+
+def test_get_grid_cells():
+
+    extent_gdf = gpd.GeoDataFrame({'name': ['A']}, geometry=[box(0.8, 0, 3, 1.2)])
+
+    cells = grid.get_grid_cells(extent_gdf, create_fake_grid())
+
+    np.testing.assert_array_equal(cells, [4, 5])
+
+class FakeClassifier():
+
+    def predict_proba(self, X):
+        return np.column_stack((1 - X[:, 0] / 200, X[:, 0] / 200))
+
+    def predict(self, X):
+        return (X[:, 0] > 100).astype(int)
+
+def test_grid_XY_alignment(tmp_path):
+
+    lat, lon, time = np.array([2.5, 1.5, 0.5]), np.array([0.5, 1.5, 2.5]), pd.date_range('2000-01-01', periods=2, freq='YS')
+    var_a = 100 * np.arange(2)[:, None, None] + 10 * np.arange(3)[None, :, None] + np.arange(3)[None, None, :]
+    var_a = var_a.astype(float)
+    var_a[1, 1, 2] = np.nan
+    for key, values in [('var_a', var_a), ('var_b', -var_a)]:
+        xr.Dataset({key: (('time', 'lat', 'lon'), values)}, coords={'time': time, 'lat': lat, 'lon': lon}).to_netcdf(tmp_path / '{}.nc'.format(key))
+
+    config = configparser.ConfigParser()
+    config.read_dict({'general': {'input_dir': str(tmp_path), 'verbose': 'False'},
+                      'settings': {'y_start': '2000', 'y_end': '2001', 'batch_size': '2'},
+                      'data': {'var_a': 'var_a.nc', 'var_b': 'var_b.nc'}})
+
+    extent_gdf = gpd.GeoDataFrame({'name': ['A', 'B']}, geometry=[box(0, 2, 1, 3), box(0.8, 0, 3, 2.2)])
+    conflict_gdf = gpd.GeoDataFrame({'year': [2000, 2001]}, geometry=[Point(1.5, 1.5), Point(2.5, 0.5)])
+
+    XY = grid.fill_XY_grid(config, '', conflict_gdf, extent_gdf, str(tmp_path / 'XY_data.npy'))
+
+    cells = np.array([0, 4, 5, 7, 8])
+    conflict = np.zeros((2, 9))
+    conflict[0, 4], conflict[1, 8] = 1, 1
+    XY_expected = np.vstack([np.column_stack((var_a[t].ravel()[cells], -var_a[t].ravel()[cells], conflict[t, cells])) for t in range(2)])
+    np.testing.assert_array_equal(XY, XY_expected)
+
+    scaler = preprocessing.FunctionTransformer().fit(XY_expected[:, :-1])
+    ds_XY = grid.predict_grid(config, '', extent_gdf, scaler, FakeClassifier(), str(tmp_path), negative_fraction=1, XY=XY)
+    ds_nc = grid.predict_grid(config, '', extent_gdf, scaler, FakeClassifier(), str(tmp_path), negative_fraction=1, conflict_gdf=conflict_gdf)
+
+    y_prob = np.full((2, 9), np.nan)
+    y_prob[:, cells] = var_a.reshape(2, 9)[:, cells] / 200
+    np.testing.assert_allclose(ds_XY.y_prob.values.reshape(2, 9), y_prob, rtol=1e-6)
+    np.testing.assert_array_equal(ds_XY.conflict.values.reshape(2, 9)[:, cells], conflict[:, cells])
+    for key in ['y_pred', 'y_prob', 'conflict']:
+        np.testing.assert_array_equal(ds_XY[key].values, ds_nc[key].values)
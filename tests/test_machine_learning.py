@@ -4,7 +4,7 @@ import numpy as np
 import pandas as pd
 import geopandas as gpd
 from sklearn import preprocessing, model_selection
-from copro import conflict, machine_learning
+from copro import conflict, machine_learning, data
 
 def create_fake_config():
 
@@ -30,4 +30,212 @@ def test_split_scale_train_test_split():
 
     X_train, X_test, y_train, y_test, X_train_geom, X_test_geom, X_train_ID, X_test_ID = machine_learning.split_scale_train_test_split(X, Y, config, scaler)
 
-    assert (len(X_train) + len(X_test)) == len(X)
\ No newline at end of file
+    assert (len(X_train) + len(X_test)) == len(X)
+
+
+def test_split_scale_train_test_split_random_state():
+
+    X1 = np.arange(10)
+    X2 = np.arange(10)
+    X3 = np.random.rand(10, 2)
+
+    X = np.column_stack((X1, X2, X3))
+    Y = [1, 0, 0, 1, 0, 0, 1, 0, 0, 1]
+    config = create_fake_config()
+
+    out_1 = machine_learning.split_scale_train_test_split(X, Y, config, preprocessing.MinMaxScaler(), random_state=1)
+    out_2 = machine_learning.split_scale_train_test_split(X, Y, config, preprocessing.MinMaxScaler(), random_state=1)
+
+    assert np.array_equal(out_1[-1], out_2[-1])
+
+def test_split_scale_train_test_split_prescaled():
+
+    X1 = np.arange(10)
+    X2 = np.arange(10)
+    X3 = np.random.rand(10, 2)
+
+    X = np.column_stack((X1, X2, X3))
+    Y = [1, 0, 0, 1, 0, 0, 1, 0, 0, 1]
+    config = create_fake_config()
+    scaler = preprocessing.MinMaxScaler()
+
+    X_ft = machine_learning.scale_X(X, config, scaler)
+
+    X_train, X_test, y_train, y_test, X_train_geom, X_test_geom, X_train_ID, X_test_ID = machine_learning.split_scale_train_test_split(X, Y, config, None, X_ft=X_ft)
+
+    assert np.allclose(X_ft[X_test_ID.astype(int)], X_test)
+
+def test_model_bundle(tmp_path):
+
+    config = create_fake_config()
+    config.add_section('data')
+    config.set('data', 'var1', 'file1.nc')
+    config.set('data', 'var2', 'file2.nc')
+    config.add_section('pre_calc')
+    config.set('pre_calc', 'clf', 'clf.joblib')
+    config.set('machine_learning', 'scaler', 'MinMaxScaler')
+
+    X_data = np.random.rand(10, 2)
+    scaler = preprocessing.MinMaxScaler().fit(X_data)
+
+    machine_learning.dump_model_bundle(scaler, None, config, str(tmp_path))
+    bundle = machine_learning.load_model_bundle(config, str(tmp_path))
+
+    assert bundle['features'] == ['var1', 'var2']
+    assert np.allclose(bundle['scaler'].transform(X_data), scaler.transform(X_data))
+
+def test_fit_clf_missing_values():
+
+    config = create_fake_config()
+    config.set('machine_learning', 'model', 'HistGradientBoostingClassifier')
+
+    X = np.random.rand(50, 2)
+    X[::5, 0] = np.nan
+    Y = np.zeros(50, dtype=int)
+    Y[::4] = 1
+
+    clf = machine_learning.define_model(config)
+    clf = machine_learning.fit_clf(clf, X, Y)
+
+    assert machine_learning.supports_missing_values(config)
+    assert clf.predict_proba(X).shape == (50, 2)
+
+def test_define_model_nystroem_svc():
+
+    config = create_fake_config()
+    config.set('machine_learning', 'model', 'NystroemSVC')
+
+    X = np.random.rand(60, 2)
+    Y = np.zeros(60, dtype=int)
+    Y[::4] = 1
+
+    clf = machine_learning.define_model(config)
+    clf = machine_learning.fit_clf(clf, X, Y)
+
+    y_prob = clf.predict_proba(X)
+
+    assert y_prob.shape == (60, 2)
+    assert np.allclose(y_prob.sum(axis=1), 1)
+
+def test_define_model_parameters():
+
+    config = create_fake_config()
+    config.set('machine_learning', 'model', 'RFClassifier')
+    config.add_section('model_parameters')
+    config.set('model_parameters', 'n_estimators', '10')
+    config.set('model_parameters', 'max_depth', 'None')
+    config.set('model_parameters', 'max_features', 'sqrt')
+
+    clf = machine_learning.define_model(config)
+
+    assert clf.n_estimators == 10
+    assert clf.max_depth is None
+    assert clf.max_features == 'sqrt'
+
+def test_undersample():
+
+    config = create_fake_config()
+    config.set('machine_learning', 'negative_fraction', str(0.2))
+
+    X = np.arange(2000).reshape(1000, 2)
+    Y = np.zeros(1000, dtype=int)
+    Y[:50] = 1
+
+    X_1, Y_1 = machine_learning.undersample(X, Y, config, random_state=1)
+    X_2, Y_2 = machine_learning.undersample(X, Y, config, random_state=1)
+
+    assert np.sum(Y_1 == 1) == 50
+    assert np.sum(Y_1 == 0) < 300
+    assert len(X_1) == len(Y_1)
+    np.testing.assert_array_equal(X_1, X_2)
+
+def test_correct_probabilities():
+
+    config = create_fake_config()
+    config.set('machine_learning', 'negative_fraction', str(0.5))
+
+    y_prob = np.array([[0.5, 0.5], [1., 0.]])
+    y_prob_corr = machine_learning.correct_probabilities(y_prob, config)
+
+    np.testing.assert_allclose(y_prob_corr[:, 1], [1/3, 0.])
+    np.testing.assert_allclose(y_prob_corr.sum(axis=1), 1.)
+
+def test_ensemble(tmp_path):
+
+    config = create_fake_config()
+    config.add_section('data')
+    config.set('data', 'var1', 'file1.nc')
+    config.add_section('pre_calc')
+    config.set('pre_calc', 'ensemble', 'ensemble.joblib')
+
+    X = np.random.rand(50, 1)
+    Y = (X[:, 0] > 0.5).astype(int)
+    config.set('machine_learning', 'model', 'KNeighborsClassifier')
+    clfs = [machine_learning.define_model(config).fit(X, Y) for i in range(3)]
+
+    machine_learning.dump_ensemble(clfs, config, str(tmp_path))
+    ensemble = machine_learning.load_ensemble(config, str(tmp_path))
+    y_prob = machine_learning.predict_proba_ensemble(ensemble, X)
+
+    assert y_prob.shape == (3, 50)
+    np.testing.assert_allclose(y_prob[0], clfs[0].predict_proba(X)[:, 1])
+
+def test_correct_prediction():
+
+    config = create_fake_config()
+    config.set('machine_learning', 'negative_fraction', str(0.5))
+
+    y_pred = np.array([1, 1, 0])
+    y_prob = np.array([[0.4, 0.6], [0.2, 0.8], [1., 0.]])
+    y_pred_corr, y_prob_corr = machine_learning.correct_prediction(y_pred, y_prob, config)
+
+    np.testing.assert_array_equal(y_pred_corr, (y_prob_corr[:, 1] > 0.5).astype(int))
+    np.testing.assert_array_equal(y_pred_corr, [0, 1, 0])
+
+def test_define_model_compile_forest():
+
+    config = create_fake_config()
+    config.set('machine_learning', 'model', 'KNeighborsClassifier')
+    config.add_section('compute')
+    config.set('compute', 'compile_forest', str(True))
+
+    with pytest.raises(ValueError):
+        machine_learning.define_model(config)
+
+def create_fake_XY_memmap(fo):
+
+    rng = np.random.default_rng(1)
+    XY = np.lib.format.open_memmap(fo, mode='w+', dtype=np.float64, shape=(200, 3))
+    XY[:, :2] = rng.random((200, 2))
+    XY[:, 2] = (XY[:, 0] > 0.7).astype(int)
+    XY[[3, 60, 61, 199], 1] = np.nan
+    XY.flush()
+
+    return XY
+
+def test_out_of_core(tmp_path):
+
+    config = create_fake_config()
+    config.add_section('settings')
+    config.set('settings', 'batch_size', str(50))
+    config.set('settings', 'n_epochs', str(2))
+
+    XY = create_fake_XY_memmap(str(tmp_path / 'XY_data.npy'))
+
+    ##- the split of each batch must not depend on the order in which the batches are read in an epoch
+    splits = [{start: machine_learning.split_batch(start, batch, config, 1) for start, batch in data.iter_XY_batches(XY, 50, random_state=epoch)} for epoch in range(2)]
+    for start, (batch_train, batch_test) in splits[0].items():
+        np.testing.assert_array_equal(batch_train, splits[1][start][0])
+        np.testing.assert_array_equal(batch_test, splits[1][start][1])
+        assert not np.isnan(batch_train).any() and not np.isnan(batch_test).any()
+    assert sum(len(batch_train) + len(batch_test) for batch_train, batch_test in splits[0].values()) == 196
+
+    with pytest.raises(ValueError):
+        machine_learning.partial_fit_scaler(XY, config, preprocessing.QuantileTransformer())
+
+    scaler = machine_learning.partial_fit_scaler(XY, config, preprocessing.StandardScaler())
+    np.testing.assert_allclose(scaler.mean_, np.nanmean(XY[~np.isnan(XY).any(axis=1), :2], axis=0))
+
+    config.set('machine_learning', 'model', 'SGDClassifier')
+    clf = machine_learning.partial_fit_clf(XY, config, scaler, machine_learning.define_model(config), run_seed=1)
+    assert np.isfinite(clf.coef_).all()
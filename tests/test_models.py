@@ -0,0 +1,94 @@
+import pytest
+import configparser
+import numpy as np
+from sklearn import neighbors, preprocessing, dummy, ensemble
+from shapely.geometry import Point
+from copro import models, evaluation, pipeline
+
+def create_fake_config():
+
+    config = configparser.ConfigParser()
+
+    config.add_section('general')
+    config.set('general', 'verbose', str(False))
+    config.add_section('machine_learning')
+    config.set('machine_learning', 'train_fraction', str(0.7))
+
+    return config
+
+def test_variable_subset():
+
+    config = create_fake_config()
+
+    X_ft = np.random.rand(100, 3)
+    Y = (X_ft[:, 0] > 0.7).astype(int)
+    clf = neighbors.KNeighborsClassifier()
+
+    eval_dict_all = models.variable_subset(X_ft, Y, config, clf, [0, 1, 2], run_seed=1)
+    eval_dict_single = models.variable_subset(X_ft, Y, config, clf, [0], run_seed=1)
+    eval_dict_copy = models.variable_subset(X_ft[:, [0]], Y, config, clf, [0], run_seed=1)
+
+    assert list(eval_dict_all.keys()) == list(evaluation.init_out_dict().keys())
+    assert eval_dict_single == eval_dict_copy
+
+def test_predictive_ensemble():
+
+    config = create_fake_config()
+
+    rng = np.random.default_rng(1)
+    X_data = rng.random((50, 2))
+    Y = (X_data[:, 0] > 0.5).astype(int)
+    X = np.column_stack((np.arange(50), np.full(50, Point(0, 0)), X_data)).astype(object)
+
+    ##- the single classifier never predicts conflict, hence the predictions must follow from the ensemble instead
+    ensemble = [neighbors.KNeighborsClassifier(n_neighbors=n).fit(X_data, Y) for n in [3, 5, 7]]
+    bundle = {'scaler': preprocessing.FunctionTransformer().fit(X_data), 'clf': dummy.DummyClassifier(strategy='constant', constant=0).fit(X_data, Y),
+              'forest': None, 'ensemble': ensemble, 'negative_fraction': 1.}
+
+    y_df = models.predictive(X, config, '', bundle=bundle)
+
+    assert y_df.y_pred.sum() > 0
+    np.testing.assert_array_equal(y_df.y_pred.to_numpy(dtype=int), (y_df.y_prob.to_numpy() > 0.5).astype(int))
+
+def create_fake_XY(n=60):
+
+    rng = np.random.default_rng(1)
+    X_data = rng.random((n, 2))
+    Y = (X_data[:, 0] > 0.6).astype(int)
+    X = np.column_stack((np.arange(n), np.full(n, Point(0, 0)), X_data)).astype(object)
+
+    return X, Y
+
+def test_k_fold_coverage():
+
+    config = create_fake_config()
+    config.add_section('settings')
+    config.set('settings', 'seed', str(1))
+    config.set('settings', 'n_runs', str(2))
+    config.set('settings', 'evaluation', 'kfold')
+    config.set('settings', 'n_folds', str(3))
+    config.set('settings', 'n_permutations', str(0))
+
+    X, Y = create_fake_XY()
+    scaler = preprocessing.StandardScaler()
+
+    results = pipeline.run_reference_n_times(X, Y, config, scaler, neighbors.KNeighborsClassifier(), None)
+
+    assert len(results) == 2
+    for X_df, y_df, eval_dict in results:
+        assert sorted(y_df.ID.astype(int).to_list()) == list(range(len(X)))
+
+def test_out_of_bag():
+
+    config = create_fake_config()
+
+    X, Y = create_fake_XY()
+    scaler = preprocessing.StandardScaler()
+
+    with pytest.raises(ValueError):
+        models.out_of_bag(X, Y, config, scaler, neighbors.KNeighborsClassifier(), None)
+
+    X_df, y_df, eval_dict = models.out_of_bag(X, Y, config, scaler, ensemble.RandomForestClassifier(n_estimators=50, random_state=1), None)
+
+    assert len(y_df) == len(X)
+    assert sorted(y_df.ID.astype(int).to_list()) == list(range(len(X)))
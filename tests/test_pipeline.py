@@ -0,0 +1,57 @@
+import pytest
+import configparser
+import numpy as np
+from sklearn import preprocessing
+from copro import pipeline, machine_learning
+
+def create_fake_config():
+
+    config = configparser.ConfigParser()
+
+    config.add_section('general')
+    config.set('general', 'verbose', str(False))
+    config.set('general', 'model', str(1))
+    config.add_section('settings')
+    config.add_section('machine_learning')
+
+    return config
+
+def test_check_out_of_core():
+
+    config = create_fake_config()
+    pipeline.check_out_of_core(config)
+
+    with pytest.raises(ValueError):
+        pipeline.check_out_of_core(config, tune=True)
+
+    for section, option, value in [('general', 'model', '4'), ('settings', 'evaluation', 'kfold'), 
+                                   ('machine_learning', 'ensemble', 'True'), ('settings', 'sensitivity_analysis', 'sobol')]:
+        config = create_fake_config()
+        config.set(section, option, value)
+        with pytest.raises(ValueError):
+            pipeline.check_out_of_core(config)
+
+def test_run_reference_out_of_core(tmp_path):
+
+    config = create_fake_config()
+    config.set('settings', 'seed', str(1))
+    config.set('settings', 'n_runs', str(2))
+    config.set('settings', 'batch_size', str(50))
+    config.set('settings', 'n_epochs', str(2))
+    config.set('machine_learning', 'train_fraction', str(0.7))
+    config.set('machine_learning', 'model', 'SGDClassifier')
+    config.add_section('data')
+    config.set('data', 'var1', 'var1.nc')
+    config.set('data', 'var2', 'var2.nc')
+
+    rng = np.random.default_rng(1)
+    XY = np.lib.format.open_memmap(str(tmp_path / 'XY_data.npy'), mode='w+', dtype=np.float64, shape=(200, 3))
+    XY[:, :2] = rng.random((200, 2))
+    XY[:, 2] = (XY[:, 0] > 0.7).astype(int)
+    XY[[3, 60], 1] = np.nan
+
+    out_dict, clf = pipeline.run_reference_out_of_core(config, str(tmp_path), '', None, None, preprocessing.StandardScaler(), 
+                                                       machine_learning.define_model(config), XY=XY)
+
+    assert all(len(value) == 2 for value in out_dict.values())
+    assert (tmp_path / 'clf.joblib').is_file()
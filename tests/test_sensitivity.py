@@ -0,0 +1,29 @@
+import pytest
+import numpy as np
+from copro import sensitivity
+
+def test_sobol_indices():
+
+    n_samples, n_vars = 5000, 3
+
+    U = sensitivity.sobol_sample(n_samples, n_vars, random_state=1)
+    y = U[:, 0] + 0.1 * U[:, 1]
+
+    df = sensitivity.sobol_indices(y, n_samples, n_vars)
+
+    assert U.shape == (n_samples * (n_vars + 2), n_vars)
+    np.testing.assert_allclose(df.S1, [1 / 1.01, 0.01 / 1.01, 0], atol=0.05)
+    np.testing.assert_allclose(df.ST, df.S1, atol=0.05)
+
+def test_morris_indices():
+
+    n_trajectories, n_vars = 50, 3
+
+    U, order, steps = sensitivity.morris_sample(n_trajectories, n_vars, random_state=1)
+    y = 2 * U[:, 0] - U[:, 2]
+
+    df = sensitivity.morris_indices(y, order, steps)
+
+    assert U.min() >= 0 and U.max() <= 1
+    np.testing.assert_allclose(df.mu, [2, 0, -1])
+    np.testing.assert_allclose(df.mu_star, [2, 0, 1])
@@ -1,4 +1,5 @@
 import pytest
+import configparser
 import numpy as np
 import pandas as pd
 from copro import utils
@@ -11,6 +12,17 @@ def test_create_artificial_Y():
 
     assert len(np.where(Y_r != 0)[0]) == len(np.where(Y != 0)[0])
 
+def test_create_artificial_Y_replicates():
+
+    Y = np.array([1, 0, 0, 0, 0, 1, 0, 0])
+
+    Y_r = utils.create_artificial_Y(Y, random_state=1, n_replicates=20)
+
+    assert Y_r.shape == (20, 8)
+    assert np.all(Y_r.sum(axis=1) == 2)
+    assert Y_r.dtype == np.int8
+    assert len(np.unique(Y_r, axis=0)) > 1
+
 def test_get_conflict_datapoints_only():
 
     X_arr = [[1, 2], [3, 4], [1, 2], [5, 6]]
@@ -23,4 +35,19 @@ def test_get_conflict_datapoints_only():
 
     test_arr = np.where(y_out.y_test.values == 0)[0]
 
-    assert test_arr.size == 0
\ No newline at end of file
+    assert test_arr.size == 0
+
+
+def test_get_run_seeds():
+
+    config = configparser.ConfigParser()
+    config.add_section('general')
+    config.set('general', 'verbose', str(False))
+    config.add_section('settings')
+    config.set('settings', 'n_runs', str(5))
+    config.set('settings', 'seed', str(42))
+
+    seeds = utils.get_run_seeds(config)
+
+    assert len(set(seeds)) == 5
+    assert seeds == utils.get_run_seeds(config)
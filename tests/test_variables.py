@@ -0,0 +1,47 @@
+import pytest
+import configparser
+import numpy as np
+import geopandas as gpd
+import rasterio as rio
+from shapely.geometry import box
+from copro import variables
+
+def create_fake_config():
+
+    config = configparser.ConfigParser()
+
+    config.add_section('general')
+    config.set('general', 'verbose', str(False))
+
+    return config
+
+def test_zonal_stats_per_polygon():
+
+    config = create_fake_config()
+
+    affine = rio.Affine(1, 0, 0, 0, -1, 4)
+    arr = np.arange(16, dtype=float).reshape(4, 4)
+    arr[0, 0] = np.nan
+
+    ##- first polygon covers the upper left 2x2 cells, second one lies outside the raster
+    extent_gdf = gpd.GeoDataFrame(geometry=[box(0, 2, 2, 4), box(10, 10, 11, 11)])
+
+    list_out = variables.zonal_stats_per_polygon(extent_gdf, arr, affine, config)
+
+    assert list_out[0] == np.mean([1, 4, 5])
+    assert list_out[1] is None
+
+def test_get_polygon_cells_cache():
+
+    config = create_fake_config()
+
+    affine = rio.Affine(1, 0, 0, 0, -1, 4)
+    extent_gdf = gpd.GeoDataFrame(geometry=[box(0, 2, 2, 4), box(2, 0, 4, 1)])
+
+    polygon_cells = {}
+    cells, polygon = variables.get_polygon_cells(extent_gdf, affine, (4, 4), config, polygon_cells=polygon_cells)
+    variables.get_polygon_cells(extent_gdf, affine, (4, 4), config, polygon_cells=polygon_cells)
+
+    assert len(polygon_cells) == 1
+    np.testing.assert_array_equal(cells, [0, 1, 4, 5, 14, 15])
+    np.testing.assert_array_equal(polygon, [0, 0, 0, 0, 1, 1])